@@ -0,0 +1,91 @@
+"""
+Vectorised EMI and amortization calculations over NumPy arrays.
+
+calculate_emis() returns exactly what api.utils.calculate_emi returns for each
+element, so it can replace scalar loops in batch quoting, portfolio jobs and
+ingestion validation.
+"""
+from typing import NamedTuple
+
+import numpy as np
+
+from .utils import calculate_emi
+
+# Scaled values closer than this to a .5 rounding boundary are re-rounded with
+# the scalar function, whose round() is exact in decimal; elsewhere np.round agrees.
+_TIE_TOLERANCE = 1e-6
+
+
+def calculate_emis(principal, annual_rate, tenure):
+    """
+    Vectorised calculate_emi. Arguments are array-likes (or scalars) that
+    broadcast together; returns a float64 array of monthly instalments, or a
+    float if every argument is a scalar:
+    EMI = [P * r * (1 + r)^n] / [(1 + r)^n - 1], rounded to 2 decimals,
+    or P / n unrounded when the rate is zero. Like calculate_emi, raises
+    ZeroDivisionError for a zero tenure.
+    """
+    scalar = all(np.ndim(value) == 0 for value in (principal, annual_rate, tenure))
+    principal, annual_rate, tenure = np.broadcast_arrays(
+        np.atleast_1d(np.asarray(principal, dtype=np.float64)),
+        np.atleast_1d(np.asarray(annual_rate, dtype=np.float64)),
+        np.atleast_1d(np.asarray(tenure, dtype=np.float64)),
+    )
+    if (tenure == 0).any():
+        raise ZeroDivisionError('tenure must not be zero')
+    r = annual_rate / (12 * 100)
+    zero_rate = r == 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth = (1 + r) ** tenure
+        emi = principal * r * growth / (growth - 1)
+        scaled = emi * 100
+        emis = np.round(emi, 2)
+        near_tie = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < _TIE_TOLERANCE
+        emis = np.where(zero_rate, principal / tenure, emis)
+    for index in map(tuple, np.argwhere(near_tie & ~zero_rate)):
+        emis[index] = calculate_emi(float(principal[index]), float(annual_rate[index]), float(tenure[index]))
+    return float(emis[0]) if scalar else emis
+
+
+class AmortizationSchedule(NamedTuple):
+    """Month-by-month schedule; each array is shaped (loans, months)."""
+    payment: np.ndarray
+    interest: np.ndarray
+    principal: np.ndarray
+    balance: np.ndarray
+
+
+def amortization_schedule(principal, annual_rate, tenure):
+    """
+    Build amortization schedules for many loans at once. Column k is month
+    k + 1; months past a loan's tenure are zero. Each month's interest is the
+    opening balance times the monthly rate, the rest of the EMI repays
+    principal, and the final instalment is adjusted to clear the balance left
+    by EMI rounding.
+    """
+    principal = np.atleast_1d(np.asarray(principal, dtype=np.float64))
+    annual_rate = np.atleast_1d(np.asarray(annual_rate, dtype=np.float64))
+    tenure = np.atleast_1d(np.asarray(tenure, dtype=np.int64))
+    principal, annual_rate, tenure = np.broadcast_arrays(principal, annual_rate, tenure)
+    emis = calculate_emis(principal, annual_rate, tenure)
+    r = annual_rate / (12 * 100)
+
+    months = int(tenure.max()) if tenure.size else 0
+    shape = (principal.shape[0], months)
+    payment = np.zeros(shape)
+    interest = np.zeros(shape)
+    repaid = np.zeros(shape)
+    balance = np.zeros(shape)
+    opening = principal.copy()
+    # Iterate over months, vectorised across loans
+    for month in range(months):
+        active = month < tenure
+        last = month == tenure - 1
+        month_interest = np.where(active, opening * r, 0.0)
+        month_principal = np.where(last, opening, np.where(active, emis - month_interest, 0.0))
+        interest[:, month] = month_interest
+        repaid[:, month] = month_principal
+        payment[:, month] = month_interest + month_principal
+        opening = opening - month_principal
+        balance[:, month] = np.where(active, opening, 0.0)
+    return AmortizationSchedule(payment, interest, repaid, balance)
@@ -0,0 +1,164 @@
+"""
+Async (ASGI) versions of the eligibility, create-loan and loan view endpoints.
+
+They share their rules and response shapes with api.views but read through
+Django's async ORM, so a single ASGI worker can hold many requests in flight.
+Work that needs a transaction (creating a loan, rebuilding a snapshot) runs
+through sync_to_async, since the async ORM has no transaction support.
+"""
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from django.views import View
+from rest_framework import status
+
+from .cache import aget_credit_profile
+from .db_router import aread_with_fallback
+from .models import Customer, Loan
+from .renderers import ORJSONResponse, dumps
+from .utils import assess_eligibility
+from .versions import (
+    CUSTOMER_VERSION_FIELDS,
+    LOAN_VERSION_FIELDS,
+    is_conditional,
+    loan_validators,
+    loans_validators,
+    not_modified,
+    set_validators,
+)
+from .views import (
+    LOAN_DETAIL_FIELDS,
+    create_loan_for_customer,
+    customer_loans,
+    loan_detail,
+    loan_list_item,
+    paginate_loan_items,
+    parse_loan_page_params,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_loan_request(request):
+    """Return (customer_id, loan_amount, interest_rate, tenure) from a JSON body, or raise ValueError."""
+    try:
+        data = json.loads(request.body or b'{}')
+        return (
+            data.get('customer_id'),
+            float(data.get('loan_amount', 0)),
+            float(data.get('interest_rate', 0)),
+            int(data.get('tenure', 0)),
+        )
+    except (AttributeError, TypeError, ValueError):
+        raise ValueError('Request body must be a JSON object with numeric loan_amount, interest_rate and tenure')
+
+
+class AsyncAPIView(View):
+    """Base for the async endpoints: token-less JSON API, CSRF-exempt like DRF's APIView."""
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+
+class AsyncCheckEligibilityView(AsyncAPIView):
+    """Async API endpoint to check loan eligibility for a customer."""
+    async def post(self, request):
+        try:
+            customer_id, loan_amount, interest_rate, tenure = _parse_loan_request(request)
+        except ValueError as exc:
+            return ORJSONResponse({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        profile, _ = await aread_with_fallback(lambda: aget_credit_profile(customer_id), customer_id)
+        if profile is None:
+            logger.error("Eligibility check failed: Customer %s not found.", customer_id, extra={'event': 'customer_not_found', 'customer_id': customer_id})
+            return ORJSONResponse({'error': 'Customer not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        decision = assess_eligibility(profile, profile.features, profile.credit_score, loan_amount, interest_rate, tenure)
+        logger.info(
+            "Eligibility checked for customer %s: approval=%s, credit_score=%s", customer_id, decision.approval, profile.credit_score,
+            extra={'event': 'eligibility_checked', 'customer_id': customer_id, 'approval': decision.approval, 'credit_score': profile.credit_score, 'sampled': True},
+        )
+        return ORJSONResponse({
+            'customer_id': profile.customer_id,
+            'approval': decision.approval,
+            'interest_rate': interest_rate,
+            'corrected_interest_rate': decision.corrected_interest_rate,
+            'tenure': tenure,
+            'monthly_installment': decision.monthly_installment
+        })
+
+
+class AsyncCreateLoanView(AsyncAPIView):
+    """Async API endpoint to create a new loan for a customer if eligible."""
+    async def post(self, request):
+        try:
+            customer_id, loan_amount, interest_rate, tenure = _parse_loan_request(request)
+        except ValueError as exc:
+            return ORJSONResponse({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        response_data, status_code = await sync_to_async(create_loan_for_customer)(
+            customer_id, loan_amount, interest_rate, tenure
+        )
+        return ORJSONResponse(response_data, status=status_code)
+
+
+class AsyncViewLoanView(AsyncAPIView):
+    """Async API endpoint to view details of a specific loan and its customer."""
+    async def get(self, request, loan_id):
+        alias = None
+        if is_conditional(request):
+            versions, alias = await aread_with_fallback(Loan.objects.filter(id=loan_id).values(*LOAN_VERSION_FIELDS).afirst)
+            if versions is not None:
+                response = not_modified(request, *loan_validators(loan_id, versions))
+                if response is not None:
+                    return response
+        if alias is None:
+            row, _ = await aread_with_fallback(Loan.objects.filter(id=loan_id).values(*LOAN_DETAIL_FIELDS).afirst)
+        else:
+            row = await Loan.objects.using(alias).filter(id=loan_id).values(*LOAN_DETAIL_FIELDS).afirst()
+        if row is None:
+            logger.error("View loan failed: Loan %s not found.", loan_id, extra={'event': 'loan_not_found', 'loan_id': loan_id})
+            return ORJSONResponse({'error': 'Loan not found'}, status=status.HTTP_404_NOT_FOUND)
+        logger.info("Viewed loan %s for customer %s.", row['id'], row['customer_id'], extra={'event': 'loan_viewed', 'loan_id': row['id'], 'customer_id': row['customer_id'], 'sampled': True})
+        return set_validators(ORJSONResponse(loan_detail(row)), *loan_validators(row['id'], row))
+
+
+class AsyncViewLoansView(AsyncAPIView):
+    """Async API endpoint to view a customer's loans; same parameters as ViewLoansView."""
+    async def get(self, request, customer_id):
+        versions, alias = await aread_with_fallback(Customer.objects.filter(id=customer_id).values(*CUSTOMER_VERSION_FIELDS).afirst, customer_id)
+        if versions is None:
+            logger.error("View loans failed: Customer %s not found.", customer_id, extra={'event': 'customer_not_found', 'customer_id': customer_id})
+            return ORJSONResponse({'error': 'Customer not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        params = request.GET
+        validators = loans_validators(customer_id, versions, params)
+        response = not_modified(request, *validators)
+        if response is not None:
+            return response
+        try:
+            after, page_size = parse_loan_page_params(params)
+        except ValueError as exc:
+            return ORJSONResponse({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        loans = customer_loans(customer_id, after).using(alias)
+
+        if params.get('stream') == 'ndjson':
+            async def lines():
+                async for row in loans:
+                    yield dumps(loan_list_item(row)) + b'\n'
+            logger.info("Streaming loans for customer %s.", customer_id, extra={'event': 'loans_streamed', 'customer_id': customer_id, 'sampled': True})
+            return set_validators(StreamingHttpResponse(lines(), content_type='application/x-ndjson'), *validators)
+
+        if 'page_size' in params or 'cursor' in params:
+            items = [loan_list_item(row) async for row in loans[:page_size + 1]]
+            page, next_cursor = paginate_loan_items(items, page_size)
+            logger.info("Viewed %s loans for customer %s.", len(page), customer_id, extra={'event': 'loans_viewed', 'customer_id': customer_id, 'sampled': True})
+            return set_validators(ORJSONResponse({'results': page, 'next_cursor': next_cursor}), *validators)
+
+        response_data = [loan_list_item(row) async for row in loans]
+        logger.info("Viewed %s loans for customer %s.", len(response_data), customer_id, extra={'event': 'loans_viewed', 'customer_id': customer_id, 'sampled': True})
+        return set_validators(ORJSONResponse(response_data), *validators)
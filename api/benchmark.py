@@ -0,0 +1,299 @@
+"""
+In-process load generator for the API: builds a synthetic dataset, replays a
+mix of requests through the Django test client from several threads, and
+summarises latency, throughput and database queries per endpoint.
+"""
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from .amortization import calculate_emis
+from .ingestion import recompute_current_debt
+from .models import Customer, Loan
+from .snapshots import refresh_credit_snapshots
+
+BENCHMARK_LAST_NAME = 'Benchmark'
+DEFAULT_MIX = {'register': 1, 'check-eligibility': 6, 'create-loan': 1, 'view-loans': 2}
+ENDPOINTS = tuple(DEFAULT_MIX)
+DELETE_CHUNK_SIZE = 5000
+
+
+def parse_mix(value):
+    """Parse 'register=1,check-eligibility=6' into {endpoint: weight}."""
+    mix = {}
+    for part in value.split(','):
+        endpoint, _, weight = part.partition('=')
+        endpoint = endpoint.strip()
+        if endpoint not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint '{endpoint}'. Choose from {', '.join(ENDPOINTS)}.")
+        mix[endpoint] = int(weight or 1)
+    return mix
+
+
+def create_dataset(customers, loans, seed=0):
+    """
+    Insert `customers` synthetic customers and `loans` loans spread over them,
+    with derived current_debt and credit snapshots. Returns the customer IDs.
+    """
+    rng = np.random.default_rng(seed)
+    phone_numbers = rng.integers(6000000000, 9999999999, customers)
+    salaries = rng.integers(20000, 200000, customers)
+    created = Customer.objects.bulk_create([
+        Customer(
+            first_name=f'Customer{index}',
+            last_name=BENCHMARK_LAST_NAME,
+            age=int(age),
+            monthly_salary=int(salary),
+            phone_number=str(phone_number),
+            approved_limit=int(round(36 * int(salary) / 100000.0) * 100000),
+            current_debt=0,
+        )
+        for index, (age, salary, phone_number) in enumerate(zip(rng.integers(21, 65, customers), salaries, phone_numbers))
+    ], batch_size=5000)
+    customer_ids = [customer.id for customer in created]
+
+    owners = rng.integers(0, customers, loans)
+    amounts = rng.integers(10000, 1000000, loans).astype(float)
+    rates = np.round(rng.uniform(8, 20, loans), 2)
+    tenures = rng.integers(6, 120, loans)
+    emis = calculate_emis(amounts, rates, tenures)
+    start_offsets = rng.integers(0, 3650, loans)
+    today = date.today()
+    rows = []
+    for owner, amount, rate, tenure, emi, offset in zip(
+        owners.tolist(), amounts.tolist(), rates.tolist(), tenures.tolist(), emis.tolist(), start_offsets.tolist()
+    ):
+        start_date = today - timedelta(days=offset)
+        rows.append(Loan(
+            customer_id=customer_ids[owner],
+            loan_amount=amount,
+            tenure=tenure,
+            interest_rate=rate,
+            monthly_repayment=emi,
+            emis_paid_on_time=int(rng.integers(0, tenure + 1)),
+            start_date=start_date,
+            end_date=start_date + timedelta(days=30 * tenure),
+        ))
+    Loan.objects.bulk_create(rows, batch_size=5000)
+    recompute_current_debt(customer_ids)
+    refresh_credit_snapshots(customer_ids)
+    return customer_ids
+
+
+def delete_dataset(customer_ids):
+    """
+    Remove the customers the benchmark created or registered, by ID, so real
+    customers are never touched; their loans and snapshots cascade.
+    """
+    customer_ids = list(customer_ids)
+    for start in range(0, len(customer_ids), DELETE_CHUNK_SIZE):
+        Customer.objects.filter(id__in=customer_ids[start:start + DELETE_CHUNK_SIZE]).delete()
+
+
+def generate_requests(customer_ids, count, mix=DEFAULT_MIX, seed=0):
+    """Draw `count` requests from the weighted mix as {'endpoint', 'data'} dicts."""
+    rng = random.Random(seed)
+    endpoints = rng.choices(list(mix), weights=list(mix.values()), k=count)
+    requests = []
+    for index, endpoint in enumerate(endpoints):
+        customer_id = rng.choice(customer_ids)
+        if endpoint == 'register':
+            data = {
+                'first_name': f'Registered{index}',
+                'last_name': BENCHMARK_LAST_NAME,
+                'age': rng.randint(21, 65),
+                'monthly_income': rng.randrange(20000, 200000, 1000),
+                'phone_number': str(rng.randint(6000000000, 9999999999)),
+            }
+        elif endpoint in ('check-eligibility', 'create-loan'):
+            data = {
+                'customer_id': customer_id,
+                'loan_amount': rng.randrange(10000, 1000000, 1000),
+                'interest_rate': round(rng.uniform(8, 20), 2),
+                'tenure': rng.randint(6, 120),
+            }
+        else:
+            data = {'customer_id': customer_id}
+        requests.append({'endpoint': endpoint, 'data': data})
+    return requests
+
+
+def load_requests(file_path):
+    """Read requests from a JSON Lines file of {'endpoint': ..., 'data': {...}} objects."""
+    requests = []
+    with open(file_path) as handle:
+        for line in handle:
+            if line.strip():
+                request = json.loads(line)
+                if request.get('endpoint') not in ENDPOINTS:
+                    raise ValueError(f"Unknown endpoint in {file_path}: {request.get('endpoint')!r}")
+                requests.append(request)
+    return requests
+
+
+def foreign_writes(requests, customer_ids):
+    """
+    The create-loan requests aimed at customers outside `customer_ids`; the
+    loans they create would outlive the benchmark's cleanup.
+    """
+    own = set(customer_ids)
+    return [
+        request for request in requests
+        if request['endpoint'] == 'create-loan' and request['data'].get('customer_id') not in own
+    ]
+
+
+class _QueryCounter:
+    """connection.execute_wrapper hook counting the queries a request runs."""
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _client_host():
+    """A host name the running settings accept, so requests pass ALLOWED_HOSTS validation."""
+    hosts = [host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*']
+    return hosts[0] if hosts else 'localhost'
+
+
+def _send(client, request):
+    endpoint, data = request['endpoint'], request['data']
+    if endpoint == 'view-loans':
+        return client.get(reverse('view-loans', args=[data['customer_id']]))
+    return client.post(reverse(endpoint), data, content_type='application/json')
+
+
+def _replay(requests, state, registered):
+    """
+    Replay requests on this thread's client and database connection, adding
+    the IDs of customers it registers to `registered`.
+    """
+    client = getattr(state, 'client', None)
+    if client is None:
+        client = state.client = Client(HTTP_HOST=_client_host())
+    samples = []
+    for request in requests:
+        counter = _QueryCounter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            response = _send(client, request)
+        elapsed = time.perf_counter() - started
+        if request['endpoint'] == 'register' and response.status_code == 201:
+            registered.append(response.json()['customer_id'])
+        samples.append((request['endpoint'], elapsed, counter.count, response.status_code >= 400))
+    return samples
+
+
+def summarise(samples, elapsed):
+    """Per-endpoint and overall latency percentiles (ms), throughput and query counts."""
+    def stats(rows):
+        latencies = np.array([row[1] for row in rows]) * 1000
+        queries = np.array([row[2] for row in rows])
+        return {
+            'requests': len(rows),
+            'errors': sum(1 for row in rows if row[3]),
+            'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+            'p95_ms': round(float(np.percentile(latencies, 95)), 3),
+            'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+            'mean_ms': round(float(latencies.mean()), 3),
+            'throughput_rps': round(len(rows) / elapsed, 1) if elapsed > 0 else None,
+            'mean_queries': round(float(queries.mean()), 2),
+            'max_queries': int(queries.max()),
+        }
+
+    by_endpoint = {}
+    for sample in samples:
+        by_endpoint.setdefault(sample[0], []).append(sample)
+    return {
+        'endpoints': {endpoint: stats(rows) for endpoint, rows in sorted(by_endpoint.items())},
+        'total': stats(samples) if samples else {'requests': 0},
+        'seconds': round(elapsed, 3),
+    }
+
+
+def run_benchmark(requests, concurrency=1, registered=None):
+    """
+    Replay `requests` split round-robin over `concurrency` threads, each with
+    its own client and database connection, and return summarise()'s report.
+    With concurrency 1 the requests run on the calling thread. The IDs of
+    customers registered along the way are appended to `registered`.
+    """
+    registered = [] if registered is None else registered
+    state = threading.local()
+    started = time.perf_counter()
+    if concurrency <= 1:
+        samples = _replay(requests, state, registered)
+    else:
+        def worker(part):
+            try:
+                return _replay(part, state, registered)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            parts = pool.map(worker, [requests[index::concurrency] for index in range(concurrency)])
+            samples = [sample for part in parts for sample in part]
+    return summarise(samples, time.perf_counter() - started)
+
+
+def _legacy_loan_list(customer_id):
+    """view-loans as it was built before the values() projection: model instances, then dicts."""
+    loans = Loan.objects.filter(customer_id=customer_id).only(
+        'id', 'loan_amount', 'interest_rate', 'monthly_repayment', 'tenure', 'emis_paid_on_time', 'emis_paid_late',
+    ).order_by('id')
+    return [
+        {
+            'loan_id': loan.id,
+            'loan_amount': loan.loan_amount,
+            'interest_rate': loan.interest_rate,
+            'monthly_installment': loan.monthly_repayment,
+            'repayments_left': loan.tenure - loan.emis_paid_on_time - loan.emis_paid_late,
+        }
+        for loan in loans
+    ]
+
+
+def benchmark_loan_rendering(customer_id, repeat=20):
+    """
+    Build and render `customer_id`'s view-loans body `repeat` times both ways -
+    model instances with DRF's JSONRenderer, and values_list() rows with the
+    orjson renderer - and report the CPU milliseconds each takes per request.
+    """
+    from rest_framework.renderers import JSONRenderer
+
+    from .renderers import ORJSONRenderer
+    from .views import customer_loans, loan_list_item
+
+    paths = {
+        'legacy': lambda: JSONRenderer().render(_legacy_loan_list(customer_id)),
+        'fast': lambda: ORJSONRenderer().render([loan_list_item(row) for row in customer_loans(customer_id)]),
+    }
+    bodies, cpu_ms = {}, {}
+    for name, render in paths.items():
+        bodies[name] = render()  # Warm-up, and the output compared below
+        started = time.process_time()
+        for _ in range(repeat):
+            render()
+        cpu_ms[name] = (time.process_time() - started) * 1000 / repeat
+    legacy, fast = cpu_ms['legacy'], cpu_ms['fast']
+    return {
+        'loans': len(json.loads(bodies['fast'])),
+        'repeat': repeat,
+        'legacy_cpu_ms': round(legacy, 3),
+        'fast_cpu_ms': round(fast, 3),
+        'saved_cpu_ms': round(legacy - fast, 3),
+        'speedup': round(legacy / fast, 2) if fast else None,
+        'identical': json.loads(bodies['legacy']) == json.loads(bodies['fast']),
+    }
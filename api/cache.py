@@ -0,0 +1,224 @@
+"""
+Two-tier cache of per-customer CreditProfiles: a small in-process LRU in front
+of the shared Django cache (Redis in deployment).
+
+Invalidation deletes the shared entry and the local entry in the current
+process. Other processes can serve their local copy for up to
+CREDIT_CACHE['LOCAL_TTL'] seconds, so only read-only endpoints use the cache;
+create-loan always scores from the database.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Customer, CustomerCreditSnapshot
+from .utils import build_credit_profile
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ALIAS': 'default',
+    'LOCAL_MAXSIZE': 10000,
+    'LOCAL_TTL': 5,
+    'TTL': 300,
+}
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU with a per-entry time-to-live."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CreditProfileCache:
+    """LRU tier in front of the shared cache, with hit/miss counters for this process."""
+
+    def __init__(self, options=None):
+        options = {**DEFAULTS, **(options or {})}
+        self.alias = options['ALIAS']
+        self.ttl = options['TTL']
+        self.local = LRUCache(options['LOCAL_MAXSIZE'], options['LOCAL_TTL'])
+        self._counters = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'invalidations': 0, 'errors': 0}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(customer_id):
+        return f'credit-profile:{customer_id}'
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            self._counters[counter] += amount
+
+    def get(self, customer_id):
+        key = self.key(customer_id)
+        profile = self.local.get(key)
+        if profile is not None:
+            self._count('local_hits')
+            return profile
+        try:
+            profile = self.shared.get(key)
+        except Exception:
+            # A cache outage degrades to database reads rather than failing requests
+            logger.exception("Credit cache read failed.")
+            self._count('errors')
+            profile = None
+        if profile is None:
+            self._count('misses')
+            return None
+        self._count('shared_hits')
+        self.local.set(key, profile)
+        return profile
+
+    async def aget(self, customer_id):
+        """get() for async views: the shared tier is awaited instead of blocking the event loop."""
+        key = self.key(customer_id)
+        profile = self.local.get(key)
+        if profile is not None:
+            self._count('local_hits')
+            return profile
+        try:
+            profile = await self.shared.aget(key)
+        except Exception:
+            logger.exception("Credit cache read failed.")
+            self._count('errors')
+            profile = None
+        if profile is None:
+            self._count('misses')
+            return None
+        self._count('shared_hits')
+        self.local.set(key, profile)
+        return profile
+
+    async def aset(self, profile):
+        key = self.key(profile.customer_id)
+        self.local.set(key, profile)
+        try:
+            await self.shared.aset(key, profile, self.ttl)
+        except Exception:
+            logger.exception("Credit cache write failed.")
+            self._count('errors')
+
+    def set(self, profile):
+        key = self.key(profile.customer_id)
+        self.local.set(key, profile)
+        try:
+            self.shared.set(key, profile, self.ttl)
+        except Exception:
+            logger.exception("Credit cache write failed.")
+            self._count('errors')
+
+    def invalidate(self, customer_ids):
+        keys = [self.key(customer_id) for customer_id in customer_ids]
+        for key in keys:
+            self.local.delete(key)
+        try:
+            for start in range(0, len(keys), 1000):
+                self.shared.delete_many(keys[start:start + 1000])
+        except Exception:
+            logger.exception("Credit cache invalidation failed.")
+            self._count('errors')
+        self._count('invalidations', len(keys))
+
+    def clear_local(self):
+        self.local.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['local_hits'] + stats['shared_hits']) / lookups if lookups else 0.0
+        stats['local_size'] = len(self.local)
+        return stats
+
+
+credit_cache = CreditProfileCache(getattr(settings, 'CREDIT_CACHE', None))
+
+
+def get_credit_profile(customer_id):
+    """
+    Return the CreditProfile for a customer from the cache, loading and caching
+    it on a miss. Returns None if the customer does not exist.
+    """
+    try:
+        customer_id = int(customer_id)
+    except (TypeError, ValueError):
+        return None
+    profile = credit_cache.get(customer_id)
+    if profile is None:
+        try:
+            customer = Customer.objects.select_related('credit_snapshot').get(id=customer_id)
+        except Customer.DoesNotExist:
+            return None
+        profile = build_credit_profile(customer)
+        credit_cache.set(profile)
+    return profile
+
+
+async def aget_credit_profile(customer_id):
+    """Async get_credit_profile, using the async ORM for the customer lookup."""
+    from .snapshots import refresh_credit_snapshot
+
+    try:
+        customer_id = int(customer_id)
+    except (TypeError, ValueError):
+        return None
+    profile = await credit_cache.aget(customer_id)
+    if profile is None:
+        try:
+            customer = await Customer.objects.select_related('credit_snapshot').aget(id=customer_id)
+        except Customer.DoesNotExist:
+            return None
+        try:
+            snapshot = customer.credit_snapshot
+        except CustomerCreditSnapshot.DoesNotExist:
+            snapshot = None
+        if snapshot is None or not snapshot.is_fresh(date.today()):
+            # Rebuilding writes in a transaction, which the async ORM cannot do yet
+            customer.credit_snapshot = await sync_to_async(refresh_credit_snapshot)(customer_id)
+        profile = build_credit_profile(customer)
+        await credit_cache.aset(profile)
+    return profile
@@ -0,0 +1,119 @@
+"""
+Read-replica routing.
+
+Reads go to the primary unless a block of code opts in with
+`reading_from(replica_for_read(...))`; the read-only endpoints and the
+portfolio/export jobs do. Writes, and reads made with select_for_update, always
+go to the primary.
+
+Replica lag is handled two ways:
+- After a customer's loans or payments change, the customer is pinned to the
+  primary for settings.REPLICA_PIN_SECONDS (in the shared cache, so every
+  process sees it), so their next reads see their own writes.
+- Views that find nothing on a replica retry once on the primary, since the
+  row may simply not have replicated yet.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+_read_alias = ContextVar('read_alias', default=None)
+
+DEFAULT_PIN_SECONDS = 10
+
+
+def _pin_key(customer_id):
+    return f'db-pin:customer:{customer_id}'
+
+
+def pin_customer(customer_id):
+    """Send `customer_id`'s reads to the primary for the next REPLICA_PIN_SECONDS."""
+    if settings.DATABASE_REPLICAS:
+        cache.set(_pin_key(customer_id), True, getattr(settings, 'REPLICA_PIN_SECONDS', DEFAULT_PIN_SECONDS))
+
+
+def pin_customers(customer_ids):
+    if settings.DATABASE_REPLICAS and customer_ids:
+        timeout = getattr(settings, 'REPLICA_PIN_SECONDS', DEFAULT_PIN_SECONDS)
+        cache.set_many({_pin_key(customer_id): True for customer_id in customer_ids}, timeout)
+
+
+def pinned_customers(customer_ids):
+    """The subset of `customer_ids` currently pinned to the primary."""
+    if not settings.DATABASE_REPLICAS or not customer_ids:
+        return set()
+    keys = {_pin_key(customer_id): customer_id for customer_id in customer_ids}
+    return {keys[key] for key in cache.get_many(list(keys))}
+
+
+def replica_for_read(customer_id=None):
+    """The alias to read from: a random replica, or the primary if there are none or the customer is pinned."""
+    replicas = settings.DATABASE_REPLICAS
+    if not replicas or (customer_id is not None and cache.get(_pin_key(customer_id))):
+        return DEFAULT_DB_ALIAS
+    return random.choice(replicas)
+
+
+async def areplica_for_read(customer_id=None):
+    """Async replica_for_read."""
+    replicas = settings.DATABASE_REPLICAS
+    if not replicas or (customer_id is not None and await cache.aget(_pin_key(customer_id))):
+        return DEFAULT_DB_ALIAS
+    return random.choice(replicas)
+
+
+@contextmanager
+def reading_from(alias):
+    """Route ORM reads in this block (and in sync_to_async calls made from it) to `alias`."""
+    token = _read_alias.set(alias)
+    try:
+        yield alias
+    finally:
+        _read_alias.reset(token)
+
+
+def read_with_fallback(read, customer_id=None):
+    """
+    Call `read()` with reads routed to a replica (the primary if `customer_id`
+    is pinned), retrying on the primary if it finds nothing (returns a falsy
+    value). Returns (result, alias the result was read from).
+    """
+    alias = replica_for_read(customer_id)
+    with reading_from(alias):
+        result = read()
+    if not result and alias != DEFAULT_DB_ALIAS:
+        alias = DEFAULT_DB_ALIAS
+        with reading_from(alias):
+            result = read()
+    return result, alias
+
+
+async def aread_with_fallback(read, customer_id=None):
+    """Async read_with_fallback; `read` is a coroutine function."""
+    alias = await areplica_for_read(customer_id)
+    with reading_from(alias):
+        result = await read()
+    if not result and alias != DEFAULT_DB_ALIAS:
+        alias = DEFAULT_DB_ALIAS
+        with reading_from(alias):
+            result = await read()
+    return result, alias
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
@@ -0,0 +1,164 @@
+"""
+Parquet export of customers and loans for analytics, so reporting reads files
+rather than the OLTP database.
+
+Rows are streamed through a server-side cursor EXPORT_CHUNK_SIZE at a time and
+written as Parquet row groups:
+
+    <output>/customers/part-<run>.parquet
+    <output>/loans/start_year=<year>/part-<run>.parquet
+
+Each run exports the rows whose updated_at is after the previous run's
+watermark (less EXPORT_OVERLAP seconds, to catch transactions that committed
+or replicated late), recorded in <output>/_export_state.json. Readers should
+keep the row with the latest updated_at per id. Deleted rows are not tracked; run with
+full=True into a fresh directory to rebuild.
+"""
+import json
+import os
+from datetime import datetime, timedelta
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from django.utils import timezone
+
+from .db_router import replica_for_read
+from .models import Customer, Loan
+
+EXPORT_CHUNK_SIZE = 50000
+EXPORT_OVERLAP = timedelta(seconds=60)
+STATE_FILE = '_export_state.json'
+
+TIMESTAMP = pa.timestamp('us', tz='UTC')
+CUSTOMER_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('first_name', pa.string()),
+    ('last_name', pa.string()),
+    ('age', pa.int32()),
+    ('monthly_salary', pa.int64()),
+    ('phone_number', pa.string()),
+    ('approved_limit', pa.int64()),
+    ('current_debt', pa.int64()),
+    ('updated_at', TIMESTAMP),
+])
+LOAN_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('customer_id', pa.int64()),
+    ('source_loan_id', pa.int64()),
+    ('loan_amount', pa.float64()),
+    ('tenure', pa.int32()),
+    ('interest_rate', pa.float64()),
+    ('monthly_repayment', pa.float64()),
+    ('emis_paid_on_time', pa.int32()),
+    ('emis_paid_late', pa.int32()),
+    ('start_date', pa.date32()),
+    ('end_date', pa.date32()),
+    ('updated_at', TIMESTAMP),
+])
+
+
+def read_state(output_dir):
+    path = os.path.join(output_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as handle:
+        return {table: datetime.fromisoformat(value) for table, value in json.load(handle).items()}
+
+
+def write_state(output_dir, state):
+    path = os.path.join(output_dir, STATE_FILE)
+    with open(path + '.tmp', 'w') as handle:
+        json.dump({table: value.isoformat() for table, value in state.items()}, handle, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def _to_table(rows, schema):
+    columns = zip(*rows)
+    return pa.Table.from_arrays([pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema)
+
+
+def _chunks(queryset, schema, chunk_size):
+    """Yield pyarrow Tables of `chunk_size` rows read through a server-side cursor."""
+    rows = []
+    for row in queryset.values_list(*schema.names).iterator(chunk_size=chunk_size):
+        rows.append(row)
+        if len(rows) == chunk_size:
+            yield _to_table(rows, schema)
+            rows = []
+    if rows:
+        yield _to_table(rows, schema)
+
+
+class _PartitionWriters:
+    """One ParquetWriter per partition directory, opened on first write."""
+
+    def __init__(self, root, file_name, schema):
+        self.root = root
+        self.file_name = file_name
+        self.schema = schema
+        self.writers = {}
+        self.rows = 0
+
+    def write(self, partition, table):
+        writer = self.writers.get(partition)
+        if writer is None:
+            directory = os.path.join(self.root, partition) if partition else self.root
+            os.makedirs(directory, exist_ok=True)
+            writer = self.writers[partition] = pq.ParquetWriter(os.path.join(directory, self.file_name), self.schema)
+        writer.write_table(table)
+        self.rows += table.num_rows
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+
+def _export_table(queryset, schema, root, file_name, chunk_size, partition=None):
+    """
+    Export a queryset, partitioned by the year of a date column when
+    `partition` is (partition name, column). Returns (rows written, latest updated_at seen).
+    """
+    writers = _PartitionWriters(root, file_name, schema)
+    latest = None
+    try:
+        for table in _chunks(queryset, schema, chunk_size):
+            chunk_latest = pc.max(table['updated_at']).as_py()
+            if chunk_latest is not None and (latest is None or chunk_latest > latest):
+                latest = chunk_latest
+            if partition is None:
+                writers.write('', table)
+                continue
+            name, column = partition
+            years = pc.year(table[column])
+            for year in pc.unique(years).to_pylist():
+                writers.write(f'{name}={year}', table.filter(pc.equal(years, year)))
+    finally:
+        writers.close()
+    return writers.rows, latest
+
+
+def export_parquet(output_dir, full=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Export customers and loans changed since the last run (everything when
+    `full` or on the first run) and advance the watermarks.
+    Returns {table: rows exported}.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    state = {} if full else read_state(output_dir)
+    run = timezone.now().strftime('%Y%m%dT%H%M%S%fZ')
+    file_name = f'part-{run}.parquet'
+    counts = {}
+    for table, model, schema, partition in (
+        ('customers', Customer, CUSTOMER_SCHEMA, None),
+        ('loans', Loan, LOAN_SCHEMA, ('start_year', 'start_date')),
+    ):
+        queryset = model.objects.using(replica_for_read()).order_by('updated_at', 'id')
+        if table in state:
+            queryset = queryset.filter(updated_at__gt=state[table] - EXPORT_OVERLAP)
+        rows, latest = _export_table(queryset, schema, os.path.join(output_dir, table), file_name, chunk_size, partition)
+        counts[table] = rows
+        if latest is not None:
+            state[table] = max(latest, state.get(table, latest))
+    write_state(output_dir, state)
+    return counts
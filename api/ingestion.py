@@ -0,0 +1,438 @@
+import csv
+import hashlib
+import io
+import logging
+import os
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce, Now
+from django.utils import timezone
+
+from .amortization import calculate_emis
+from .cache import credit_cache
+from .models import Customer, Loan
+from .versions import bump_versions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+DEFAULT_SHARD_SIZE = 50000
+# Relative difference between a sheet's monthly payment and the computed EMI that gets reported
+EMI_MISMATCH_TOLERANCE = 0.01
+WRITE_METHODS = ('bulk_create', 'copy', 'upsert')
+
+# Spreadsheet column -> model field
+CUSTOMER_ID_COLUMN = 'Customer ID'
+LOAN_ID_COLUMN = 'Loan ID'
+CUSTOMER_COLUMNS = {
+    'First Name': 'first_name',
+    'Last Name': 'last_name',
+    'Age': 'age',
+    'Monthly Salary': 'monthly_salary',
+    'Phone Number': 'phone_number',
+    'Approved Limit': 'approved_limit',
+}
+LOAN_COLUMNS = {
+    'Customer ID': 'customer_id',
+    'Loan Amount': 'loan_amount',
+    'Tenure': 'tenure',
+    'Interest Rate': 'interest_rate',
+    'Monthly payment': 'monthly_repayment',
+    'EMIs paid on Time': 'emis_paid_on_time',
+    'Date of Approval': 'start_date',
+    'End Date': 'end_date',
+}
+
+# Natural keys used to match spreadsheet rows to existing rows when upserting
+UPSERT_KEYS = {
+    Customer: ('id',),
+    Loan: ('customer_id', 'source_loan_id'),
+}
+
+
+def _iter_xlsx_batches(file_path, batch_size, start, stop):
+    """Read an .xlsx sheet row by row with openpyxl's read-only mode."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.active
+        header = next(sheet.iter_rows(max_row=1, values_only=True), None)
+        if header is None:
+            return
+        # Sheet rows are 1-based and row 1 is the header
+        rows = sheet.iter_rows(min_row=start + 2, max_row=None if stop is None else stop + 1, values_only=True)
+        batch = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            batch.append(row)
+            if len(batch) == batch_size:
+                yield pd.DataFrame(batch, columns=header)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=header)
+    finally:
+        workbook.close()
+
+
+def _parquet_file(file_path):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise ImportError("pyarrow is required to ingest Parquet files") from exc
+    return pq.ParquetFile(file_path)
+
+
+def _iter_parquet_batches(file_path, batch_size, start, stop):
+    """Read a Parquet file one record batch at a time (requires pyarrow)."""
+    offset = 0
+    for batch in _parquet_file(file_path).iter_batches(batch_size=batch_size):
+        batch_start, offset = offset, offset + batch.num_rows
+        if offset <= start:
+            continue
+        if stop is not None and batch_start >= stop:
+            break
+        lower = max(start - batch_start, 0)
+        upper = batch.num_rows if stop is None else min(stop - batch_start, batch.num_rows)
+        yield batch.slice(lower, upper - lower).to_pandas()
+
+
+def _iter_csv_batches(file_path, batch_size, start, stop):
+    reader = pd.read_csv(
+        file_path,
+        skiprows=range(1, start + 1),
+        nrows=None if stop is None else stop - start,
+        chunksize=batch_size,
+    )
+    with reader:
+        yield from reader
+
+
+def iter_batches(file_path, batch_size=DEFAULT_BATCH_SIZE, start=0, stop=None):
+    """
+    Yield data rows [start, stop) of a spreadsheet as DataFrames of at most
+    `batch_size` rows, without loading the whole file. Supports .xlsx/.xlsm
+    (openpyxl read-only), .csv and .parquet; other formats fall back to
+    pandas.read_excel.
+    """
+    extension = os.path.splitext(str(file_path))[1].lower()
+    if extension in ('.xlsx', '.xlsm'):
+        yield from _iter_xlsx_batches(file_path, batch_size, start, stop)
+    elif extension == '.csv':
+        yield from _iter_csv_batches(file_path, batch_size, start, stop)
+    elif extension == '.parquet':
+        yield from _iter_parquet_batches(file_path, batch_size, start, stop)
+    else:
+        df = pd.read_excel(file_path).iloc[start:stop]
+        for offset in range(0, len(df), batch_size):
+            yield df.iloc[offset:offset + batch_size]
+
+
+def count_rows(file_path):
+    """Return the number of data rows in a spreadsheet, excluding the header."""
+    extension = os.path.splitext(str(file_path))[1].lower()
+    if extension in ('.xlsx', '.xlsm'):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(file_path, read_only=True)
+        try:
+            sheet = workbook.active
+            if sheet.max_row is None:
+                sheet.reset_dimensions()
+                sheet.calculate_dimension(force=True)
+            return max((sheet.max_row or 0) - 1, 0)
+        finally:
+            workbook.close()
+    if extension == '.csv':
+        with pd.read_csv(file_path, usecols=[0], chunksize=DEFAULT_SHARD_SIZE) as reader:
+            return sum(len(chunk) for chunk in reader)
+    if extension == '.parquet':
+        return _parquet_file(file_path).metadata.num_rows
+    return len(pd.read_excel(file_path))
+
+
+def plan_shards(file_path, shard_size=DEFAULT_SHARD_SIZE):
+    """Split a spreadsheet's data rows into [start, stop) ranges of `shard_size` rows."""
+    total = count_rows(file_path)
+    return [(start, min(start + shard_size, total)) for start in range(0, total, shard_size)]
+
+
+def ingestion_job_key(kind, file_path):
+    """
+    Identify an import of one file so a re-run resumes its checkpoints. The key
+    changes whenever the file is replaced (size or modification time differs).
+    """
+    stat = os.stat(file_path)
+    source = f"{kind}:{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def _select_columns(df, columns):
+    """Rename spreadsheet columns to model fields, failing fast on missing ones."""
+    missing = [column for column in columns if column not in df.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+    return df[list(columns)].rename(columns=columns)
+
+
+def row_hashes(frame):
+    """Hash each row's values into a signed 64-bit integer, for change detection."""
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy().view('int64')
+
+
+def prepare_customers(df):
+    """
+    Validate and coerce a customer sheet in one vectorised pass.
+    Returns (frame, invalid_count); rows with missing or non-numeric values are dropped.
+    """
+    columns = dict(CUSTOMER_COLUMNS)
+    numeric = ['age', 'monthly_salary', 'approved_limit']
+    if CUSTOMER_ID_COLUMN in df.columns:
+        # Keep the sheet's IDs so loan rows (and out-of-order shards) resolve to the right customer
+        columns = {CUSTOMER_ID_COLUMN: 'id', **columns}
+        numeric.append('id')
+    frame = _select_columns(df, columns)
+    for field in numeric:
+        frame[field] = pd.to_numeric(frame[field], errors='coerce')
+    valid = frame.notna().all(axis=1)
+    frame = frame[valid].copy()
+    for field in numeric:
+        frame[field] = frame[field].astype('int64')
+    frame['phone_number'] = frame['phone_number'].astype(str).str.replace(r'\.0$', '', regex=True)
+    frame['source_hash'] = row_hashes(frame)
+    frame['current_debt'] = 0
+    return frame, int((~valid).sum())
+
+
+def prepare_loans(df):
+    """
+    Validate and coerce a loan sheet in one vectorised pass.
+    Returns (frame, invalid_count); rows with missing/non-numeric values, a
+    non-positive tenure or an end date before the start date are dropped.
+    """
+    columns = dict(LOAN_COLUMNS)
+    integers = ['customer_id', 'tenure', 'emis_paid_on_time']
+    if LOAN_ID_COLUMN in df.columns:
+        columns[LOAN_ID_COLUMN] = 'source_loan_id'
+        integers.append('source_loan_id')
+    frame = _select_columns(df, columns)
+    for field in integers + ['loan_amount', 'interest_rate', 'monthly_repayment']:
+        frame[field] = pd.to_numeric(frame[field], errors='coerce')
+    for field in ('start_date', 'end_date'):
+        frame[field] = pd.to_datetime(frame[field], errors='coerce')
+    valid = frame.notna().all(axis=1)
+    valid &= frame['tenure'] > 0
+    valid &= frame['end_date'] >= frame['start_date']
+    frame = frame[valid].copy()
+    for field in integers:
+        frame[field] = frame[field].astype('int64')
+    for field in ('loan_amount', 'interest_rate', 'monthly_repayment'):
+        frame[field] = frame[field].astype('float64')
+    for field in ('start_date', 'end_date'):
+        frame[field] = frame[field].dt.date
+    mismatched = int(emi_mismatches(frame).sum())
+    if mismatched:
+        logger.warning("%s of %s loan rows have a monthly payment that differs from the computed EMI by more than %.0f%%.",
+                       mismatched, len(frame), EMI_MISMATCH_TOLERANCE * 100, extra={'event': 'emi_mismatch', 'rows': mismatched})
+    frame['source_hash'] = row_hashes(frame)
+    return frame, int((~valid).sum())
+
+
+def emi_mismatches(frame, tolerance=EMI_MISMATCH_TOLERANCE):
+    """Boolean mask of prepared loan rows whose monthly_repayment is off the computed EMI."""
+    expected = calculate_emis(frame['loan_amount'], frame['interest_rate'], frame['tenure'])
+    return np.abs(frame['monthly_repayment'].to_numpy() - expected) > tolerance * expected
+
+
+def resolve_customers(frame):
+    """
+    Drop loans whose customer does not exist, using one set-based lookup.
+    Returns (frame, missing_count).
+    """
+    wanted = frame['customer_id'].unique().tolist()
+    existing = set(Customer.objects.filter(id__in=wanted).values_list('id', flat=True))
+    known = frame['customer_id'].isin(existing)
+    return frame[known], int((~known).sum())
+
+
+def _copy_rows(model, frame):
+    """Stream a frame into the model's table with PostgreSQL COPY."""
+    # COPY bypasses model defaults and auto_now, so fill them in here
+    defaults = {
+        field.attname: field.get_default()
+        for field in model._meta.concrete_fields
+        if field.has_default() and field.attname not in frame.columns
+    }
+    frame = frame.assign(**defaults, updated_at=timezone.now())
+    buffer = io.StringIO()
+    frame.to_csv(buffer, index=False, header=False, quoting=csv.QUOTE_MINIMAL)
+    buffer.seek(0)
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(model._meta.get_field(field).column) for field in frame.columns)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def changed_rows(model, frame):
+    """
+    Drop rows whose natural key already exists with the same source_hash, using
+    one lookup for the batch's keys. Returns the rows that are new or changed.
+    """
+    keys = list(UPSERT_KEYS[model])
+    missing = [key for key in keys if key not in frame.columns]
+    if missing:
+        raise ValueError(f"Upsert needs source ID columns for {model.__name__}: {', '.join(missing)}")
+    if frame.empty:
+        return frame
+    lookup = {f'{key}__in': frame[key].unique().tolist() for key in keys}
+    existing = pd.DataFrame(
+        list(model.objects.filter(**lookup).values_list(*keys, 'source_hash')),
+        columns=keys + ['source_hash'],
+    )
+    # Rows written before hashing existed (source_hash NULL) always count as changed
+    existing = existing.dropna(subset=['source_hash'])
+    if existing.empty:
+        return frame
+    existing = existing.astype('int64')
+    merged = frame[keys + ['source_hash']].merge(existing, how='left', on=keys + ['source_hash'], indicator=True)
+    return frame[(merged['_merge'] == 'left_only').to_numpy()]
+
+
+def _upsert_rows(model, frame, batch_size):
+    """INSERT ... ON CONFLICT (natural key) DO UPDATE for a prepared frame."""
+    keys = UPSERT_KEYS[model]
+    # current_debt is derived state, recomputed after ingestion rather than taken from the sheet
+    update_fields = [field for field in frame.columns if field not in keys and field != 'current_debt'] + ['updated_at']
+    model.objects.bulk_create(
+        [model(**row) for row in frame.to_dict('records')],
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=[model._meta.get_field(key).name for key in keys],
+        update_fields=update_fields,
+    )
+
+
+def write_rows(model, frame, method='bulk_create', batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Write a prepared frame in batches of `batch_size` rows with bulk_create,
+    PostgreSQL COPY, or an upsert keyed on source IDs that skips rows whose
+    hash is unchanged. Returns the rows actually written, as a frame.
+    """
+    if method not in WRITE_METHODS:
+        raise ValueError(f"Unknown write method: {method}")
+    if method == 'copy' and connection.vendor != 'postgresql':
+        method = 'bulk_create'
+    written = []
+    for start in range(0, len(frame), batch_size):
+        batch = frame.iloc[start:start + batch_size]
+        with transaction.atomic():
+            if method == 'upsert':
+                batch = changed_rows(model, batch)
+                if not batch.empty:
+                    _upsert_rows(model, batch, batch_size)
+            elif method == 'copy':
+                _copy_rows(model, batch)
+            else:
+                model.objects.bulk_create(
+                    [model(**row) for row in batch.to_dict('records')], batch_size=batch_size
+                )
+        written.append(batch)
+    return pd.concat(written) if written else frame.iloc[:0]
+
+
+def reset_id_sequence(model):
+    """Move the table's ID sequence past explicitly inserted IDs (PostgreSQL)."""
+    statements = connection.ops.sequence_reset_sql(no_style(), [model])
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+def ingest_customer_batch(chunk, method='bulk_create', batch_size=DEFAULT_BATCH_SIZE):
+    """Validate and write one batch of customer rows. Returns a stats dict."""
+    customers, invalid = prepare_customers(chunk)
+    written = write_rows(Customer, customers, method=method, batch_size=batch_size)
+    if method == 'upsert' and not written.empty:
+        customer_ids = written['id'].tolist()
+        # Upserts can rewrite existing customers; invalidate the ETags and cached credit
+        # profiles (which hold the salary and approved limit) of those actually rewritten
+        bump_versions(Customer.objects.filter(id__in=customer_ids))
+        transaction.on_commit(lambda: credit_cache.invalidate(customer_ids))
+    return {
+        'rows': len(written), 'unchanged': len(customers) - len(written), 'invalid': invalid, 'missing_customers': 0,
+        'customer_ids': written['id'].tolist() if 'id' in written.columns else [],
+    }
+
+
+def ingest_loan_batch(chunk, method='bulk_create', batch_size=DEFAULT_BATCH_SIZE):
+    """Validate, resolve customers for and write one batch of loan rows. Returns a stats dict."""
+    loans, invalid = prepare_loans(chunk)
+    loans, missing = resolve_customers(loans)
+    written = write_rows(Loan, loans, method=method, batch_size=batch_size)
+    if not written.empty:
+        # The customers' loan lists changed; upserted loans keep their own version, so this also covers view-loan
+        bump_versions(Customer.objects.filter(id__in=written['customer_id'].unique().tolist()))
+    return {
+        'rows': len(written), 'unchanged': len(loans) - len(written), 'invalid': invalid, 'missing_customers': missing,
+        'customer_ids': written['customer_id'].unique().tolist(),
+    }
+
+
+BATCH_INGESTERS = {
+    'customers': ingest_customer_batch,
+    'loans': ingest_loan_batch,
+}
+
+
+def ingest_rows(kind, file_path, method='bulk_create', batch_size=DEFAULT_BATCH_SIZE, start=0, stop=None, progress=None):
+    """
+    Stream rows [start, stop) of a file through the ingester for `kind`, summing
+    batch stats; `customer_ids` lists the customers whose rows (or loans) were
+    written. `progress`, if given, is called with the running totals after
+    every batch.
+    """
+    ingest_batch = BATCH_INGESTERS[kind]
+    totals = {'rows': 0, 'unchanged': 0, 'invalid': 0, 'missing_customers': 0}
+    customer_ids = set()
+    for chunk in iter_batches(file_path, batch_size, start=start, stop=stop):
+        stats = ingest_batch(chunk, method=method, batch_size=batch_size)
+        customer_ids.update(stats.pop('customer_ids'))
+        for key, value in stats.items():
+            totals[key] += value
+        if progress is not None:
+            progress(dict(totals))
+    return {**totals, 'customer_ids': sorted(customer_ids)}
+
+
+def recompute_current_debt(customer_ids=None):
+    """
+    Set every customer's current_debt to the sum of their active loans with a
+    single UPDATE ... SET current_debt = (subquery). Optionally limited to
+    `customer_ids`. Rows whose debt is unchanged are left alone, so they keep
+    their updated_at. Returns the number of customers updated.
+    """
+    active_sum = (
+        Loan.objects.filter(customer=OuterRef('pk'), end_date__gte=date.today())
+        .values('customer')
+        .annotate(total=Sum('loan_amount'))
+        .values('total')
+    )
+    current_debt = Coalesce(Subquery(active_sum), 0, output_field=IntegerField())
+    customers = Customer.objects.exclude(current_debt=current_debt)
+    if customer_ids is not None:
+        customers = customers.filter(id__in=customer_ids)
+    return customers.update(current_debt=current_debt, version=F('version') + 1, updated_at=Now())
+
+
+def throughput(rows, started):
+    """Return (elapsed_seconds, rows_per_second) since `started` (a perf_counter value)."""
+    elapsed = time.perf_counter() - started
+    return elapsed, (rows / elapsed if elapsed > 0 else float(rows))
@@ -0,0 +1,120 @@
+"""
+Background ingestion jobs started by file upload.
+
+An uploaded file is saved under settings.INGESTION_UPLOAD_DIR (shared with the
+Celery workers) until its job finishes or fails, and the job's progress record
+is kept in the default cache, which is Redis under docker-compose. The worker
+publishes running totals after every batch, so any web process can answer a
+status poll with one cache read.
+"""
+import logging
+import os
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+JOB_TTL = 7 * 24 * 3600
+MAX_JOB_ERRORS = 20
+UPLOAD_EXTENSIONS = ('.xlsx', '.csv', '.parquet')
+
+
+def job_key(job_id):
+    return f'ingestion-job:{job_id}'
+
+
+def create_job(kind, file_name):
+    """Record a new queued job and return it."""
+    job = {
+        'job_id': uuid.uuid4().hex,
+        'kind': kind,
+        'file_name': file_name,
+        'status': 'queued',
+        'rows': 0,
+        'unchanged': 0,
+        'invalid': 0,
+        'missing_customers': 0,
+        'seconds': 0.0,
+        'rows_per_sec': 0.0,
+        'errors': [],
+        'created_at': timezone.now().isoformat(),
+        'finished_at': None,
+    }
+    cache.set(job_key(job['job_id']), job, JOB_TTL)
+    return job
+
+
+def get_job(job_id):
+    return cache.get(job_key(job_id))
+
+
+def update_job(job_id, error=None, **fields):
+    """
+    Merge `fields` (and an `error` message, if given) into a job's record.
+    Only the worker running the job writes to it once it has started, so a
+    read-modify-write is safe. Cache failures are logged, never raised: the
+    ingestion itself must not fail because its progress could not be published.
+    """
+    try:
+        job = get_job(job_id) or {'job_id': job_id, 'errors': []}
+        job.update(fields)
+        if error is not None:
+            job['errors'] = (job.get('errors', []) + [error])[-MAX_JOB_ERRORS:]
+        cache.set(job_key(job_id), job, JOB_TTL)
+        return job
+    except Exception:
+        logger.exception("Could not update ingestion job %s.", job_id, extra={'event': 'job_update_failed', 'job_id': job_id})
+        return None
+
+
+@contextmanager
+def track_job(job_id, file_path=None):
+    """
+    Mark a job running for the duration of the block, and failed if the block
+    raises. The job's uploaded file is deleted when the block exits either way.
+    """
+    if job_id is None:
+        yield
+        return
+    update_job(job_id, status='running')
+    try:
+        yield
+    except Exception as exc:
+        update_job(job_id, status='failed', finished_at=timezone.now().isoformat(), error=f'{type(exc).__name__}: {exc}')
+        raise
+    finally:
+        if file_path is not None:
+            remove_upload(file_path)
+
+
+def finish_job(job_id, stats):
+    if job_id is not None:
+        update_job(job_id, status='finished', finished_at=timezone.now().isoformat(), **stats)
+
+
+def save_upload(job_id, upload):
+    """Write an uploaded file to the upload directory in chunks; returns its path."""
+    directory = settings.INGESTION_UPLOAD_DIR
+    os.makedirs(directory, exist_ok=True)
+    extension = os.path.splitext(upload.name)[1].lower()
+    path = os.path.join(directory, f'{job_id}{extension}')
+    with open(path, 'wb') as handle:
+        for chunk in upload.chunks():
+            handle.write(chunk)
+    return path
+
+
+def remove_upload(path):
+    """Delete a saved upload. Paths outside INGESTION_UPLOAD_DIR are never touched."""
+    if os.path.dirname(os.path.realpath(path)) != os.path.realpath(settings.INGESTION_UPLOAD_DIR):
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        logger.exception("Could not delete upload %s.", path, extra={'event': 'upload_delete_failed'})
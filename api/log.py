@@ -0,0 +1,151 @@
+"""
+Structured logging for the api app.
+
+Log calls pass %-style arguments and `extra` fields rather than f-strings, so
+nothing is formatted for records that are filtered out. Records are rendered
+as one JSON object per line by JSONFormatter, tagged with the ID of the request
+being served. High-volume info events are marked `extra={'sampled': True}` and
+kept at LOG_SAMPLE_RATE by SampledFilter. QueueStreamHandler moves
+formatting and I/O onto a background thread, which is started again in forked
+children such as Celery's prefork workers.
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+_request_id = contextvars.ContextVar('request_id', default=None)
+
+# Attributes every LogRecord has; anything else on a record came from `extra`
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'sampled'}
+
+
+def set_request_id(request_id):
+    """Tag log records from this context with `request_id`; returns a token for reset_request_id."""
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+class RequestIDFilter(logging.Filter):
+    """Copy the current request ID onto each record."""
+
+    def filter(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = _request_id.get()
+        return True
+
+
+class SampledFilter(logging.Filter):
+    """Keep a fraction `rate` of records logged below WARNING with extra={'sampled': True}."""
+
+    def __init__(self, rate=1.0, name=''):
+        super().__init__(name)
+        self.rate = float(rate)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not getattr(record, 'sampled', False):
+            return True
+        return random.random() < self.rate
+
+
+class JSONFormatter(logging.Formatter):
+    """Render a record as a single-line JSON object including its `extra` fields."""
+
+    def format(self, record):
+        entry = {
+            'timestamp': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _DrainingQueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for room rather than failing when stopped with a full queue
+        self.queue.put(self._sentinel)
+
+
+class QueueStreamHandler(QueueHandler):
+    """
+    Hand records to a background thread that formats them and writes them to
+    `stream`, so logging never blocks a request. When the queue is full the
+    record is dropped and counted in `dropped` rather than waiting.
+    """
+
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.target = logging.StreamHandler(stream)
+        self.dropped = 0
+        self._start_lock = threading.Lock()
+        self._start_listener()
+        atexit.register(self.stop_listener)
+
+    def _start_listener(self):
+        self.listener = _DrainingQueueListener(self.queue, self.target)
+        self.listener.start()
+        self._listening = True
+        self._pid = os.getpid()
+
+    def _ensure_listener(self):
+        """
+        A forked child inherits the queue but not the listener thread: give it
+        a fresh queue (the parent's may have been locked mid-operation) and
+        start a listener of its own.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self.queue = queue.Queue(self.queue.maxsize)
+                self._start_listener()
+
+    def setFormatter(self, fmt):
+        # Formatting happens on the listener thread
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Resolve the message now, since its arguments may change after the call returns,
+        # but leave JSON rendering and traceback formatting to the listener
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop_listener(self):
+        """Flush queued records and stop the listener thread; safe to call twice."""
+        # A forked child that never logged has no listener of its own to stop
+        if self._listening and self._pid == os.getpid():
+            self._listening = False
+            self.listener.stop()
+
+    def close(self):
+        self.stop_listener()
+        super().close()
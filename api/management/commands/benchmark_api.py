@@ -0,0 +1,70 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmark import (
+    DEFAULT_MIX,
+    ENDPOINTS,
+    create_dataset,
+    delete_dataset,
+    foreign_writes,
+    generate_requests,
+    load_requests,
+    parse_mix,
+    run_benchmark,
+)
+
+class Command(BaseCommand):
+    help = ('Replay a request mix against register, check-eligibility, create-loan and view-loans in-process '
+            'and report latency percentiles, throughput and query counts per endpoint as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=1000, help='Synthetic customers to create.')
+        parser.add_argument('--loans', type=int, default=5000, help='Synthetic loans spread over those customers.')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests to generate from --mix.')
+        parser.add_argument('--mix', default=','.join(f'{endpoint}={weight}' for endpoint, weight in DEFAULT_MIX.items()),
+                            help=f"Weighted endpoint mix, e.g. 'check-eligibility=9,view-loans=1'. Endpoints: {', '.join(ENDPOINTS)}.")
+        parser.add_argument('--replay', metavar='FILE',
+                            help='Replay requests from a JSON Lines file of {"endpoint": ..., "data": {...}} objects '
+                                 'instead of generating them. view-loans entries need data.customer_id.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Client threads, each with its own connection.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', metavar='FILE', help='Also write the JSON report to this file.')
+        parser.add_argument('--keep-data', action='store_true', help='Leave the synthetic dataset in the database.')
+        parser.add_argument('--allow-writes', action='store_true',
+                            help='Let --replay create loans for existing customers. Those loans, and the debt and '
+                                 'snapshot changes they cause, are not removed afterwards.')
+
+    def handle(self, *args, **options):
+        try:
+            mix = parse_mix(options['mix'])
+        except ValueError as exc:
+            raise CommandError(exc)
+        if options['replay']:
+            try:
+                requests = load_requests(options['replay'])
+            except ValueError as exc:
+                raise CommandError(exc)
+        customer_ids = create_dataset(options['customers'], options['loans'], seed=options['seed'])
+        registered = []
+        try:
+            if options['replay']:
+                writes = foreign_writes(requests, customer_ids)
+                if writes and not options['allow_writes']:
+                    raise CommandError(
+                        f"{len(writes)} replayed create-loan requests target existing customers, and the loans they "
+                        "create would not be cleaned up. Pass --allow-writes to replay them anyway."
+                    )
+            else:
+                requests = generate_requests(customer_ids, options['requests'], mix=mix, seed=options['seed'])
+            report = run_benchmark(requests, concurrency=options['concurrency'], registered=registered)
+        finally:
+            if not options['keep_data']:
+                delete_dataset(customer_ids + registered)
+        report['dataset'] = {'customers': options['customers'], 'loans': options['loans']}
+        report['concurrency'] = options['concurrency']
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(output + '\n')
+        self.stdout.write(output)
@@ -0,0 +1,42 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from api.amortization import amortization_schedule, calculate_emis
+from api.utils import calculate_emi
+
+class Command(BaseCommand):
+    help = 'Benchmark the vectorised EMI calculator against the scalar calculate_emi'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=100000, help='Number of loans to quote.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        size = options['size']
+        principal = rng.integers(10000, 5000000, size).astype(float)
+        annual_rate = np.round(rng.uniform(0, 24, size), 2)
+        tenure = rng.integers(1, 360, size)
+
+        started = time.perf_counter()
+        scalar = [calculate_emi(p, r, n) for p, r, n in zip(principal.tolist(), annual_rate.tolist(), tenure.tolist())]
+        scalar_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        vectorised = calculate_emis(principal, annual_rate, tenure)
+        vector_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        amortization_schedule(principal[:10000], annual_rate[:10000], tenure[:10000])
+        schedule_seconds = time.perf_counter() - started
+
+        mismatches = int(np.count_nonzero(np.asarray(scalar) != vectorised))
+        self.stdout.write(f"scalar:     {scalar_seconds:.4f}s ({size / scalar_seconds:,.0f} EMIs/sec)")
+        self.stdout.write(f"vectorised: {vector_seconds:.4f}s ({size / vector_seconds:,.0f} EMIs/sec), {scalar_seconds / vector_seconds:.1f}x faster")
+        self.stdout.write(f"schedules:  {schedule_seconds:.4f}s for {min(size, 10000)} loans")
+        if mismatches:
+            self.stdout.write(self.style.ERROR(f"{mismatches} EMIs differ from the scalar result."))
+        else:
+            self.stdout.write(self.style.SUCCESS('Vectorised EMIs match the scalar results exactly.'))
@@ -0,0 +1,24 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from api.benchmark import benchmark_loan_rendering, create_dataset, delete_dataset
+
+class Command(BaseCommand):
+    help = ('Compare the CPU time of building and rendering a large view-loans response from model instances '
+            'with DRF\'s JSON renderer against values_list() rows with the orjson renderer, and report it as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loans', type=int, default=5000, help='Loans to give the synthetic customer.')
+        parser.add_argument('--repeat', type=int, default=20, help='Renders to time for each path.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep-data', action='store_true', help='Leave the synthetic dataset in the database.')
+
+    def handle(self, *args, **options):
+        customer_ids = create_dataset(1, options['loans'], seed=options['seed'])
+        try:
+            report = benchmark_loan_rendering(customer_ids[0], repeat=options['repeat'])
+        finally:
+            if not options['keep_data']:
+                delete_dataset(customer_ids)
+        self.stdout.write(json.dumps(report, indent=2))
@@ -1,11 +1,45 @@
+from celery import chain
 from django.core.management.base import BaseCommand
-from api.tasks import ingest_customer_data, ingest_loan_data
+from api.ingestion import DEFAULT_BATCH_SIZE, DEFAULT_SHARD_SIZE, WRITE_METHODS
+from api.tasks import build_parallel_ingestion, ingest_customer_data, ingest_loan_data
+
+CUSTOMER_FILE = 'customer_data.xlsx'
+LOAN_FILE = 'loan_data.xlsx'
 
 class Command(BaseCommand):
     help = 'Ingest data from Excel files'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--method', choices=WRITE_METHODS, default='bulk_create',
+                            help='Write batches with bulk_create, PostgreSQL COPY, or upsert on source IDs '
+                                 '(idempotent; unchanged rows are skipped).')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--parallel', action='store_true',
+                            help='Split the files into shards and ingest them across Celery workers. '
+                                 'Re-running resumes from the last completed shard.')
+        parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE)
+
     def handle(self, *args, **options):
+        if options['parallel']:
+            self.queue_parallel(options)
+            return
         # Call the ingestion functions directly (not as Celery tasks)
-        ingest_customer_data('customer_data.xlsx')
-        ingest_loan_data('loan_data.xlsx')
-        self.stdout.write(self.style.SUCCESS('Data ingestion completed directly.')) 
\ No newline at end of file
+        for label, task, file_path in (
+            ('customers', ingest_customer_data, CUSTOMER_FILE),
+            ('loans', ingest_loan_data, LOAN_FILE),
+        ):
+            stats = task(file_path, method=options['method'], batch_size=options['batch_size'])
+            self.stdout.write(f"{label}: {stats['rows']} rows in {stats['seconds']:.2f}s ({stats['rows_per_sec']:.0f} rows/sec), {stats['unchanged']} unchanged")
+        self.stdout.write(self.style.SUCCESS('Data ingestion completed directly.'))
+
+    def queue_parallel(self, options):
+        # Customers must be in place before any loan shard resolves its customer IDs
+        workflow = chain(*(
+            build_parallel_ingestion(
+                kind, file_path,
+                shard_size=options['shard_size'], method=options['method'], batch_size=options['batch_size'],
+            )
+            for kind, file_path in (('customers', CUSTOMER_FILE), ('loans', LOAN_FILE))
+        ))
+        result = workflow.apply_async()
+        self.stdout.write(self.style.SUCCESS(f'Parallel ingestion queued (task {result.id}).'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from api.ingestion import DEFAULT_BATCH_SIZE
+from api.tasks import ingest_payment_data
+
+class Command(BaseCommand):
+    help = 'Append EMI payments (loan_id, payment_date, amount) from a .csv, .xlsx or .parquet file to the payment ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument('file_path', help='Payments file with loan_id, payment_date and amount columns.')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Rows recorded per transaction.')
+        parser.add_argument('--async', dest='run_async', action='store_true',
+                            help='Queue the job on a Celery worker instead of running it here.')
+
+    def handle(self, *args, **options):
+        if options['run_async']:
+            result = ingest_payment_data.delay(options['file_path'], batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Payment ingestion queued (task {result.id}).'))
+            return
+        stats = ingest_payment_data(options['file_path'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Recorded {stats['rows']} payments ({stats['on_time']} on time, {stats['late']} late) "
+            f"in {stats['seconds']:.2f}s ({stats['rows_per_sec']:.0f} rows/sec). Skipped {stats['missing_loans']} "
+            f"for unknown loans, {stats['repaid_loans']} for repaid loans and {stats['invalid']} invalid rows."
+        ))
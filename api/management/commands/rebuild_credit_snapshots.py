@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.snapshots import REBUILD_CHUNK_SIZE, refresh_credit_snapshots
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-customer credit snapshot table from the Loan table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('customer_ids', nargs='*', type=int,
+                            help='Only rebuild these customers (default: all).')
+        parser.add_argument('--chunk-size', type=int, default=REBUILD_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written = refresh_credit_snapshots(options['customer_ids'] or None, chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} credit snapshots in {elapsed:.2f}s.'))
@@ -0,0 +1,190 @@
+"""
+Per-endpoint request metrics: latency, database query count and time, and
+response serialization time, kept as in-process histograms and rendered in
+the Prometheus text exposition format.
+
+Like the credit cache counters these are per process; Prometheus sums them
+across workers when each worker is scraped, or use one worker per scrape target.
+"""
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+DEFAULTS = {
+    'ENABLED': True,
+    'SERVER_TIMING': False,
+}
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+# The RequestMetrics of the request being handled. A context variable rather
+# than a thread-local so queries run via sync_to_async from async views count too.
+_current_request = contextvars.ContextVar('request_metrics', default=None)
+
+
+def metrics_settings():
+    return {**DEFAULTS, **getattr(settings, 'CREDIT_METRICS', {})}
+
+
+class RequestMetrics:
+    """Timings gathered while handling one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.render_started = None
+        self.serialization_seconds = None
+
+    def rendered(self, response):
+        if self.render_started is not None:
+            self.serialization_seconds = time.perf_counter() - self.render_started
+
+
+def record_queries(execute, sql, params, many, context):
+    """Database execute wrapper adding each query's count and time to the current request."""
+    request_metrics = _current_request.get()
+    if request_metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        request_metrics.db_queries += 1
+        request_metrics.db_seconds += time.perf_counter() - started
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """connection_created receiver: wrap every new database connection with record_queries."""
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
+
+
+def start_request():
+    """Begin collecting metrics for a request; returns (RequestMetrics, token for end_request)."""
+    request_metrics = RequestMetrics()
+    return request_metrics, _current_request.set(request_metrics)
+
+
+def end_request(token):
+    _current_request.reset(token)
+
+
+def current_request_metrics():
+    """The RequestMetrics being collected in this context, or None."""
+    return _current_request.get()
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label tuple."""
+
+    def __init__(self, name, help_text, buckets, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.label_names = label_names
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0, 0.0]
+            counts = series[0]
+            # Count the observation in its own bucket; render() accumulates
+            index = bisect_left(self.buckets, value)
+            if index < len(counts):
+                counts[index] += 1
+            series[1] += 1
+            series[2] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((labels, [list(counts), total, value_sum]) for labels, (counts, total, value_sum) in self._series.items())
+        for labels, (counts, total, value_sum) in series:
+            label_text = ','.join(f'{name}="{value}"' for name, value in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {total}')
+            lines.append(f'{self.name}_count{{{label_text}}} {total}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {value_sum}')
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter:
+    """Monotonic counter with one series per label tuple."""
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            series = sorted(self._series.items())
+        for labels, value in series:
+            label_text = ','.join(f'{name}="{value}"' for name, value in zip(self.label_names, labels))
+            lines.append(f'{self.name}{{{label_text}}} {value}')
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+REQUESTS = Counter('credit_http_requests_total', 'Requests handled, by endpoint and status code.', ('endpoint', 'method', 'status'))
+REQUEST_SECONDS = Histogram('credit_http_request_duration_seconds', 'Time to produce the response, by endpoint.', SECONDS_BUCKETS, ('endpoint', 'method'))
+DB_QUERIES = Histogram('credit_http_db_queries', 'SQL queries issued per request, by endpoint.', QUERY_BUCKETS, ('endpoint', 'method'))
+DB_SECONDS = Histogram('credit_http_db_duration_seconds', 'Time spent executing SQL per request, by endpoint.', SECONDS_BUCKETS, ('endpoint', 'method'))
+SERIALIZATION_SECONDS = Histogram('credit_http_serialization_duration_seconds', 'Time spent rendering the response body, by endpoint.', SECONDS_BUCKETS, ('endpoint', 'method'))
+METRICS = (REQUESTS, REQUEST_SECONDS, DB_QUERIES, DB_SECONDS, SERIALIZATION_SECONDS)
+
+
+def observe_request(endpoint, method, status, request_metrics, total_seconds):
+    labels = (endpoint, method)
+    REQUESTS.inc((endpoint, method, str(status)))
+    REQUEST_SECONDS.observe(labels, total_seconds)
+    DB_QUERIES.observe(labels, request_metrics.db_queries)
+    DB_SECONDS.observe(labels, request_metrics.db_seconds)
+    if request_metrics.serialization_seconds is not None:
+        SERIALIZATION_SECONDS.observe(labels, request_metrics.serialization_seconds)
+
+
+def server_timing(request_metrics, total_seconds):
+    """Server-Timing header value (durations in milliseconds)."""
+    parts = [f'db;dur={request_metrics.db_seconds * 1000:.2f};desc="{request_metrics.db_queries} queries"']
+    if request_metrics.serialization_seconds is not None:
+        parts.append(f'render;dur={request_metrics.serialization_seconds * 1000:.2f}')
+    parts.append(f'total;dur={total_seconds * 1000:.2f}')
+    return ', '.join(parts)
+
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def clear_metrics():
+    for metric in METRICS:
+        metric.clear()
@@ -0,0 +1,110 @@
+import time
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .log import reset_request_id, set_request_id
+from .metrics import current_request_metrics, end_request, metrics_settings, observe_request, server_timing, start_request
+
+
+class RequestMetricsMiddleware:
+    """
+    Record latency, SQL query count and time, and response rendering time for
+    each request, labelled by URL name, and optionally report them to the
+    client in a Server-Timing header (CREDIT_METRICS['SERVER_TIMING']).
+    Works in both WSGI and ASGI stacks.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        options = metrics_settings()
+        self.enabled = options['ENABLED']
+        self.server_timing = options['SERVER_TIMING']
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self._acall(request)
+        if not self.enabled:
+            return self.get_response(request)
+        request_metrics, token = start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request(token)
+        return self._finish(request, response, request_metrics)
+
+    async def _acall(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        request_metrics, token = start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_request(token)
+        return self._finish(request, response, request_metrics)
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered right after this hook; time it to the post-render callback
+        request_metrics = current_request_metrics()
+        if request_metrics is not None:
+            request_metrics.render_started = time.perf_counter()
+            response.add_post_render_callback(request_metrics.rendered)
+        return response
+
+    def _finish(self, request, response, request_metrics):
+        total_seconds = time.perf_counter() - request_metrics.started
+        match = request.resolver_match
+        endpoint = match.url_name if match is not None and match.url_name else 'unmatched'
+        if endpoint != 'metrics':
+            observe_request(endpoint, request.method, response.status_code, request_metrics, total_seconds)
+        if self.server_timing:
+            response['Server-Timing'] = server_timing(request_metrics, total_seconds)
+        return response
+
+
+class RequestIDMiddleware:
+    """
+    Tag every log record written while handling a request with a request ID,
+    taken from the X-Request-ID header when the client (or a proxy) sends one,
+    and echo it back in the response's X-Request-ID header.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self._acall(request)
+        request_id = self._request_id(request)
+        token = set_request_id(request_id)
+        try:
+            response = self.get_response(request)
+        finally:
+            reset_request_id(token)
+        response['X-Request-ID'] = request_id
+        return response
+
+    async def _acall(self, request):
+        request_id = self._request_id(request)
+        token = set_request_id(request_id)
+        try:
+            response = await self.get_response(request)
+        finally:
+            reset_request_id(token)
+        response['X-Request-ID'] = request_id
+        return response
+
+    @staticmethod
+    def _request_id(request):
+        # Bounded so a client cannot stuff arbitrary data into every log line
+        return request.headers.get('X-Request-ID', '')[:64] or uuid.uuid4().hex
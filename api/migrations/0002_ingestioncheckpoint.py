@@ -0,0 +1,28 @@
+# Generated by Django 4.2.23 on 2026-10-17 04:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job_key', models.CharField(max_length=64)),
+                ('kind', models.CharField(max_length=16)),
+                ('start_row', models.IntegerField()),
+                ('end_row', models.IntegerField()),
+                ('rows_written', models.IntegerField(default=0)),
+                ('completed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('job_key', 'kind', 'start_row')},
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.23 on 2026-10-17 04:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_ingestioncheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='source_hash',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='source_hash',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='source_loan_id',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='loan',
+            constraint=models.UniqueConstraint(fields=('customer', 'source_loan_id'), name='unique_source_loan_per_customer'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.23 on 2026-10-17 05:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_source_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerCreditSnapshot',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='credit_snapshot', serialize=False, to='api.customer')),
+                ('total_emis_paid_on_time', models.IntegerField(default=0)),
+                ('num_loans_taken', models.IntegerField(default=0)),
+                ('loans_per_year', models.JSONField(default=dict)),
+                ('loan_approved_volume', models.FloatField(default=0)),
+                ('active_loan_sum', models.FloatField(default=0)),
+                ('active_emi_sum', models.FloatField(default=0)),
+                ('active_until', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
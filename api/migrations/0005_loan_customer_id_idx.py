@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-17 06:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_customercreditsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['customer', 'id'], name='loan_customer_id_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.23 on 2026-10-17 06:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_loan_customer_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['customer', 'end_date'], include=('loan_amount', 'monthly_repayment'), name='loan_customer_end_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['customer', 'start_date'], name='loan_customer_start_date_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.23 on 2026-10-17 04:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_loan_scoring_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerCreditScore',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='portfolio_score', serialize=False, to='api.customer')),
+                ('credit_score', models.FloatField()),
+                ('band', models.SmallIntegerField()),
+                ('min_rate', models.FloatField()),
+                ('can_borrow', models.BooleanField()),
+                ('rules_version', models.IntegerField()),
+                ('computed_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['band', 'credit_score'], name='credit_score_band_idx')],
+            },
+        ),
+    ]
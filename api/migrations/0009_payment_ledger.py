@@ -0,0 +1,27 @@
+# Generated by Django 4.2.23 on 2026-10-17 04:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='emis_paid_late',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='on_time',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['loan', 'payment_date'], name='payment_loan_date_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.23 on 2026-10-17 04:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_payment_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='loan',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -1,8 +1,23 @@
 from django.db import models
 
+from .versions import bump_versions
+
 # Create your models here.
 
-class Customer(models.Model):
+class VersionedSaveMixin:
+    """Advance `version` (and updated_at) on every save() of an existing row."""
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if not self._state.adding and update_fields != [] and not hasattr(self.__dict__.get('version'), 'resolve_expression'):
+            self.version = models.F('version') + 1
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'version', 'updated_at'}
+        super().save(*args, **kwargs)
+        if hasattr(self.__dict__.get('version'), 'resolve_expression'):
+            # Deferred, so the new value is loaded on next access
+            del self.__dict__['version']
+
+class Customer(VersionedSaveMixin, models.Model):
     first_name = models.CharField(max_length=255)
     last_name = models.CharField(max_length=255)
     age = models.IntegerField()
@@ -10,18 +25,118 @@ class Customer(models.Model):
     phone_number = models.CharField(max_length=20)
     approved_limit = models.IntegerField()
     current_debt = models.IntegerField(default=0)
+    # Hash of the ingested spreadsheet row, used to skip unchanged rows on re-import
+    source_hash = models.BigIntegerField(null=True, blank=True)
+    # Last write, for incremental exports; bulk updates must set it explicitly
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Advanced (with updated_at) whenever the customer or any of their loans changes; backs the loan views' ETags
+    version = models.PositiveIntegerField(default=1)
 
-class Loan(models.Model):
+class Loan(VersionedSaveMixin, models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE)
     loan_amount = models.FloatField()
     tenure = models.IntegerField()
     interest_rate = models.FloatField()
     monthly_repayment = models.FloatField()
     emis_paid_on_time = models.IntegerField()
+    # Instalments paid after their due date, counted as payments are recorded
+    emis_paid_late = models.IntegerField(default=0)
     start_date = models.DateField()
     end_date = models.DateField()
+    # Loan ID from the source spreadsheet; unique per customer, not globally
+    source_loan_id = models.IntegerField(null=True, blank=True)
+    source_hash = models.BigIntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Advanced (with updated_at) whenever the loan changes
+    version = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['customer', 'source_loan_id'], name='unique_source_loan_per_customer'),
+        ]
+        indexes = [
+            # Keyset pagination of a customer's loans: WHERE customer_id = %s AND id > %s ORDER BY id
+            models.Index(fields=['customer', 'id'], name='loan_customer_id_idx'),
+            # Active-loan lookups (end_date >= today) per customer; the included columns let the
+            # active loan and EMI sums be answered from the index alone
+            models.Index(
+                fields=['customer', 'end_date'],
+                include=['loan_amount', 'monthly_repayment'],
+                name='loan_customer_end_date_idx',
+            ),
+            # Loans started in a date range per customer (current-year activity)
+            models.Index(fields=['customer', 'start_date'], name='loan_customer_start_date_idx'),
+        ]
+
+    def save(self, *args, bump_customer=True, **kwargs):
+        super().save(*args, **kwargs)
+        if bump_customer:
+            # The customer's loan list changed
+            bump_versions(Customer.objects.filter(id=self.customer_id))
+
+    def delete(self, *args, **kwargs):
+        customer_id = self.customer_id
+        result = super().delete(*args, **kwargs)
+        bump_versions(Customer.objects.filter(id=customer_id))
+        return result
 
 class Payment(models.Model):
     loan = models.ForeignKey(Loan, on_delete=models.CASCADE)
     payment_date = models.DateField()
     amount = models.FloatField()
+    # Whether the instalment this payment settled was paid by its due date
+    on_time = models.BooleanField(default=True)
+
+    class Meta:
+        indexes = [
+            # A loan's payments in date order, however large the ledger grows
+            models.Index(fields=['loan', 'payment_date'], name='payment_loan_date_idx'),
+        ]
+
+class IngestionCheckpoint(models.Model):
+    """A row-range shard of an ingestion job that has been fully committed."""
+    job_key = models.CharField(max_length=64)
+    kind = models.CharField(max_length=16)
+    start_row = models.IntegerField()
+    end_row = models.IntegerField()
+    rows_written = models.IntegerField(default=0)
+    completed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('job_key', 'kind', 'start_row')
+
+class CustomerCreditSnapshot(models.Model):
+    """Precomputed credit scoring inputs for a customer, maintained as loans are written."""
+    customer = models.OneToOneField(Customer, on_delete=models.CASCADE, primary_key=True, related_name='credit_snapshot')
+    total_emis_paid_on_time = models.IntegerField(default=0)
+    num_loans_taken = models.IntegerField(default=0)
+    # Loan count per start year, keyed by the year as a string
+    loans_per_year = models.JSONField(default=dict)
+    loan_approved_volume = models.FloatField(default=0)
+    active_loan_sum = models.FloatField(default=0)
+    active_emi_sum = models.FloatField(default=0)
+    # Earliest end date among active loans; the active sums are stale after it
+    active_until = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def is_fresh(self, today):
+        return self.active_until is None or today <= self.active_until
+
+
+class CustomerCreditScore(models.Model):
+    """Credit score and approval band from the latest portfolio scoring run."""
+    customer = models.OneToOneField(Customer, on_delete=models.CASCADE, primary_key=True, related_name='portfolio_score')
+    credit_score = models.FloatField()
+    # Index of the customer's slab in the rules' threshold table (0 = lowest scores)
+    band = models.SmallIntegerField()
+    # Lowest interest rate the band accepts
+    min_rate = models.FloatField()
+    # False when the band rejects every loan or current EMIs exceed the salary cap
+    can_borrow = models.BooleanField()
+    rules_version = models.IntegerField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['band', 'credit_score'], name='credit_score_band_idx'),
+        ]
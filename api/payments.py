@@ -0,0 +1,133 @@
+"""
+The payment ledger: EMI payments recorded against loans.
+
+Each payment settles its loan's next unpaid instalment. Instalment k falls due
+INSTALMENT_DAYS * k days after the loan's start date (the 30-day months
+create-loan uses for end_date), and a payment made on or before that day is on
+time. Payments are appended to the ledger; the loans' emis_paid_on_time and
+emis_paid_late counters and the customers' credit snapshots are advanced with
+F() expressions rather than recounted from the ledger.
+"""
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+import pandas as pd
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Now
+
+from .ingestion import DEFAULT_BATCH_SIZE, iter_batches, throughput
+from .db_router import pin_customers
+from .models import Customer, Loan, Payment
+from .snapshots import record_payments_on_time
+from .versions import bump_versions
+
+INSTALMENT_DAYS = 30
+PAYMENT_COLUMNS = ('loan_id', 'payment_date', 'amount')
+
+
+def instalment_due_date(start_date, number):
+    """Due date of a loan's `number`th instalment (1-based)."""
+    return start_date + timedelta(days=INSTALMENT_DAYS * number)
+
+
+def increments(counts):
+    """CASE pk WHEN ... THEN n: the per-row amount to add, from {pk: n}."""
+    return Case(
+        *(When(pk=pk, then=Value(count)) for pk, count in counts.items()),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def record_payments(payments, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Record (loan_id, payment_date, amount) payments in one transaction. The
+    affected loans are locked so concurrent payments settle distinct instalments.
+    Payments against unknown loans, or against loans already fully repaid, are
+    skipped. Returns (created Payment rows, loans by id with their counters as
+    updated, stats).
+    """
+    payments = sorted(payments, key=lambda payment: (payment[0], payment[1]))
+    stats = {'recorded': 0, 'on_time': 0, 'late': 0, 'missing_loans': 0, 'repaid_loans': 0}
+    with transaction.atomic():
+        loans = {
+            loan.id: loan
+            for loan in Loan.objects.select_for_update()
+            .filter(id__in={payment[0] for payment in payments})
+            .only('id', 'customer_id', 'tenure', 'start_date', 'emis_paid_on_time', 'emis_paid_late')
+            .order_by('id')
+        }
+        rows = []
+        on_time_by_loan = Counter()
+        late_by_loan = Counter()
+        on_time_by_customer = defaultdict(int)
+        for loan_id, payment_date, amount in payments:
+            loan = loans.get(loan_id)
+            if loan is None:
+                stats['missing_loans'] += 1
+                continue
+            paid = loan.emis_paid_on_time + loan.emis_paid_late
+            if paid >= loan.tenure:
+                stats['repaid_loans'] += 1
+                continue
+            on_time = payment_date <= instalment_due_date(loan.start_date, paid + 1)
+            rows.append(Payment(loan_id=loan_id, payment_date=payment_date, amount=amount, on_time=on_time))
+            if on_time:
+                loan.emis_paid_on_time += 1
+                on_time_by_loan[loan_id] += 1
+                on_time_by_customer[loan.customer_id] += 1
+                stats['on_time'] += 1
+            else:
+                loan.emis_paid_late += 1
+                late_by_loan[loan_id] += 1
+                stats['late'] += 1
+        if rows:
+            Payment.objects.bulk_create(rows, batch_size=batch_size)
+            Loan.objects.filter(id__in=on_time_by_loan.keys() | late_by_loan.keys()).update(
+                emis_paid_on_time=F('emis_paid_on_time') + increments(on_time_by_loan),
+                emis_paid_late=F('emis_paid_late') + increments(late_by_loan),
+                version=F('version') + 1,
+                updated_at=Now(),
+            )
+            customer_ids = {loans[loan_id].customer_id for loan_id in on_time_by_loan.keys() | late_by_loan.keys()}
+            bump_versions(Customer.objects.filter(id__in=customer_ids))
+            record_payments_on_time(on_time_by_customer)
+            pin_customers(customer_ids)
+        stats['recorded'] = len(rows)
+    return rows, loans, stats
+
+
+def prepare_payments(df):
+    """Validate a batch of payment rows; returns (list of (loan_id, date, amount), invalid row count)."""
+    missing = [column for column in PAYMENT_COLUMNS if column not in df.columns]
+    if missing:
+        raise ValueError(f"Payment file is missing columns: {', '.join(missing)}")
+    frame = pd.DataFrame({
+        'loan_id': pd.to_numeric(df['loan_id'], errors='coerce'),
+        'payment_date': pd.to_datetime(df['payment_date'], errors='coerce').dt.date,
+        'amount': pd.to_numeric(df['amount'], errors='coerce'),
+    })
+    valid = frame.notna().all(axis=1) & (frame['amount'] > 0)
+    frame = frame[valid]
+    payments = list(zip(frame['loan_id'].astype('int64').tolist(), frame['payment_date'].tolist(), frame['amount'].tolist()))
+    return payments, int((~valid).sum())
+
+
+def ingest_payments(file_path, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Append payments from a file with loan_id, payment_date and amount columns
+    (.csv, .xlsx or .parquet), one transaction per batch.
+    """
+    started = time.perf_counter()
+    totals = {'rows': 0, 'invalid': 0, 'on_time': 0, 'late': 0, 'missing_loans': 0, 'repaid_loans': 0}
+    for chunk in iter_batches(file_path, batch_size):
+        payments, invalid = prepare_payments(chunk)
+        _, _, stats = record_payments(payments, batch_size=batch_size)
+        totals['rows'] += stats['recorded']
+        totals['invalid'] += invalid
+        for key in ('on_time', 'late', 'missing_loans', 'repaid_loans'):
+            totals[key] += stats[key]
+    elapsed, rate = throughput(totals['rows'], started)
+    return {**totals, 'seconds': elapsed, 'rows_per_sec': rate}
@@ -0,0 +1,43 @@
+"""
+JSON rendering with orjson.
+
+ORJSONRenderer replaces DRF's JSONRenderer (see REST_FRAMEWORK in settings),
+`dumps` is used for the streamed responses and ORJSONResponse by the async
+views. Output matches the standard encoder's: compact, UTF-8, and with UTC
+datetimes ending in Z. Types orjson does not handle natively (Decimal, lazy
+translation strings, ...) are encoded the way DRF's JSONEncoder would.
+"""
+import orjson
+from django.http import HttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_UTC_Z
+
+_fallback = JSONEncoder()
+
+
+def dumps(data, option=0):
+    """Encode `data` as UTF-8 JSON bytes."""
+    return orjson.dumps(data, default=_fallback.default, option=OPTIONS | option)
+
+
+class ORJSONRenderer(BaseRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # The browsable API asks for indented output
+        indent = (renderer_context or {}).get('indent')
+        return dumps(data, orjson.OPT_INDENT_2 if indent else 0)
+
+
+class ORJSONResponse(HttpResponse):
+    """A JsonResponse encoded with orjson; any JSON-serialisable `data` is accepted."""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
@@ -0,0 +1,165 @@
+"""
+Loan approval rules: credit score slabs and the EMI-to-salary cap.
+
+Rules are read from a versioned JSON file (settings.ELIGIBILITY_RULES_FILE)
+and compiled into a sorted table of score thresholds, so finding a score's
+slab is one bisect. The file is re-checked at most every
+ELIGIBILITY_RULES_RELOAD_INTERVAL seconds and recompiled when it changes; a
+file that fails to compile is logged and the previous rules stay in force.
+
+Each slab applies to scores strictly above `above` (null for the lowest slab):
+- approve: false rejects every request in the slab
+- rate_above: if set, only rates strictly above it are approved
+- min_rate: rates below it are corrected up to it
+- corrected_rate: the rate quoted when the slab rejects (defaults to min_rate)
+- message: the reason given when the slab rejects
+"""
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import NamedTuple, Optional, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(__file__), 'eligibility_rules.json')
+DEFAULT_RELOAD_INTERVAL = 5
+
+
+class Slab(NamedTuple):
+    above: Optional[float]
+    min_rate: float
+    approve: bool = True
+    rate_above: Optional[float] = None
+    corrected_rate: Optional[float] = None
+    message: str = ''
+
+
+class RuleSet(NamedTuple):
+    """Compiled rules: `thresholds[i]` is the lower bound of `slabs[i + 1]`."""
+    version: int
+    emi_cap_ratio: float
+    thresholds: Tuple[float, ...]
+    slabs: Tuple[Slab, ...]
+
+    def slab_for(self, credit_score):
+        return self.slabs[bisect_left(self.thresholds, credit_score)]
+
+
+class RuleDecision(NamedTuple):
+    approval: bool
+    corrected_interest_rate: float
+    message: str
+
+
+def compile_rules(config):
+    """Validate a rules dict and compile it into a RuleSet. Raises ValueError if it is malformed."""
+    try:
+        slabs = [Slab(**slab) for slab in config['slabs']]
+        version = int(config['version'])
+        emi_cap_ratio = float(config['emi_cap_ratio'])
+    except (KeyError, TypeError, ValueError) as exc:
+        raise ValueError(f'Invalid eligibility rules: {exc}') from exc
+    base = [slab for slab in slabs if slab.above is None]
+    if len(base) != 1:
+        raise ValueError('Eligibility rules need exactly one slab with "above": null.')
+    bounded = sorted((slab for slab in slabs if slab.above is not None), key=lambda slab: slab.above)
+    thresholds = tuple(float(slab.above) for slab in bounded)
+    if len(set(thresholds)) != len(thresholds):
+        raise ValueError('Eligibility rule slabs must have distinct "above" thresholds.')
+    return RuleSet(version, emi_cap_ratio, thresholds, tuple(base + bounded))
+
+
+def load_rules(file_path):
+    with open(file_path) as handle:
+        return compile_rules(json.load(handle))
+
+
+def decide(rules, credit_score, interest_rate, current_emis_sum, monthly_salary):
+    """Apply `rules` to one request; EMI calculation is left to the caller."""
+    slab = rules.slab_for(credit_score)
+    corrected_interest_rate = interest_rate
+    message = ''
+    if not slab.approve:
+        approval = False
+        corrected_interest_rate = slab.corrected_rate if slab.corrected_rate is not None else slab.min_rate
+        message = slab.message
+    elif slab.rate_above is None or interest_rate > slab.rate_above:
+        approval = True
+    else:
+        approval = False
+        corrected_interest_rate = slab.corrected_rate if slab.corrected_rate is not None else slab.min_rate
+        message = slab.message
+
+    if current_emis_sum > rules.emi_cap_ratio * monthly_salary:
+        approval = False
+        message = f'Sum of current EMIs exceeds {rules.emi_cap_ratio:.0%} of monthly salary.'
+
+    if interest_rate < slab.min_rate:
+        corrected_interest_rate = slab.min_rate
+        message = f'Interest rate too low for credit score. Minimum required: {slab.min_rate}%.'
+    return RuleDecision(approval, corrected_interest_rate, message)
+
+
+class _RulesHolder:
+    """The process's compiled rules, reloaded when the rules file changes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rules = None
+        self._stamp = None
+        self._checked_at = 0.0
+
+    def get(self):
+        rules = self._rules
+        interval = getattr(settings, 'ELIGIBILITY_RULES_RELOAD_INTERVAL', DEFAULT_RELOAD_INTERVAL)
+        if rules is not None and time.monotonic() - self._checked_at < interval:
+            return rules
+        with self._lock:
+            if self._rules is None or time.monotonic() - self._checked_at >= interval:
+                self._refresh()
+            return self._rules
+
+    def reload(self):
+        """Re-read the rules file now, whether or not it has changed."""
+        with self._lock:
+            self._stamp = None
+            self._refresh()
+            return self._rules
+
+    def _refresh(self):
+        file_path = getattr(settings, 'ELIGIBILITY_RULES_FILE', None) or DEFAULT_RULES_FILE
+        self._checked_at = time.monotonic()
+        try:
+            stat = os.stat(file_path)
+            stamp = (file_path, stat.st_mtime_ns, stat.st_size)
+            if stamp == self._stamp and self._rules is not None:
+                return
+            rules = load_rules(file_path)
+        except (OSError, ValueError):
+            if self._rules is None:
+                raise
+            logger.exception("Could not reload eligibility rules from %s; keeping version %s.", file_path, self._rules.version,
+                             extra={'event': 'rules_reload_failed', 'rules_version': self._rules.version})
+            return
+        if self._rules is None or rules.version != self._rules.version:
+            logger.info("Loaded eligibility rules version %s from %s.", rules.version, file_path,
+                        extra={'event': 'rules_loaded', 'rules_version': rules.version})
+        self._rules = rules
+        self._stamp = stamp
+
+
+_holder = _RulesHolder()
+
+
+def current_rules():
+    """The compiled rules in force, reloading them first if the file has changed."""
+    return _holder.get()
+
+
+def reload_rules():
+    return _holder.reload()
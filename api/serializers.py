@@ -6,6 +6,14 @@ class CustomerSerializer(serializers.ModelSerializer):
         model = Customer
         fields = ['id', 'first_name', 'last_name', 'age', 'monthly_salary', 'phone_number', 'approved_limit']
 
+class CustomerRegistrationSerializer(serializers.ModelSerializer):
+    """A registration request; approved_limit is computed by the caller."""
+    monthly_income = serializers.IntegerField(source='monthly_salary', min_value=1)
+
+    class Meta:
+        model = Customer
+        fields = ['first_name', 'last_name', 'age', 'monthly_income', 'phone_number']
+
 class LoanSerializer(serializers.ModelSerializer):
     class Meta:
         model = Loan
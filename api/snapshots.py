@@ -0,0 +1,137 @@
+"""
+Maintenance of CustomerCreditSnapshot, the per-customer table of precomputed
+scoring inputs that turns credit scoring into a primary-key lookup.
+"""
+from datetime import date
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Case, Count, F, IntegerField, Min, Q, Value, When
+
+from .cache import credit_cache
+from .db_router import reading_from
+from .models import Customer, CustomerCreditSnapshot, Loan
+from .utils import with_credit_features
+
+REBUILD_CHUNK_SIZE = 5000
+
+
+def _build_snapshots(customer_ids, today):
+    """
+    Compute snapshots for `customer_ids` from their Loan rows with two grouped
+    queries. They read from the primary: a snapshot built from a lagging
+    replica would overwrite newer counts written there.
+    """
+    with reading_from(DEFAULT_DB_ALIAS):
+        return _build_snapshots_from(customer_ids, today)
+
+
+def _build_snapshots_from(customer_ids, today):
+    customers = (
+        with_credit_features(Customer.objects.filter(id__in=customer_ids))
+        .annotate(active_until=Min('loan__end_date', filter=Q(loan__end_date__gte=today)))
+        .values(
+            'id', 'credit_total_emis_paid_on_time', 'credit_num_loans_taken', 'credit_loan_approved_volume',
+            'credit_current_loans_sum', 'credit_current_emis_sum', 'active_until',
+        )
+    )
+    per_year = {}
+    counts = (
+        Loan.objects.filter(customer_id__in=customer_ids)
+        .values_list('customer_id', 'start_date__year')
+        .annotate(count=Count('id'))
+    )
+    for customer_id, year, count in counts:
+        per_year.setdefault(customer_id, {})[str(year)] = count
+    return [
+        CustomerCreditSnapshot(
+            customer_id=row['id'],
+            total_emis_paid_on_time=row['credit_total_emis_paid_on_time'] or 0,
+            num_loans_taken=row['credit_num_loans_taken'],
+            loans_per_year=per_year.get(row['id'], {}),
+            loan_approved_volume=row['credit_loan_approved_volume'] or 0,
+            active_loan_sum=row['credit_current_loans_sum'] or 0,
+            active_emi_sum=row['credit_current_emis_sum'] or 0,
+            active_until=row['active_until'],
+        )
+        for row in customers
+    ]
+
+
+def _upsert_snapshots(snapshots):
+    """Write snapshots and drop the affected customers' cached credit profiles once committed."""
+    customer_ids = [snapshot.customer_id for snapshot in snapshots]
+    transaction.on_commit(lambda: credit_cache.invalidate(customer_ids))
+    CustomerCreditSnapshot.objects.bulk_create(
+        snapshots,
+        update_conflicts=True,
+        unique_fields=['customer'],
+        update_fields=[field.name for field in CustomerCreditSnapshot._meta.concrete_fields if not field.primary_key],
+    )
+
+
+def refresh_credit_snapshots(customer_ids=None, chunk_size=REBUILD_CHUNK_SIZE):
+    """
+    Rebuild snapshots from the Loan table, for `customer_ids` or every customer,
+    upserting them `chunk_size` customers at a time. Returns the number written.
+    """
+    if customer_ids is None:
+        customer_ids = Customer.objects.order_by('id').values_list('id', flat=True)
+    customer_ids = list(customer_ids)
+    today = date.today()
+    written = 0
+    for start in range(0, len(customer_ids), chunk_size):
+        snapshots = _build_snapshots(customer_ids[start:start + chunk_size], today)
+        _upsert_snapshots(snapshots)
+        written += len(snapshots)
+    return written
+
+
+def refresh_credit_snapshot(customer_id):
+    """Rebuild and return one customer's snapshot."""
+    snapshot, = _build_snapshots([customer_id], date.today())
+    _upsert_snapshots([snapshot])
+    return snapshot
+
+
+def record_new_loan(loan):
+    """
+    Fold a newly created loan into its customer's snapshot without rescanning
+    the customer's loans. Builds the snapshot from scratch if it is missing.
+    """
+    with transaction.atomic():
+        snapshot = CustomerCreditSnapshot.objects.select_for_update().filter(customer_id=loan.customer_id).first()
+        if snapshot is None or not snapshot.is_fresh(date.today()):
+            refresh_credit_snapshot(loan.customer_id)
+            return
+        year = str(loan.start_date.year)
+        snapshot.total_emis_paid_on_time += loan.emis_paid_on_time
+        snapshot.num_loans_taken += 1
+        snapshot.loans_per_year[year] = snapshot.loans_per_year.get(year, 0) + 1
+        snapshot.loan_approved_volume += loan.loan_amount
+        if loan.end_date >= date.today():
+            snapshot.active_loan_sum += loan.loan_amount
+            snapshot.active_emi_sum += loan.monthly_repayment
+            if snapshot.active_until is None or loan.end_date < snapshot.active_until:
+                snapshot.active_until = loan.end_date
+        snapshot.save()
+        transaction.on_commit(lambda: credit_cache.invalidate([loan.customer_id]))
+
+
+def record_payments_on_time(counts):
+    """
+    Add newly recorded on-time EMIs, {customer_id: count}, to the customers'
+    snapshots with a single UPDATE. Missing snapshots are left to be built from
+    the loans, which already carry the new counts.
+    """
+    counts = {customer_id: count for customer_id, count in counts.items() if count}
+    if not counts:
+        return
+    CustomerCreditSnapshot.objects.filter(customer_id__in=counts).update(
+        total_emis_paid_on_time=F('total_emis_paid_on_time') + Case(
+            *(When(customer_id=customer_id, then=Value(count)) for customer_id, count in counts.items()),
+            default=Value(0),
+            output_field=IntegerField(),
+        ),
+    )
+    customer_ids = list(counts)
+    transaction.on_commit(lambda: credit_cache.invalidate(customer_ids))
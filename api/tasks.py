@@ -1,54 +1,169 @@
 import logging
-from celery import shared_task
-import pandas as pd
-from .models import Customer, Loan
-from django.db.models import Sum
-from datetime import datetime
+import time
+from celery import chord, shared_task
+from django.db import transaction
+from .jobs import finish_job, track_job, update_job
+from .models import Customer, IngestionCheckpoint
+from .payments import ingest_payments
+from .portfolio import PORTFOLIO_CHUNK_SIZE, score_portfolio
+from .snapshots import refresh_credit_snapshots
+from .ingestion import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_SHARD_SIZE,
+    ingest_rows,
+    ingestion_job_key,
+    plan_shards,
+    recompute_current_debt,
+    reset_id_sequence,
+    throughput,
+)
 
 logger = logging.getLogger(__name__)
 
+def _job_progress(job_id, started):
+    """A progress callback publishing running totals to an upload job, or None without one."""
+    if job_id is None:
+        return None
+    def publish(totals):
+        elapsed, rate = throughput(totals['rows'], started)
+        update_job(job_id, seconds=elapsed, rows_per_sec=rate, **totals)
+    return publish
+
+@shared_task
+def ingest_customer_data(file_path, method='bulk_create', batch_size=DEFAULT_BATCH_SIZE, job_id=None):
+    """
+    Stream customer data from the provided spreadsheet into the database in bulk
+    batches. With a `job_id`, progress is published to that upload job.
+    """
+    started = time.perf_counter()
+    with track_job(job_id, file_path):
+        stats = ingest_rows('customers', file_path, method=method, batch_size=batch_size, progress=_job_progress(job_id, started))
+        stats.pop('customer_ids')
+        reset_id_sequence(Customer)
+    elapsed, rate = throughput(stats['rows'], started)
+    logger.info(
+        "Ingested %s customers from %s in %.2fs (%.0f rows/sec). %s unchanged and %s invalid rows skipped.",
+        stats['rows'], file_path, elapsed, rate, stats['unchanged'], stats['invalid'],
+        extra={'event': 'ingestion_finished', 'kind': 'customers', **stats},
+    )
+    stats = {**stats, 'seconds': elapsed, 'rows_per_sec': rate}
+    finish_job(job_id, stats)
+    return stats
+
+@shared_task
+def ingest_loan_data(file_path, method='bulk_create', batch_size=DEFAULT_BATCH_SIZE, job_id=None):
+    """
+    Stream loan data from the provided spreadsheet in bulk batches and update
+    current_debt for each customer. With a `job_id`, progress is published to
+    that upload job.
+    """
+    started = time.perf_counter()
+    with track_job(job_id, file_path):
+        stats = ingest_rows('loans', file_path, method=method, batch_size=batch_size, progress=_job_progress(job_id, started))
+        customer_ids = stats.pop('customer_ids')
+        if customer_ids:
+            if job_id is not None:
+                update_job(job_id, status='finalizing')
+            # After all loans are written, update current_debt and snapshots of the customers they belong to
+            recompute_current_debt(customer_ids)
+            refresh_credit_snapshots(customer_ids)
+    elapsed, rate = throughput(stats['rows'], started)
+    logger.info(
+        "Ingested %s loans from %s in %.2fs (%.0f rows/sec). %s loans skipped due to missing customers, %s unchanged and %s invalid rows skipped.",
+        stats['rows'], file_path, elapsed, rate, stats['missing_customers'], stats['unchanged'], stats['invalid'],
+        extra={'event': 'ingestion_finished', 'kind': 'loans', **stats},
+    )
+    stats = {**stats, 'seconds': elapsed, 'rows_per_sec': rate}
+    finish_job(job_id, stats)
+    return stats
+
 @shared_task
-def ingest_customer_data(file_path):
-    """Ingest customer data from the provided Excel file."""
-    df = pd.read_excel(file_path)
-    for _, row in df.iterrows():
-        Customer.objects.create(
-            first_name=row['First Name'],
-            last_name=row['Last Name'],
-            age=row['Age'],
-            monthly_salary=row['Monthly Salary'],
-            phone_number=row['Phone Number'],
-            approved_limit=row['Approved Limit'],
-            current_debt=0  # Set to 0 initially
+def ingest_shard(kind, file_path, start, stop, job_key, method='bulk_create', batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Ingest data rows [start, stop) of a file. The rows and the shard's checkpoint
+    commit in one transaction, so a crashed shard leaves nothing behind and a
+    completed one is skipped when the job is re-run.
+    """
+    checkpoint = IngestionCheckpoint.objects.filter(job_key=job_key, kind=kind, start_row=start).first()
+    if checkpoint is not None:
+        logger.info("Skipping %s shard %s-%s of %s: already ingested.", kind, start, stop, file_path,
+                    extra={'event': 'shard_skipped', 'kind': kind, 'start_row': start})
+        return {'rows': 0, 'unchanged': 0, 'invalid': 0, 'missing_customers': 0, 'customer_ids': [], 'skipped': True}
+    started = time.perf_counter()
+    with transaction.atomic():
+        stats = ingest_rows(kind, file_path, method=method, batch_size=batch_size, start=start, stop=stop)
+        IngestionCheckpoint.objects.create(
+            job_key=job_key, kind=kind, start_row=start, end_row=stop, rows_written=stats['rows']
         )
-    logger.info(f"Ingested {len(df)} customers from {file_path}.")
+    elapsed, rate = throughput(stats['rows'], started)
+    customer_ids = stats.pop('customer_ids')
+    logger.info("Ingested %s shard %s-%s of %s: %s rows in %.2fs (%.0f rows/sec).", kind, start, stop, file_path, stats['rows'], elapsed, rate,
+                extra={'event': 'shard_finished', 'kind': kind, 'start_row': start, **stats})
+    return {**stats, 'customer_ids': customer_ids, 'skipped': False}
 
 @shared_task
-def ingest_loan_data(file_path):
-    """Ingest loan data from the provided Excel file and update current_debt for each customer."""
-    df = pd.read_excel(file_path)
-    missing_customers = 0
-    for _, row in df.iterrows():
-        try:
-            customer = Customer.objects.get(id=row['Customer ID'])
-            Loan.objects.create(
-                customer=customer,
-                loan_amount=row['Loan Amount'],
-                tenure=row['Tenure'],
-                interest_rate=row['Interest Rate'],
-                monthly_repayment=row['Monthly payment'],
-                emis_paid_on_time=row['EMIs paid on Time'],  # Corrected column name
-                start_date=row['Date of Approval'],
-                end_date=row['End Date']
-            )
-        except Customer.DoesNotExist:
-            logger.warning(f"Customer with ID {row['Customer ID']} not found for loan ingestion.")
-            missing_customers += 1
-    logger.info(f"Ingested {len(df) - missing_customers} loans from {file_path}. {missing_customers} loans skipped due to missing customers.")
-    # After all loans are created, update current_debt for each customer
-    for customer in Customer.objects.all():
-        current_loans = Loan.objects.filter(customer=customer, end_date__gte=datetime.now())
-        total_debt = current_loans.aggregate(Sum('loan_amount'))['loan_amount__sum'] or 0
-        customer.current_debt = total_debt
-        customer.save()
-    logger.info("Updated current_debt for all customers after loan ingestion.") 
\ No newline at end of file
+def finalize_ingestion(results, kind, file_path, started_at):
+    """Chord callback: fix up derived state once every shard of a file has been ingested."""
+    if kind == 'customers':
+        reset_id_sequence(Customer)
+    else:
+        if any(result['skipped'] for result in results):
+            # Shards committed by an earlier run are not known here: recompute every customer
+            customer_ids = None
+        else:
+            customer_ids = sorted({customer_id for result in results for customer_id in result['customer_ids']})
+        if customer_ids is None or customer_ids:
+            recompute_current_debt(customer_ids)
+            refresh_credit_snapshots(customer_ids)
+    rows = sum(result['rows'] for result in results)
+    elapsed = time.time() - started_at
+    rate = rows / elapsed if elapsed > 0 else float(rows)
+    logger.info("Parallel ingestion of %s from %s finished: %s rows from %s shards in %.2fs (%.0f rows/sec).", kind, file_path, rows, len(results), elapsed, rate,
+                extra={'event': 'ingestion_finished', 'kind': kind, 'rows': rows, 'shards': len(results)})
+    return {
+        'rows': rows,
+        'unchanged': sum(result['unchanged'] for result in results),
+        'invalid': sum(result['invalid'] for result in results),
+        'missing_customers': sum(result['missing_customers'] for result in results),
+        'shards': len(results),
+        'skipped_shards': sum(1 for result in results if result['skipped']),
+        'seconds': elapsed,
+        'rows_per_sec': rate,
+    }
+
+@shared_task
+def score_portfolio_task(chunk_size=PORTFOLIO_CHUNK_SIZE):
+    """Recompute every customer's credit score and approval band into CustomerCreditScore."""
+    stats = score_portfolio(chunk_size=chunk_size)
+    logger.info(
+        "Scored %s customers in %.2fs (%.0f customers/sec) with rules version %s.",
+        stats['customers'], stats['seconds'], stats['customers_per_sec'], stats['rules_version'],
+        extra={'event': 'portfolio_scored', **stats},
+    )
+    return stats
+
+@shared_task
+def ingest_payment_data(file_path, batch_size=DEFAULT_BATCH_SIZE):
+    """Append payments from a file to the ledger, advancing each loan's EMI counters."""
+    stats = ingest_payments(file_path, batch_size=batch_size)
+    logger.info(
+        "Recorded %s payments from %s in %.2fs (%.0f rows/sec): %s on time, %s late. %s for unknown loans, %s for repaid loans and %s invalid rows skipped.",
+        stats['rows'], file_path, stats['seconds'], stats['rows_per_sec'], stats['on_time'], stats['late'],
+        stats['missing_loans'], stats['repaid_loans'], stats['invalid'],
+        extra={'event': 'ingestion_finished', 'kind': 'payments', **stats},
+    )
+    return stats
+
+def build_parallel_ingestion(kind, file_path, shard_size=DEFAULT_SHARD_SIZE, method='bulk_create', batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Build a chord that fans the shards of `file_path` out across workers and
+    finishes with finalize_ingestion. Re-running it for the same, unchanged file
+    resumes: shards with a checkpoint return immediately.
+    """
+    job_key = ingestion_job_key(kind, file_path)
+    shards = plan_shards(file_path, shard_size)
+    header = [
+        ingest_shard.si(kind, file_path, start, stop, job_key, method=method, batch_size=batch_size)
+        for start, stop in shards
+    ]
+    return chord(header, finalize_ingestion.s(kind, file_path, time.time()))
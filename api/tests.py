@@ -1,11 +1,25 @@
+from unittest import skipUnless
+
+from django.conf import settings
+from django.db import connections
 from django.urls import reverse
-from rest_framework.test import APITestCase
+from rest_framework.test import APITestCase, APITransactionTestCase
 from rest_framework import status
 from .models import Customer
 from .models import Loan
 
 # Create your tests here.
 
+def clear_credit_caches():
+    """Empty both tiers of the credit profile cache; customer IDs can be reused between tests."""
+    from django.core.cache import cache
+    from .cache import credit_cache
+    cache.clear()
+    credit_cache.clear_local()
+
+# The stand-in read replica of ReplicaRoutingTest (see TEST_REPLICA_DATABASE in settings)
+TEST_REPLICA = settings.TEST_REPLICA_DATABASE
+
 class RegisterAPITest(APITestCase):
     def test_register_customer(self):
         url = reverse('register')
@@ -25,8 +39,39 @@ class RegisterAPITest(APITestCase):
         self.assertEqual(response.data['phone_number'], '8888888888')
         self.assertTrue('approved_limit' in response.data)
 
+class RegisterBatchAPITest(APITestCase):
+    def test_register_batch(self):
+        url = reverse('register-batch')
+        items = [
+            {"first_name": "Batch", "last_name": str(i), "age": 30, "monthly_income": income, "phone_number": f"90000000{i:02d}"}
+            for i, income in enumerate([50000, 12500, 98765, 1])
+        ]
+        items.insert(2, {"first_name": "No", "last_name": "Income", "age": 30, "phone_number": "9000000099"})
+        items.insert(4, "not an object")
+        # One INSERT for the valid rows, inside a savepoint
+        with self.assertNumQueries(3):
+            response = self.client.post(url, {'items': items}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([result['index'] for result in response.data], list(range(6)))
+        self.assertIn('monthly_income', response.data[2]['errors'])
+        self.assertIn('non_field_errors', response.data[4]['errors'])
+        from .views import round_to_nearest_lakh
+        created = [response.data[index] for index in (0, 1, 3, 5)]
+        for result, item in zip(created, [items[0], items[1], items[3], items[5]]):
+            self.assertEqual(result['approved_limit'], round_to_nearest_lakh(36 * item['monthly_income']))
+            customer = Customer.objects.get(id=result['customer_id'])
+            self.assertEqual((customer.phone_number, customer.monthly_salary), (item['phone_number'], item['monthly_income']))
+        self.assertEqual(response.data[1]['approved_limit'], 400000)
+    def test_register_batch_rejects_empty_or_invalid(self):
+        url = reverse('register-batch')
+        self.assertEqual(self.client.post(url, {'items': []}, format='json').status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, {'items': [{"first_name": "Only"}]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Customer.objects.exists())
+
 class CheckEligibilityAPITest(APITestCase):
     def setUp(self):
+        clear_credit_caches()
         self.customer = Customer.objects.create(
             first_name="Elig",
             last_name="Test",
@@ -57,6 +102,7 @@ class CheckEligibilityAPITest(APITestCase):
 
 class CreateLoanAPITest(APITestCase):
     def setUp(self):
+        clear_credit_caches()
         self.customer = Customer.objects.create(
             first_name="Loan",
             last_name="Test",
@@ -171,3 +217,1225 @@ class ViewLoansAPITest(APITestCase):
                 self.assertEqual(item['repayments_left'], self.loan1.tenure - self.loan1.emis_paid_on_time)
             if item['loan_id'] == self.loan2.id:
                 self.assertEqual(item['repayments_left'], self.loan2.tenure - self.loan2.emis_paid_on_time)
+    def test_view_loans_cursor_pagination(self):
+        url = reverse('view-loans', args=[self.customer.id])
+        first = self.client.get(url, {'page_size': 1})
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['loan_id'] for item in first.data['results']], [self.loan1.id])
+        second = self.client.get(url, {'page_size': 1, 'cursor': first.data['next_cursor']})
+        self.assertEqual([item['loan_id'] for item in second.data['results']], [self.loan2.id])
+        self.assertIsNone(second.data['next_cursor'])
+        self.assertEqual(self.client.get(url, {'cursor': 'not-a-cursor'}).status_code, status.HTTP_400_BAD_REQUEST)
+    def test_view_loans_ndjson_stream(self):
+        import json
+        url = reverse('view-loans', args=[self.customer.id])
+        response = self.client.get(url, {'stream': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['loan_id'] for line in lines], [self.loan1.id, self.loan2.id])
+
+class CreditScoreQueryTest(APITestCase):
+    def setUp(self):
+        from datetime import date, timedelta
+        clear_credit_caches()
+        self.customer = Customer.objects.create(
+            first_name="Score",
+            last_name="Test",
+            age=30,
+            monthly_salary=100000,
+            phone_number="3333333333",
+            approved_limit=3600000,
+            current_debt=0
+        )
+        Loan.objects.create(
+            customer=self.customer,
+            loan_amount=400000,
+            tenure=12,
+            interest_rate=12.0,
+            monthly_repayment=35000,
+            emis_paid_on_time=10,
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=30*12)
+        )
+        Loan.objects.create(
+            customer=self.customer,
+            loan_amount=200000,
+            tenure=6,
+            interest_rate=10.0,
+            monthly_repayment=34000,
+            emis_paid_on_time=6,
+            start_date=date(2015, 1, 1),
+            end_date=date(2015, 7, 1)
+        )
+    def test_features_from_single_query(self):
+        from .utils import evaluate_credit, get_credit_features, with_credit_features
+        with self.assertNumQueries(1):
+            customer = with_credit_features(Customer.objects).get(id=self.customer.id)
+            features, score = evaluate_credit(customer)
+        self.assertEqual(features, get_credit_features(self.customer))
+        self.assertEqual(features.total_emis_paid_on_time, 16)
+        self.assertEqual(features.num_loans_taken, 2)
+        self.assertEqual(features.loans_in_current_year, 1)
+        self.assertEqual(features.loan_approved_volume, 600000)
+        self.assertEqual(features.current_loans_sum, 400000)
+        self.assertEqual(features.current_emis_sum, 35000)
+        # 16 on-time EMIs + 5 current-year + 6 volume - 4 loan penalty
+        self.assertEqual(score, 23)
+    def test_snapshot_matches_aggregate(self):
+        from datetime import date, timedelta
+        from .models import CustomerCreditSnapshot
+        from .utils import get_credit_features, with_credit_features
+        def aggregated():
+            return get_credit_features(with_credit_features(Customer.objects).get(id=self.customer.id))
+        # A missing snapshot is built on first use
+        self.assertEqual(get_credit_features(Customer.objects.get(id=self.customer.id)), aggregated())
+        response = self.client.post(reverse('create-loan'), {"customer_id": self.customer.id, "loan_amount": 100000, "interest_rate": 18, "tenure": 12}, format='json')
+        self.assertTrue(response.data['loan_approved'])
+        snapshot_features = get_credit_features(Customer.objects.select_related('credit_snapshot').get(id=self.customer.id))
+        self.assertEqual(snapshot_features, aggregated())
+        # Once the earliest active loan has ended, the snapshot is rebuilt
+        CustomerCreditSnapshot.objects.filter(customer=self.customer).update(active_until=date.today() - timedelta(days=1), active_loan_sum=0)
+        self.assertEqual(get_credit_features(Customer.objects.get(id=self.customer.id)), aggregated())
+    def test_check_eligibility_single_query(self):
+        from .snapshots import refresh_credit_snapshots
+        refresh_credit_snapshots()
+        url = reverse('check-eligibility')
+        data = {"customer_id": self.customer.id, "loan_amount": 100000, "interest_rate": 18, "tenure": 12}
+        with self.assertNumQueries(1):
+            response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.data['approval'])
+
+class BulkIngestionTest(APITestCase):
+    def setUp(self):
+        import pandas as pd
+        from datetime import date, timedelta
+        self.customer = Customer.objects.create(
+            first_name="Bulk",
+            last_name="Ingest",
+            age=33,
+            monthly_salary=70000,
+            phone_number="2222222222",
+            approved_limit=2500000,
+            current_debt=0
+        )
+        self.sheet = pd.DataFrame({
+            'Customer ID': [self.customer.id, self.customer.id, 999999, self.customer.id],
+            'Loan ID': [1, 2, 3, 4],
+            'Loan Amount': [100000, 50000, 70000, 'bad'],
+            'Tenure': [12, 6, 12, 12],
+            'Interest Rate': [10.0, 11.0, 12.0, 10.0],
+            'Monthly payment': [8791.59, 8602.73, 6219.42, 8791.59],
+            'EMIs paid on Time': [3, 6, 1, 1],
+            'Date of Approval': [date.today(), date(2015, 1, 1), date.today(), date.today()],
+            'End Date': [date.today() + timedelta(days=365), date(2015, 7, 1), date.today(), date.today()],
+        })
+    def _ingest(self, method):
+        from .ingestion import prepare_loans, recompute_current_debt, resolve_customers, write_rows
+        loans, invalid = prepare_loans(self.sheet)
+        loans, missing = resolve_customers(loans)
+        self.assertEqual((invalid, missing), (1, 1))
+        self.assertEqual(len(write_rows(Loan, loans, method=method, batch_size=1)), 2)
+        recompute_current_debt()
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.loan_set.count(), 2)
+        self.assertEqual(self.customer.current_debt, 100000)
+    def test_bulk_create(self):
+        self._ingest('bulk_create')
+    def test_copy(self):
+        self._ingest('copy')
+    def test_streaming_batches(self):
+        import os
+        import tempfile
+        from .ingestion import iter_batches
+        with tempfile.TemporaryDirectory() as tmp:
+            for name in ('loans.xlsx', 'loans.csv'):
+                path = os.path.join(tmp, name)
+                if name.endswith('.xlsx'):
+                    self.sheet.to_excel(path, index=False)
+                else:
+                    self.sheet.to_csv(path, index=False)
+                batches = list(iter_batches(path, batch_size=3))
+                self.assertEqual([len(batch) for batch in batches], [3, 1])
+                self.assertEqual(list(batches[0].columns), list(self.sheet.columns))
+    def test_sharded_ingestion_resumes(self):
+        import os
+        import tempfile
+        from .ingestion import ingestion_job_key, plan_shards
+        from .tasks import finalize_ingestion, ingest_shard
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'loans.xlsx')
+            self.sheet.to_excel(path, index=False)
+            shards = plan_shards(path, shard_size=3)
+            self.assertEqual(shards, [(0, 3), (3, 4)])
+            job_key = ingestion_job_key('loans', path)
+            # The first shard commits, then the import "crashes" and is re-run in full
+            ingest_shard('loans', path, 0, 3, job_key)
+            results = [ingest_shard('loans', path, start, stop, job_key) for start, stop in shards]
+            self.assertEqual([result['skipped'] for result in results], [True, False])
+            summary = finalize_ingestion(results, 'loans', path, 0)
+        self.assertEqual(self.customer.loan_set.count(), 2)
+        self.assertEqual(summary['skipped_shards'], 1)
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.current_debt, 100000)
+    def test_upsert_is_idempotent(self):
+        from .ingestion import prepare_loans, resolve_customers, write_rows
+        loans, _ = resolve_customers(prepare_loans(self.sheet)[0])
+        self.assertEqual(len(write_rows(Loan, loans, method='upsert')), 2)
+        self.assertEqual(len(write_rows(Loan, loans, method='upsert')), 0)
+        changed = self.sheet.copy()
+        changed.loc[0, 'EMIs paid on Time'] = 4
+        loans, _ = resolve_customers(prepare_loans(changed)[0])
+        self.assertEqual(write_rows(Loan, loans, method='upsert')['source_loan_id'].tolist(), [1])
+        self.assertEqual(self.customer.loan_set.count(), 2)
+        self.assertEqual(self.customer.loan_set.get(source_loan_id=1).emis_paid_on_time, 4)
+    def test_loan_ingestion_recomputes_only_touched_customers(self):
+        import os
+        import tempfile
+        from unittest import mock
+        from .tasks import ingest_loan_data
+        # Stale debt on a customer the file does not mention must be left alone
+        other = Customer.objects.create(
+            first_name="Untouched", last_name="Ingest", age=40, monthly_salary=50000,
+            phone_number="2626262626", approved_limit=1800000, current_debt=12345
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'loans.csv')
+            self.sheet.to_csv(path, index=False)
+            ingest_loan_data(path, method='upsert')
+            self.customer.refresh_from_db()
+            other.refresh_from_db()
+            self.assertEqual((self.customer.current_debt, other.current_debt), (100000, 12345))
+            # A re-import that writes nothing skips the derived-state pass entirely
+            with mock.patch('api.tasks.recompute_current_debt') as recompute, mock.patch('api.tasks.refresh_credit_snapshots') as refresh:
+                stats = ingest_loan_data(path, method='upsert')
+            self.assertEqual(stats['rows'], 0)
+            recompute.assert_not_called()
+            refresh.assert_not_called()
+    def test_customer_reimport_invalidates_cached_credit_profile(self):
+        import pandas as pd
+        from datetime import date, timedelta
+        from .ingestion import ingest_customer_batch
+        clear_credit_caches()
+        # An active loan whose EMI is more than half the salary on file
+        Loan.objects.create(
+            customer=self.customer, loan_amount=400000, tenure=12, interest_rate=12.0, monthly_repayment=40000,
+            emis_paid_on_time=12, start_date=date(2015, 1, 1), end_date=date.today() + timedelta(days=365)
+        )
+        self.customer.monthly_salary = 60000
+        self.customer.save()
+        url = reverse('check-eligibility')
+        data = {"customer_id": self.customer.id, "loan_amount": 50000, "interest_rate": 18, "tenure": 12}
+        self.assertFalse(self.client.post(url, data, format='json').data['approval'])
+        sheet = pd.DataFrame({
+            'Customer ID': [self.customer.id], 'First Name': ['Bulk'], 'Last Name': ['Ingest'], 'Age': [33],
+            'Monthly Salary': [200000], 'Phone Number': [2222222222], 'Approved Limit': [7200000],
+        })
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_customer_batch(sheet, method='upsert')
+        # The cached profile with the old salary is gone, so the new salary decides
+        self.assertTrue(self.client.post(url, data, format='json').data['approval'])
+    def test_customer_upsert_bumps_only_rewritten_customers(self):
+        import pandas as pd
+        from .ingestion import ingest_customer_batch
+        other = Customer.objects.create(
+            first_name="Other", last_name="Ingest", age=40, monthly_salary=50000,
+            phone_number="2525252525", approved_limit=1800000, current_debt=0
+        )
+        sheet = pd.DataFrame({
+            'Customer ID': [self.customer.id, other.id],
+            'First Name': ['Bulk', 'Other'],
+            'Last Name': ['Ingest', 'Ingest'],
+            'Age': [33, 40],
+            'Monthly Salary': [70000, 50000],
+            'Phone Number': [2222222222, 2525252525],
+            'Approved Limit': [2500000, 1800000],
+        })
+        self.assertEqual(ingest_customer_batch(sheet, method='upsert')['rows'], 2)
+        versions = dict(Customer.objects.values_list('id', 'version'))
+        sheet.loc[1, 'Monthly Salary'] = 90000
+        stats = ingest_customer_batch(sheet, method='upsert')
+        self.assertEqual((stats['rows'], stats['unchanged']), (1, 1))
+        self.assertEqual(dict(Customer.objects.values_list('id', 'version')), {self.customer.id: versions[self.customer.id], other.id: versions[other.id] + 1})
+
+class CheckEligibilityBatchAPITest(APITestCase):
+    def setUp(self):
+        clear_credit_caches()
+        self.customer = Customer.objects.create(
+            first_name="Batch",
+            last_name="Elig",
+            age=29,
+            monthly_salary=50000,
+            phone_number="1111111111",
+            approved_limit=1800000,
+            current_debt=0
+        )
+    def test_batch_matches_single_checks(self):
+        items = [
+            {"customer_id": self.customer.id, "loan_amount": 100000, "interest_rate": 14, "tenure": 12},
+            {"customer_id": 999999, "loan_amount": 100000, "interest_rate": 14, "tenure": 12},
+            {"customer_id": self.customer.id, "loan_amount": "abc", "interest_rate": 14, "tenure": 12},
+            {"customer_id": self.customer.id, "loan_amount": 50000, "interest_rate": 8, "tenure": 6},
+        ]
+        with self.assertNumQueries(1):
+            response = self.client.post(reverse('check-eligibility-batch'), {"items": items}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([result['index'] for result in response.data], [0, 1, 2, 3])
+        self.assertEqual(response.data[1]['error'], 'Customer not found')
+        self.assertIn('error', response.data[2])
+        for index in (0, 3):
+            single = self.client.post(reverse('check-eligibility'), items[index], format='json')
+            expected = dict(single.data, index=index)
+            self.assertEqual(response.data[index], expected)
+    def test_large_batch_is_streamed(self):
+        import json
+        from unittest import mock
+        from . import views
+        items = [{"customer_id": self.customer.id, "loan_amount": 1000 * (i + 1), "interest_rate": 20, "tenure": 12} for i in range(5)]
+        with mock.patch.multiple(views, STREAM_ELIGIBILITY_ABOVE=2, ELIGIBILITY_CHUNK_SIZE=2):
+            response = self.client.post(reverse('check-eligibility-batch'), items, format='json')
+            results = json.loads(b''.join(response.streaming_content))
+        self.assertTrue(response.streaming)
+        self.assertEqual([result['index'] for result in results], list(range(5)))
+
+class VectorisedEmiTest(APITestCase):
+    def test_matches_scalar_emi(self):
+        import numpy as np
+        from .amortization import calculate_emis
+        from .utils import calculate_emi
+        rng = np.random.default_rng(7)
+        principal = np.concatenate([rng.integers(1000, 5000000, 5000).astype(float), [120000.0, 100000.0]])
+        annual_rate = np.concatenate([np.round(rng.uniform(0, 30, 5000), 2), [0.0, 12.0]])
+        tenure = np.concatenate([rng.integers(1, 360, 5000), [12, 12]])
+        expected = [calculate_emi(p, r, n) for p, r, n in zip(principal.tolist(), annual_rate.tolist(), tenure.tolist())]
+        self.assertEqual(calculate_emis(principal, annual_rate, tenure).tolist(), expected)
+    def test_scalar_input(self):
+        from .amortization import calculate_emis
+        from .utils import calculate_emi
+        self.assertEqual(calculate_emis(100000, 12, 12), calculate_emi(100000, 12, 12))
+        self.assertEqual(calculate_emis(120000, 0, 12), 10000.0)
+        self.assertEqual(calculate_emis([100000], 12, 12).tolist(), [calculate_emi(100000, 12, 12)])
+    def test_zero_tenure_raises_like_scalar(self):
+        from .amortization import calculate_emis
+        from .utils import calculate_emi
+        for rate in (0, 12):
+            with self.assertRaises(ZeroDivisionError):
+                calculate_emi(100000, rate, 0)
+            with self.assertRaises(ZeroDivisionError):
+                calculate_emis([100000, 50000], rate, [12, 0])
+            with self.assertRaises(ZeroDivisionError):
+                calculate_emis(100000, rate, 0)
+    def test_amortization_schedule(self):
+        import numpy as np
+        from .amortization import amortization_schedule
+        from .utils import calculate_emi
+        schedule = amortization_schedule([100000, 50000], [12, 0], [12, 6])
+        self.assertEqual(schedule.payment.shape, (2, 12))
+        self.assertAlmostEqual(schedule.payment[0, 0], calculate_emi(100000, 12, 12))
+        self.assertAlmostEqual(schedule.interest[0, 0], 1000.0)
+        np.testing.assert_allclose(schedule.principal.sum(axis=1), [100000, 50000])
+        np.testing.assert_allclose(schedule.balance[:, -1], [0, 0], atol=1e-6)
+        self.assertTrue((schedule.payment[1, 6:] == 0).all())
+
+class CreditCacheTest(APITestCase):
+    def setUp(self):
+        clear_credit_caches()
+        self.customer = Customer.objects.create(
+            first_name="Cache",
+            last_name="Test",
+            age=41,
+            monthly_salary=100000,
+            phone_number="1212121212",
+            approved_limit=3600000,
+            current_debt=0
+        )
+        from datetime import date
+        Loan.objects.create(
+            customer=self.customer,
+            loan_amount=200000,
+            tenure=60,
+            interest_rate=11.0,
+            monthly_repayment=4348.54,
+            emis_paid_on_time=60,
+            start_date=date(2015, 1, 1),
+            end_date=date(2020, 1, 1)
+        )
+    def test_repeat_checks_skip_database_until_loan_created(self):
+        from .cache import credit_cache
+        url = reverse('check-eligibility')
+        data = {"customer_id": self.customer.id, "loan_amount": 100000, "interest_rate": 14, "tenure": 12}
+        self.client.post(url, data, format='json')
+        hits = credit_cache.stats()['local_hits']
+        with self.assertNumQueries(0):
+            self.client.post(url, data, format='json')
+        self.assertEqual(credit_cache.stats()['local_hits'], hits + 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            created = self.client.post(reverse('create-loan'), data, format='json')
+        self.assertTrue(created.data['loan_approved'])
+        self.assertIsNone(credit_cache.get(self.customer.id))
+        stats = self.client.get(reverse('cache-stats'))
+        self.assertIn('hit_ratio', stats.data)
+        from .cache import get_credit_profile
+        self.assertEqual(get_credit_profile(self.customer.id).features.num_loans_taken, 2)
+
+class ScoringQueryPlanTest(APITestCase):
+    def setUp(self):
+        from datetime import date, timedelta
+        from django.db import connection
+        self.customer = Customer.objects.create(
+            first_name="Plan",
+            last_name="Test",
+            age=38,
+            monthly_salary=90000,
+            phone_number="1313131313",
+            approved_limit=3200000,
+            current_debt=0
+        )
+        Loan.objects.bulk_create([
+            Loan(
+                customer=self.customer,
+                loan_amount=100000 + i,
+                tenure=12,
+                interest_rate=12.0,
+                monthly_repayment=8884.88,
+                emis_paid_on_time=i % 12,
+                start_date=date(2010 + i % 16, 1, 1),
+                end_date=date(2011 + i % 16, 1, 1) + timedelta(days=i)
+            )
+            for i in range(200)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE api_loan')
+            # Tiny test tables would otherwise be sequentially scanned; this checks an index is usable
+            cursor.execute('SET LOCAL enable_seqscan = off')
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+        self.assertNotIn('Seq Scan on api_loan', plan)
+    def test_active_loan_sums_use_covering_index(self):
+        from datetime import date
+        from django.db.models import Sum
+        queryset = (
+            Loan.objects.filter(customer=self.customer, end_date__gte=date.today())
+            .values('customer')
+            .annotate(total=Sum('loan_amount'), emis=Sum('monthly_repayment'))
+        )
+        self.assertUsesIndex(queryset, 'Index Only Scan using loan_customer_end_date_idx')
+    def test_current_year_count_uses_start_date_index(self):
+        from datetime import date
+        year = date.today().year
+        queryset = Loan.objects.filter(
+            customer=self.customer, start_date__gte=date(year, 1, 1), start_date__lt=date(year + 1, 1, 1)
+        ).values('id')
+        self.assertUsesIndex(queryset, 'loan_customer_start_date_idx')
+    def test_scoring_query_uses_index_scans(self):
+        from .utils import with_credit_features
+        plan = with_credit_features(Customer.objects).filter(id=self.customer.id).explain()
+        self.assertIn('Index', plan)
+        self.assertNotIn('Seq Scan', plan)
+
+class AsyncEndpointsTest(APITestCase):
+    def setUp(self):
+        from datetime import date
+        clear_credit_caches()
+        self.customer = Customer.objects.create(
+            first_name="Async",
+            last_name="Test",
+            age=36,
+            monthly_salary=100000,
+            phone_number="1414141414",
+            approved_limit=3600000,
+            current_debt=0
+        )
+        self.loan = Loan.objects.create(
+            customer=self.customer,
+            loan_amount=200000,
+            tenure=60,
+            interest_rate=11.0,
+            monthly_repayment=4348.54,
+            emis_paid_on_time=60,
+            start_date=date(2015, 1, 1),
+            end_date=date(2020, 1, 1)
+        )
+        self.request = {"customer_id": self.customer.id, "loan_amount": 100000, "interest_rate": 14, "tenure": 12}
+    async def test_async_eligibility_matches_sync(self):
+        from asgiref.sync import sync_to_async
+        response = await self.async_client.post(reverse('async-check-eligibility'), self.request, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = await sync_to_async(self.client.post)(reverse('check-eligibility'), self.request, format='json')
+        self.assertEqual(response.json(), expected.data)
+        missing = await self.async_client.post(reverse('async-check-eligibility'), {"customer_id": 999999}, content_type='application/json')
+        self.assertEqual(missing.status_code, status.HTTP_404_NOT_FOUND)
+    async def test_async_create_and_view_loans(self):
+        created = await self.async_client.post(reverse('async-create-loan'), self.request, content_type='application/json')
+        self.assertEqual(created.status_code, status.HTTP_201_CREATED)
+        loan_id = created.json()['loan_id']
+        detail = await self.async_client.get(reverse('async-view-loan', args=[loan_id]))
+        self.assertEqual(detail.json()['customer']['id'], self.customer.id)
+        page = await self.async_client.get(reverse('async-view-loans', args=[self.customer.id]), {'page_size': 1})
+        self.assertEqual([item['loan_id'] for item in page.json()['results']], [self.loan.id])
+        listing = await self.async_client.get(reverse('async-view-loans', args=[self.customer.id]))
+        self.assertEqual([item['loan_id'] for item in listing.json()], [self.loan.id, loan_id])
+
+class ConcurrentCreateLoanTest(APITransactionTestCase):
+    """Parallel create-loan requests run in real transactions, one thread and connection each."""
+    def setUp(self):
+        from datetime import date
+        clear_credit_caches()
+        self.customer = Customer.objects.create(
+            first_name="Race",
+            last_name="Test",
+            age=40,
+            monthly_salary=100000,
+            phone_number="1515151515",
+            approved_limit=3600000,
+            current_debt=0
+        )
+        Loan.objects.create(
+            customer=self.customer,
+            loan_amount=200000,
+            tenure=60,
+            interest_rate=11.0,
+            monthly_repayment=4348.54,
+            emis_paid_on_time=60,
+            start_date=date(2015, 1, 1),
+            end_date=date(2020, 1, 1)
+        )
+    def create_loan(self, _):
+        from django.db import connection
+        from rest_framework.test import APIClient
+        try:
+            data = {"customer_id": self.customer.id, "loan_amount": 100000, "interest_rate": 14, "tenure": 12}
+            return APIClient().post(reverse('create-loan'), data, format='json').status_code
+        finally:
+            connection.close()
+    def test_parallel_requests_respect_emi_cap(self):
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+        # Each loan adds an EMI of ~8,979; the 50,000 cap (half the salary) is passed after six
+        requests = 16
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            statuses = list(pool.map(self.create_loan, range(requests)))
+        elapsed = time.perf_counter() - started
+        created = Loan.objects.filter(customer=self.customer, emis_paid_on_time=0)
+        self.assertEqual(statuses.count(status.HTTP_201_CREATED), 6)
+        self.assertEqual(statuses.count(status.HTTP_200_OK), requests - 6)
+        self.assertEqual(created.count(), 6)
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.current_debt, 600000)
+        snapshot = self.customer.credit_snapshot
+        self.assertEqual(snapshot.num_loans_taken, 7)
+        self.assertEqual(snapshot.active_loan_sum, 600000)
+        # Requests for one customer queue on its row lock; they must not stall on it
+        self.assertLess(elapsed, 30, f"{requests} requests took {elapsed:.2f}s ({requests / elapsed:.1f} req/s)")
+
+class BenchmarkCommandTest(APITestCase):
+    def setUp(self):
+        clear_credit_caches()
+    def test_report_covers_each_endpoint(self):
+        import json
+        from io import StringIO
+        from django.core.management import call_command
+        # A real customer who happens to share the synthetic surname
+        bystander = Customer.objects.create(
+            first_name="Real", last_name="Benchmark", age=30, monthly_salary=50000,
+            phone_number="2424242424", approved_limit=1800000, current_debt=0
+        )
+        out = StringIO()
+        call_command('benchmark_api', customers=20, loans=60, requests=80, concurrency=1, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(set(report['endpoints']), {'register', 'check-eligibility', 'create-loan', 'view-loans'})
+        self.assertEqual(report['total']['requests'], 80)
+        self.assertEqual(report['total']['errors'], 0)
+        for stats in report['endpoints'].values():
+            self.assertLessEqual(stats['p50_ms'], stats['p95_ms'])
+            self.assertLessEqual(stats['p95_ms'], stats['p99_ms'])
+            self.assertGreater(stats['mean_queries'], 0)
+        # The synthetic and registered customers are removed afterwards, and only they
+        self.assertEqual(list(Customer.objects.filter(last_name='Benchmark')), [bystander])
+
+    def test_replayed_writes_to_existing_customers_need_allow_writes(self):
+        import json
+        import tempfile
+        from io import StringIO
+        from django.core.management import CommandError, call_command
+        customer = Customer.objects.create(
+            first_name="Real", last_name="Customer", age=30, monthly_salary=50000,
+            phone_number="2727272727", approved_limit=1800000, current_debt=0
+        )
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as handle:
+            handle.write(json.dumps({'endpoint': 'create-loan', 'data': {'customer_id': customer.id, 'loan_amount': 10000, 'interest_rate': 18, 'tenure': 12}}) + '\n')
+            handle.flush()
+            with self.assertRaisesMessage(CommandError, '--allow-writes'):
+                call_command('benchmark_api', customers=2, loans=4, replay=handle.name, concurrency=1, stdout=StringIO())
+        self.assertFalse(customer.loan_set.exists())
+        self.assertFalse(Customer.objects.filter(last_name='Benchmark').exists())
+
+    def test_rendering_benchmark_output_matches(self):
+        import json
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('benchmark_rendering', loans=200, repeat=2, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report['loans'], 200)
+        self.assertTrue(report['identical'])
+        self.assertGreater(report['legacy_cpu_ms'], 0)
+        self.assertFalse(Customer.objects.filter(last_name='Benchmark').exists())
+
+class RequestMetricsTest(APITestCase):
+    # Upper bounds on SQL queries per request, with a warm credit snapshot
+    QUERY_BUDGETS = {
+        'register': 1,
+        'check-eligibility': 1,
+        'check-eligibility-batch': 1,
+        # Includes the SAVEPOINT/RELEASE pairs of its two atomic blocks
+        'create-loan': 10,
+        'view-loan': 1,
+        'view-loans': 2,
+    }
+    def setUp(self):
+        from datetime import date
+        from .metrics import clear_metrics
+        from .snapshots import refresh_credit_snapshot
+        clear_credit_caches()
+        clear_metrics()
+        self.customer = Customer.objects.create(
+            first_name="Metrics",
+            last_name="Test",
+            age=33,
+            monthly_salary=100000,
+            phone_number="1616161616",
+            approved_limit=3600000,
+            current_debt=0
+        )
+        self.loan = Loan.objects.create(
+            customer=self.customer,
+            loan_amount=200000,
+            tenure=60,
+            interest_rate=11.0,
+            monthly_repayment=4348.54,
+            emis_paid_on_time=60,
+            start_date=date(2015, 1, 1),
+            end_date=date(2020, 1, 1)
+        )
+        refresh_credit_snapshot(self.customer.id)
+        self.loan_request = {"customer_id": self.customer.id, "loan_amount": 100000, "interest_rate": 14, "tenure": 12}
+    def request(self, endpoint):
+        if endpoint == 'register':
+            data = {"first_name": "Budget", "last_name": "Test", "age": 30, "monthly_income": 50000, "phone_number": "1717171717"}
+            return self.client.post(reverse('register'), data, format='json')
+        if endpoint == 'check-eligibility-batch':
+            return self.client.post(reverse(endpoint), [self.loan_request] * 3, format='json')
+        if endpoint in ('check-eligibility', 'create-loan'):
+            return self.client.post(reverse(endpoint), self.loan_request, format='json')
+        if endpoint == 'view-loan':
+            return self.client.get(reverse(endpoint, args=[self.loan.id]))
+        return self.client.get(reverse(endpoint, args=[self.customer.id]))
+    def test_query_budgets(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        for endpoint, budget in self.QUERY_BUDGETS.items():
+            with self.subTest(endpoint=endpoint), CaptureQueriesContext(connection) as queries:
+                response = self.request(endpoint)
+                self.assertLess(response.status_code, 400)
+                self.assertLessEqual(len(queries), budget)
+    def test_metrics_endpoint(self):
+        self.request('view-loans')
+        self.request('view-loans')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('credit_http_requests_total{endpoint="view-loans",method="GET",status="200"} 2', body)
+        self.assertIn('credit_http_db_queries_bucket{endpoint="view-loans",method="GET",le="2"} 2', body)
+        self.assertIn('credit_http_request_duration_seconds_count{endpoint="view-loans",method="GET"} 2', body)
+        self.assertIn('credit_http_serialization_duration_seconds_count{endpoint="view-loans",method="GET"} 2', body)
+        # Scrapes are not recorded
+        self.assertNotIn('endpoint="metrics"', body)
+    def test_server_timing_header(self):
+        from django.test import override_settings
+        self.assertNotIn('Server-Timing', self.request('view-loan'))
+        with override_settings(CREDIT_METRICS={'SERVER_TIMING': True}):
+            self.client = self.client_class()
+            response = self.request('view-loan')
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+        self.assertIn('render;dur=', response['Server-Timing'])
+        self.assertIn('total;dur=', response['Server-Timing'])
+    async def test_async_requests_are_recorded(self):
+        from .metrics import render_metrics
+        response = await self.async_client.get(reverse('async-view-loan', args=[self.loan.id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = render_metrics()
+        # The query runs in a worker thread via the async ORM and still counts toward the request
+        self.assertIn('credit_http_db_queries_bucket{endpoint="async-view-loan",method="GET",le="0"} 0', body)
+        self.assertIn('credit_http_db_queries_bucket{endpoint="async-view-loan",method="GET",le="1"} 1', body)
+
+class StructuredLoggingTest(APITestCase):
+    def make_record(self, level=20, sampled=False, **extra):
+        import logging
+        record = logging.getLogger('api.views').makeRecord(
+            'api.views', level, __file__, 1, "Viewed loan %s for customer %s.", (7, 3), None, extra={'sampled': sampled, **extra}
+        )
+        return record
+    def test_json_formatter_includes_extra_fields(self):
+        import json
+        from .log import JSONFormatter, RequestIDFilter, reset_request_id, set_request_id
+        record = self.make_record(event='loan_viewed', loan_id=7, customer_id=3)
+        token = set_request_id('req-1')
+        try:
+            RequestIDFilter().filter(record)
+        finally:
+            reset_request_id(token)
+        entry = json.loads(JSONFormatter().format(record))
+        self.assertEqual(entry['message'], 'Viewed loan 7 for customer 3.')
+        self.assertEqual(entry['level'], 'INFO')
+        self.assertEqual((entry['event'], entry['loan_id'], entry['customer_id']), ('loan_viewed', 7, 3))
+        self.assertEqual(entry['request_id'], 'req-1')
+        self.assertNotIn('sampled', entry)
+    def test_sampling_only_drops_sampled_info_records(self):
+        from .log import SampledFilter
+        never = SampledFilter(rate=0)
+        self.assertFalse(never.filter(self.make_record(sampled=True)))
+        self.assertTrue(never.filter(self.make_record(sampled=False)))
+        self.assertTrue(never.filter(self.make_record(level=30, sampled=True)))
+        self.assertTrue(SampledFilter(rate=1).filter(self.make_record(sampled=True)))
+    def test_queue_handler_writes_in_background(self):
+        import io
+        import json
+        import threading
+        from .log import JSONFormatter, QueueStreamHandler
+        stream = io.StringIO()
+        handler = QueueStreamHandler(stream, maxsize=1)
+        formatted_on = []
+        class RecordingFormatter(JSONFormatter):
+            def format(self, record):
+                formatted_on.append(threading.current_thread())
+                return super().format(record)
+        handler.setFormatter(RecordingFormatter())
+        handler.handle(self.make_record())
+        handler.close()
+        self.assertEqual(json.loads(stream.getvalue())['message'], 'Viewed loan 7 for customer 3.')
+        self.assertNotEqual(formatted_on, [threading.current_thread()])
+        # A full queue drops the record instead of blocking the caller
+        blocked = QueueStreamHandler(io.StringIO(), maxsize=1)
+        blocked.stop_listener()
+        blocked.handle(self.make_record())
+        blocked.handle(self.make_record())
+        self.assertEqual(blocked.dropped, 1)
+        blocked.queue.get_nowait()
+        blocked.close()
+    def test_queue_handler_writes_from_forked_child(self):
+        import json
+        import os
+        import tempfile
+        from .log import JSONFormatter, QueueStreamHandler
+        with tempfile.TemporaryFile('w+') as stream:
+            handler = QueueStreamHandler(stream)
+            handler.setFormatter(JSONFormatter())
+            # As a Celery prefork worker does: fork after logging is configured, then log in the child
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    handler.handle(self.make_record())
+                    handler.stop_listener()
+                    stream.flush()
+                finally:
+                    os._exit(0)
+            os.waitpid(pid, 0)
+            handler.close()
+            stream.seek(0)
+            self.assertEqual(json.loads(stream.read())['message'], 'Viewed loan 7 for customer 3.')
+    def test_request_id_header(self):
+        response = self.client.get('/metrics', HTTP_X_REQUEST_ID='abc123')
+        self.assertEqual(response['X-Request-ID'], 'abc123')
+        self.assertEqual(len(self.client.get('/metrics')['X-Request-ID']), 32)
+
+class EligibilityRulesTest(APITestCase):
+    RULES = {
+        "version": 7,
+        "emi_cap_ratio": 0.4,
+        "slabs": [
+            {"above": None, "min_rate": 20, "approve": False, "message": "No."},
+            {"above": 60, "min_rate": 10, "rate_above": 10},
+        ],
+    }
+    def write_rules(self, rules):
+        import json
+        import os
+        import tempfile
+        handle, path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(handle, 'w') as rules_file:
+            json.dump(rules, rules_file)
+        self.addCleanup(os.remove, path)
+        return path
+    def tearDown(self):
+        from .rules import reload_rules
+        reload_rules()
+    def test_slab_lookup_boundaries(self):
+        from .rules import current_rules
+        rules = current_rules()
+        self.assertEqual(rules.thresholds, (10.0, 30.0, 50.0))
+        self.assertEqual([rules.slab_for(score).min_rate for score in (0, 10, 10.5, 30, 31, 50, 51, 100)], [100, 100, 16, 16, 12, 12, 0, 0])
+    def test_shipped_rules_decisions(self):
+        from .utils import CreditFeatures, CreditProfile, assess_eligibility
+        def decide(score, rate, emis=0):
+            features = CreditFeatures(current_emis_sum=emis)
+            profile = CreditProfile(1, 100000, 0, features, score)
+            decision = assess_eligibility(profile, features, score, 100000, rate, 12)
+            return decision.approval, decision.corrected_interest_rate, decision.message
+        self.assertEqual(decide(51, 0), (True, 0, ''))
+        self.assertEqual(decide(50, 12), (False, 12, ''))
+        self.assertEqual(decide(50, 12.5), (True, 12.5, ''))
+        self.assertEqual(decide(30, 10), (False, 16, 'Interest rate too low for credit score. Minimum required: 16%.'))
+        self.assertEqual(decide(10, 20), (False, 100, 'Interest rate too low for credit score. Minimum required: 100%.'))
+        self.assertEqual(decide(80, 14, emis=50001), (False, 14, 'Sum of current EMIs exceeds 50% of monthly salary.'))
+    def test_rules_file_is_hot_reloaded(self):
+        import json
+        from django.test import override_settings
+        from .rules import current_rules, reload_rules
+        path = self.write_rules(self.RULES)
+        with override_settings(ELIGIBILITY_RULES_FILE=path, ELIGIBILITY_RULES_RELOAD_INTERVAL=0):
+            rules = current_rules()
+            self.assertEqual(rules.version, 7)
+            self.assertEqual(rules.slab_for(61).min_rate, 10)
+            self.assertEqual(rules.slab_for(60).message, 'No.')
+            # Edits are picked up without a restart
+            with open(path, 'w') as rules_file:
+                json.dump({**self.RULES, "version": 8, "emi_cap_ratio": 0.3}, rules_file)
+            self.assertEqual(current_rules().emi_cap_ratio, 0.3)
+            # A broken file keeps the last good rules
+            with open(path, 'w') as rules_file:
+                rules_file.write('{"version": 9, "slabs": []}')
+            with self.assertLogs('api.rules', 'ERROR'):
+                self.assertEqual(reload_rules().version, 8)
+    def test_invalid_rules_are_rejected(self):
+        from .rules import compile_rules
+        with self.assertRaises(ValueError):
+            compile_rules({"version": 1, "emi_cap_ratio": 0.5, "slabs": [{"above": 10, "min_rate": 1}]})
+        with self.assertRaises(ValueError):
+            compile_rules({"version": 1, "emi_cap_ratio": 0.5, "slabs": [{"above": None, "min_rate": 1}, {"above": 5, "min_rate": 1}, {"above": 5, "min_rate": 2}]})
+        with self.assertRaises(ValueError):
+            compile_rules({"version": 1, "emi_cap_ratio": 0.5, "slabs": [{"above": None, "minimum": 1}]})
+
+class PortfolioScoringTest(APITestCase):
+    def test_scores_match_per_customer_scoring(self):
+        from .benchmark import create_dataset
+        from .models import CustomerCreditScore
+        from .portfolio import score_portfolio
+        from .rules import current_rules
+        from .utils import calculate_credit_score, with_credit_features
+        customer_ids = create_dataset(60, 400, seed=3)
+        # One customer without loans, and one over their approved limit
+        Customer.objects.filter(id=customer_ids[0]).update(approved_limit=0)
+        Loan.objects.filter(customer_id=customer_ids[1]).delete()
+        with self.assertNumQueries(6):
+            stats = score_portfolio(chunk_size=25)
+        self.assertEqual(stats['customers'], 60)
+        rules = current_rules()
+        scores = {score.customer_id: score for score in CustomerCreditScore.objects.all()}
+        # Score from the Loan table directly, as the deleted loans left a stale snapshot behind
+        for customer in with_credit_features(Customer.objects.filter(id__in=customer_ids)):
+            expected = calculate_credit_score(customer)
+            self.assertEqual(scores[customer.id].credit_score, expected)
+            self.assertEqual(rules.slabs[scores[customer.id].band], rules.slab_for(expected))
+            self.assertEqual(scores[customer.id].rules_version, rules.version)
+        self.assertEqual(scores[customer_ids[0]].credit_score, 0)
+        self.assertFalse(scores[customer_ids[0]].can_borrow)
+        # Re-running updates the rows in place
+        score_portfolio(chunk_size=25)
+        self.assertEqual(CustomerCreditScore.objects.count(), 60)
+
+class ParquetExportTest(APITestCase):
+    def setUp(self):
+        import tempfile
+        from datetime import date
+        self.output_dir = tempfile.mkdtemp()
+        self.customer = Customer.objects.create(
+            first_name="Export",
+            last_name="Test",
+            age=45,
+            monthly_salary=80000,
+            phone_number="1818181818",
+            approved_limit=2900000,
+            current_debt=0
+        )
+        self.loans = [
+            Loan.objects.create(
+                customer=self.customer, loan_amount=100000, tenure=12, interest_rate=10.0, monthly_repayment=8791.59,
+                emis_paid_on_time=12, start_date=date(year, 3, 1), end_date=date(year + 1, 3, 1)
+            )
+            for year in (2019, 2019, 2022)
+        ]
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.output_dir)
+    def read(self, table):
+        import os
+        import pyarrow.dataset as ds
+        return ds.dataset(os.path.join(self.output_dir, table), format='parquet', partitioning='hive').to_table()
+    def test_partitioned_and_incremental_export(self):
+        import os
+        from datetime import timedelta
+        from django.utils import timezone
+        from .export import export_parquet
+        self.assertEqual(export_parquet(self.output_dir, chunk_size=2), {'customers': 1, 'loans': 3})
+        self.assertEqual(sorted(os.listdir(os.path.join(self.output_dir, 'loans'))), ['start_year=2019', 'start_year=2022'])
+        loans = self.read('loans')
+        self.assertEqual(sorted(loans['id'].to_pylist()), sorted(loan.id for loan in self.loans))
+        self.assertEqual(self.read('customers')['phone_number'].to_pylist(), ['1818181818'])
+
+        # Age the exported rows past the overlap window, then change one loan
+        past = timezone.now() - timedelta(hours=1)
+        Loan.objects.update(updated_at=past)
+        Customer.objects.update(updated_at=past)
+        from .export import read_state, write_state
+        write_state(self.output_dir, {table: past + timedelta(minutes=2) for table in read_state(self.output_dir)})
+        loan = self.loans[2]
+        loan.emis_paid_on_time = 11
+        loan.save()
+        # Saving a loan advances its customer's version, so the customer is exported again too
+        self.assertEqual(export_parquet(self.output_dir), {'customers': 1, 'loans': 1})
+        # The new version is appended to its partition alongside the old one
+        loans = self.read('loans')
+        versions = [emis for loan_id, emis in zip(loans['id'].to_pylist(), loans['emis_paid_on_time'].to_pylist()) if loan_id == loan.id]
+        self.assertEqual(sorted(versions), [11, 12])
+
+class PaymentLedgerTest(APITestCase):
+    def setUp(self):
+        from datetime import date
+        clear_credit_caches()
+        self.customer = Customer.objects.create(
+            first_name="Ledger",
+            last_name="Test",
+            age=33,
+            monthly_salary=60000,
+            phone_number="1919191919",
+            approved_limit=2200000,
+            current_debt=0
+        )
+        self.loan = Loan.objects.create(
+            customer=self.customer, loan_amount=60000, tenure=3, interest_rate=12.0, monthly_repayment=20000,
+            emis_paid_on_time=0, start_date=date(2024, 1, 1), end_date=date(2024, 3, 31)
+        )
+        self.url = reverse('record-payment')
+    def pay(self, payment_date, amount=20000, loan_id=None):
+        return self.client.post(self.url, {'loan_id': loan_id or self.loan.id, 'amount': amount, 'payment_date': payment_date}, format='json')
+    def test_record_payment_counts_on_time_and_late(self):
+        from .cache import credit_cache, get_credit_profile
+        from .snapshots import refresh_credit_snapshot
+        refresh_credit_snapshot(self.customer.id)
+        get_credit_profile(self.customer.id)
+        # The first instalment is due 2024-01-31, the second 2024-03-01
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.pay('2024-01-31')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(response.data['on_time'])
+        self.assertEqual(response.data['repayments_left'], 2)
+        self.assertIsNone(credit_cache.get(self.customer.id))
+        response = self.pay('2024-03-05')
+        self.assertFalse(response.data['on_time'])
+        self.assertEqual((response.data['emis_paid_on_time'], response.data['emis_paid_late']), (1, 1))
+        self.loan.refresh_from_db()
+        self.assertEqual((self.loan.emis_paid_on_time, self.loan.emis_paid_late), (1, 1))
+        self.customer.credit_snapshot.refresh_from_db()
+        self.assertEqual(self.customer.credit_snapshot.total_emis_paid_on_time, 1)
+        loans = self.client.get(reverse('view-loans', args=[self.customer.id])).data
+        self.assertEqual(loans[0]['repayments_left'], 1)
+    def test_record_payment_rejects_bad_requests(self):
+        self.assertEqual(self.pay('2024-01-10', amount=0).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.pay('not-a-date').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.pay('2024-01-10', loan_id=self.loan.id + 999).status_code, status.HTTP_404_NOT_FOUND)
+        for _ in range(3):
+            self.assertEqual(self.pay('2024-01-10').status_code, status.HTTP_201_CREATED)
+        response = self.pay('2024-01-10')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.loan.payment_set.count(), 3)
+    def test_ingest_payments_file(self):
+        import os
+        import tempfile
+        from django.core.management import call_command
+        from .payments import ingest_payments
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        with open(path, 'w') as f:
+            f.write('loan_id,payment_date,amount\n')
+            # Out of order within the file: settled in date order per loan
+            f.write(f'{self.loan.id},2024-04-05,20000\n')
+            f.write(f'{self.loan.id},2024-01-15,20000\n')
+            f.write(f'{self.loan.id},2024-02-20,20000\n')
+            f.write(f'{self.loan.id},2024-04-01,20000\n')
+            f.write(f'{self.loan.id + 999},2024-01-15,20000\n')
+            f.write(f'{self.loan.id},garbage,20000\n')
+        stats = ingest_payments(path, batch_size=2)
+        self.assertEqual(
+            {key: stats[key] for key in ('rows', 'on_time', 'late', 'missing_loans', 'repaid_loans', 'invalid')},
+            {'rows': 3, 'on_time': 2, 'late': 1, 'missing_loans': 1, 'repaid_loans': 1, 'invalid': 1},
+        )
+        self.loan.refresh_from_db()
+        self.assertEqual((self.loan.emis_paid_on_time, self.loan.emis_paid_late), (2, 1))
+        on_time = list(self.loan.payment_set.order_by('payment_date').values_list('on_time', flat=True))
+        self.assertEqual(on_time, [True, True, False])
+        call_command('ingest_payments', path, stdout=open(os.devnull, 'w'))
+        self.assertEqual(self.loan.payment_set.count(), 3)
+
+class IngestionUploadTest(APITestCase):
+    def setUp(self):
+        import shutil
+        import tempfile
+        from django.test import override_settings
+        self.upload_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.upload_dir)
+        settings_override = override_settings(INGESTION_UPLOAD_DIR=self.upload_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.customer = Customer.objects.create(
+            first_name="Upload",
+            last_name="Test",
+            age=41,
+            monthly_salary=90000,
+            phone_number="2020202020",
+            approved_limit=3200000,
+            current_debt=0
+        )
+    def csv_upload(self, rows):
+        import io
+        import pandas as pd
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        buffer = io.StringIO()
+        pd.DataFrame(rows).to_csv(buffer, index=False)
+        return SimpleUploadedFile('loans.csv', buffer.getvalue().encode(), content_type='text/csv')
+    def test_upload_queues_job_and_reports_progress(self):
+        import os
+        from datetime import date, timedelta
+        from unittest import mock
+        from .jobs import update_job
+        from .tasks import ingest_loan_data
+        upload = self.csv_upload({
+            'Customer ID': [self.customer.id, self.customer.id, 999999, self.customer.id],
+            'Loan ID': [1, 2, 3, 4],
+            'Loan Amount': [100000, 50000, 70000, 'bad'],
+            'Tenure': [12, 6, 12, 12],
+            'Interest Rate': [10.0, 11.0, 12.0, 10.0],
+            'Monthly payment': [8791.59, 8602.73, 6219.42, 8791.59],
+            'EMIs paid on Time': [3, 6, 1, 1],
+            'Date of Approval': [date.today(), date(2015, 1, 1), date.today(), date.today()],
+            'End Date': [date.today() + timedelta(days=365), date(2015, 7, 1), date.today(), date.today()],
+        })
+        # Run the task in-process instead of on a worker, recording each progress update
+        updates = []
+        def record_update(job_id, **fields):
+            updates.append(fields)
+            return update_job(job_id, **fields)
+        with mock.patch.object(ingest_loan_data, 'delay', side_effect=lambda *args, **kwargs: ingest_loan_data(*args, **kwargs)), \
+                mock.patch('api.tasks.update_job', side_effect=record_update):
+            response = self.client.post(reverse('ingest'), {'kind': 'loans', 'file': upload, 'batch_size': 2}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        job = self.client.get(response.data['status_url']).data
+        self.assertEqual(job['status'], 'finished')
+        self.assertEqual((job['rows'], job['invalid'], job['missing_customers']), (2, 1, 1))
+        self.assertEqual(job['errors'], [])
+        # One update per batch of two rows, then the loan-only finalizing step
+        progress = [(update['rows'], update['invalid'], update['missing_customers']) for update in updates if 'rows' in update]
+        self.assertEqual(progress, [(2, 0, 0), (2, 1, 1)])
+        self.assertEqual(updates[-1], {'status': 'finalizing'})
+        self.assertEqual(self.customer.loan_set.count(), 2)
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.current_debt, 100000)
+        # The uploaded file is deleted once the job is done
+        self.assertEqual(os.listdir(self.upload_dir), [])
+    def test_upload_validation_and_failed_jobs(self):
+        import os
+        import shutil
+        import tempfile
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .jobs import create_job, get_job, save_upload
+        from .tasks import ingest_customer_data
+        url = reverse('ingest')
+        upload = SimpleUploadedFile('customers.txt', b'nope')
+        self.assertEqual(self.client.post(url, {'kind': 'customers', 'file': upload}, format='multipart').status_code, status.HTTP_400_BAD_REQUEST)
+        upload = SimpleUploadedFile('customers.csv', b'x')
+        self.assertEqual(self.client.post(url, {'kind': 'payments', 'file': upload}, format='multipart').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(reverse('ingestion-job', args=['missing'])).status_code, status.HTTP_404_NOT_FOUND)
+        job = create_job('customers', 'broken.parquet')
+        with self.assertRaises(Exception):
+            ingest_customer_data('/nonexistent/broken.parquet', job_id=job['job_id'])
+        job = get_job(job['job_id'])
+        self.assertEqual(job['status'], 'failed')
+        self.assertEqual(len(job['errors']), 1)
+        # A failed job's upload is deleted too, but files outside the upload directory never are
+        upload = save_upload(job['job_id'], SimpleUploadedFile('broken.csv', b'not,a\nvalid,file\n'))
+        outside = os.path.join(tempfile.mkdtemp(), 'keep.csv')
+        self.addCleanup(shutil.rmtree, os.path.dirname(outside))
+        open(outside, 'w').close()
+        for path in (upload, outside):
+            with self.assertRaises(Exception):
+                ingest_customer_data(path, job_id=job['job_id'])
+        self.assertEqual(os.listdir(self.upload_dir), [])
+        self.assertTrue(os.path.exists(outside))
+
+@skipUnless(TEST_REPLICA, 'TEST_REPLICA_DATABASE is not set')
+class ReplicaRoutingTest(APITransactionTestCase):
+    databases = {'default', TEST_REPLICA} if TEST_REPLICA else {'default'}
+    def setUp(self):
+        from datetime import date
+        from django.test import override_settings
+        from .snapshots import refresh_credit_snapshot
+        clear_credit_caches()
+        settings_override = override_settings(DATABASE_REPLICAS=[TEST_REPLICA])
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.customer = Customer.objects.create(
+            first_name="Replica",
+            last_name="Test",
+            age=38,
+            monthly_salary=75000,
+            phone_number="2121212121",
+            approved_limit=2700000,
+            current_debt=0
+        )
+        self.loan = Loan.objects.create(
+            customer=self.customer, loan_amount=100000, tenure=12, interest_rate=10.0, monthly_repayment=8791.59,
+            emis_paid_on_time=12, start_date=date(2018, 1, 1), end_date=date(2019, 1, 1)
+        )
+        refresh_credit_snapshot(self.customer.id)
+    def queries_by_alias(self, request):
+        """Run `request`, returning (its result, SELECTs run on the primary, SELECTs run on the replica)."""
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connections['default']) as primary, CaptureQueriesContext(connections[TEST_REPLICA]) as replica:
+            response = request()
+        def selects(context):
+            return sum(query['sql'].startswith('SELECT') for query in context.captured_queries)
+        return response, selects(primary), selects(replica)
+    def test_reads_go_to_the_replica_until_the_customer_writes(self):
+        for request in (
+            lambda: self.client.get(reverse('view-loan', args=[self.loan.id])),
+            lambda: self.client.get(reverse('view-loans', args=[self.customer.id])),
+            lambda: self.client.get(reverse('async-view-loans', args=[self.customer.id])),
+            lambda: self.client.post(reverse('check-eligibility'), {'customer_id': self.customer.id, 'loan_amount': 100000, 'interest_rate': 14, 'tenure': 12}, format='json'),
+        ):
+            response, primary, replica = self.queries_by_alias(request)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertGreater(replica, 0)
+            self.assertEqual(primary, 0)
+        # Creating a loan writes to the primary and pins the customer there
+        response, _, replica = self.queries_by_alias(lambda: self.client.post(
+            reverse('create-loan'), {'customer_id': self.customer.id, 'loan_amount': 100000, 'interest_rate': 18, 'tenure': 12}, format='json'
+        ))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(replica, 0)
+        response, primary, replica = self.queries_by_alias(lambda: self.client.get(reverse('view-loans', args=[self.customer.id])))
+        self.assertEqual(len(response.data), 2)
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+    def test_snapshots_are_rebuilt_from_the_primary(self):
+        from .models import CustomerCreditSnapshot
+        data = {'customer_id': self.customer.id, 'loan_amount': 100000, 'interest_rate': 14, 'tenure': 12}
+        for path in (reverse('check-eligibility'), reverse('async-check-eligibility')):
+            CustomerCreditSnapshot.objects.all().delete()
+            clear_credit_caches()
+            response, primary, replica = self.queries_by_alias(lambda: self.client.post(path, data, format='json'))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            # The customer is read from the replica, the loans the snapshot is built from from the primary
+            self.assertEqual(replica, 1)
+            self.assertEqual(primary, 2)
+            self.assertEqual(CustomerCreditSnapshot.objects.get(customer=self.customer).num_loans_taken, 1)
+    def test_fallback_to_primary_and_jobs(self):
+        from django.db import router
+        from .db_router import read_with_fallback
+        from .portfolio import score_portfolio
+        # Nothing found on the replica (not replicated yet): the read is retried on the primary
+        seen = []
+        result, alias = read_with_fallback(lambda: seen.append(router.db_for_read(Loan)))
+        self.assertEqual((seen, alias), ([TEST_REPLICA, 'default'], 'default'))
+        # Writes always go to the primary
+        self.assertEqual(router.db_for_write(Loan), 'default')
+        # Portfolio scoring extracts from the replica and upserts on the primary
+        _, primary, replica = self.queries_by_alias(score_portfolio)
+        self.assertEqual((primary, replica), (0, 1))
+
+class ConditionalGetTest(APITestCase):
+    def setUp(self):
+        from datetime import date
+        clear_credit_caches()
+        self.customer = Customer.objects.create(
+            first_name="Etag",
+            last_name="Test",
+            age=36,
+            monthly_salary=85000,
+            phone_number="2323232323",
+            approved_limit=3100000,
+            current_debt=0
+        )
+        self.loan = Loan.objects.create(
+            customer=self.customer, loan_amount=100000, tenure=24, interest_rate=10.0, monthly_repayment=4614.49,
+            emis_paid_on_time=12, start_date=date(2018, 1, 1), end_date=date(2020, 1, 1)
+        )
+    def test_view_loans_not_modified(self):
+        url = reverse('view-loans', args=[self.customer.id])
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        # Only the customer's version is read
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+        # Pages are tagged separately
+        page = self.client.get(url, {'page_size': 1})
+        self.assertNotEqual(page['ETag'], etag)
+        self.assertEqual(self.client.get(url, {'page_size': 1}, HTTP_IF_NONE_MATCH=page['ETag']).status_code, status.HTTP_304_NOT_MODIFIED)
+        # A new loan changes the list
+        created = self.client.post(reverse('create-loan'), {'customer_id': self.customer.id, 'loan_amount': 50000, 'interest_rate': 18, 'tenure': 6}, format='json')
+        self.assertEqual(created.status_code, status.HTTP_201_CREATED)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+        self.assertNotEqual(response['ETag'], etag)
+    def test_view_loan_not_modified(self):
+        url = reverse('view-loan', args=[self.loan.id])
+        with self.assertNumQueries(1):
+            etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(reverse('async-view-loan', args=[self.loan.id]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        # Payments and debt recomputation advance the versions
+        self.client.post(reverse('record-payment'), {'loan_id': self.loan.id, 'amount': 4614.49, 'payment_date': '2019-01-20'}, format='json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        etag = response['ETag']
+        from .ingestion import recompute_current_debt
+        Customer.objects.filter(id=self.customer.id).update(current_debt=1)
+        recompute_current_debt([self.customer.id])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.get(reverse('view-loan', args=[self.loan.id + 999]), HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_404_NOT_FOUND)
+    def test_save_advances_versions(self):
+        loan_url = reverse('view-loan', args=[self.loan.id])
+        loans_url = reverse('view-loans', args=[self.customer.id])
+        loan_etag, loans_etag = self.client.get(loan_url)['ETag'], self.client.get(loans_url)['ETag']
+        # As the admin would: a full save() of a fetched row
+        customer = Customer.objects.get(id=self.customer.id)
+        customer.first_name = "Edited"
+        version = customer.version
+        customer.save()
+        self.assertEqual(customer.version, version + 1)
+        response = self.client.get(loan_url, HTTP_IF_NONE_MATCH=loan_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['customer']['first_name'], "Edited")
+        loan_etag = response['ETag']
+        loan = Loan.objects.get(id=self.loan.id)
+        loan.loan_amount = 120000
+        loan.save()
+        response = self.client.get(loan_url, HTTP_IF_NONE_MATCH=loan_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['loan_amount'], 120000)
+        response = self.client.get(loans_url, HTTP_IF_NONE_MATCH=loans_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['loan_amount'], 120000)
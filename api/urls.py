@@ -1,16 +1,39 @@
 from django.urls import path
+from .async_views import (
+    AsyncCheckEligibilityView,
+    AsyncCreateLoanView,
+    AsyncViewLoanView,
+    AsyncViewLoansView,
+)
 from .views import (
     RegisterView, 
+    RegisterBatchView,
     CheckEligibilityView, 
+    CheckEligibilityBatchView,
+    CreditCacheStatsView,
+    IngestionJobView,
+    IngestionUploadView,
     CreateLoanView, 
+    RecordPaymentView,
     ViewLoanView, 
     ViewLoansView
 )
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
+    path('register/batch/', RegisterBatchView.as_view(), name='register-batch'),
     path('check-eligibility/', CheckEligibilityView.as_view(), name='check-eligibility'),
+    path('check-eligibility/batch/', CheckEligibilityBatchView.as_view(), name='check-eligibility-batch'),
+    path('ingest/', IngestionUploadView.as_view(), name='ingest'),
+    path('ingest/<str:job_id>/', IngestionJobView.as_view(), name='ingestion-job'),
+    path('cache-stats/', CreditCacheStatsView.as_view(), name='cache-stats'),
     path('create-loan/', CreateLoanView.as_view(), name='create-loan'),
+    path('record-payment/', RecordPaymentView.as_view(), name='record-payment'),
     path('view-loan/<int:loan_id>/', ViewLoanView.as_view(), name='view-loan'),
     path('view-loans/<int:customer_id>/', ViewLoansView.as_view(), name='view-loans'),
+    # Async variants, for ASGI deployments
+    path('async/check-eligibility/', AsyncCheckEligibilityView.as_view(), name='async-check-eligibility'),
+    path('async/create-loan/', AsyncCreateLoanView.as_view(), name='async-create-loan'),
+    path('async/view-loan/<int:loan_id>/', AsyncViewLoanView.as_view(), name='async-view-loan'),
+    path('async/view-loans/<int:customer_id>/', AsyncViewLoansView.as_view(), name='async-view-loans'),
 ] 
\ No newline at end of file
@@ -1,10 +1,90 @@
-from .models import Loan
-from django.db.models import Sum
-from datetime import datetime
+from django.db.models import Count, Q, Sum
+from datetime import date
+from typing import NamedTuple
 
-def calculate_credit_score(customer):
+
+class CreditFeatures(NamedTuple):
+    """Scoring inputs for one customer, derived from their loan history."""
+    total_emis_paid_on_time: int = 0
+    num_loans_taken: int = 0
+    loans_in_current_year: int = 0
+    loan_approved_volume: float = 0
+    current_loans_sum: float = 0
+    current_emis_sum: float = 0
+
+
+def credit_feature_expressions(prefix=''):
+    """
+    Build the conditional aggregates for every CreditFeatures field.
+    `prefix` is the lookup path from the queried model to Loan, e.g. 'loan__'
+    when aggregating from Customer, or '' when aggregating over Loan directly.
+    """
+    today = date.today()
+    active = Q(**{f'{prefix}end_date__gte': today})
+    # A plain date range rather than start_date__year, so the (customer, start_date) index applies
+    this_year = Q(**{
+        f'{prefix}start_date__gte': date(today.year, 1, 1),
+        f'{prefix}start_date__lt': date(today.year + 1, 1, 1),
+    })
+    return {
+        'total_emis_paid_on_time': Sum(f'{prefix}emis_paid_on_time'),
+        'num_loans_taken': Count(f'{prefix}id'),
+        'loans_in_current_year': Count(f'{prefix}id', filter=this_year),
+        'loan_approved_volume': Sum(f'{prefix}loan_amount'),
+        'current_loans_sum': Sum(f'{prefix}loan_amount', filter=active),
+        'current_emis_sum': Sum(f'{prefix}monthly_repayment', filter=active),
+    }
+
+
+def with_credit_features(queryset):
+    """
+    Annotate a Customer queryset with all credit features so that fetching a
+    customer and its scoring inputs is a single query.
+    """
+    expressions = credit_feature_expressions('loan__')
+    return queryset.annotate(**{f'credit_{name}': expr for name, expr in expressions.items()})
+
+
+def features_from_snapshot(snapshot, today):
+    """Read CreditFeatures off a CustomerCreditSnapshot."""
+    return CreditFeatures(
+        total_emis_paid_on_time=snapshot.total_emis_paid_on_time,
+        num_loans_taken=snapshot.num_loans_taken,
+        loans_in_current_year=snapshot.loans_per_year.get(str(today.year), 0),
+        loan_approved_volume=snapshot.loan_approved_volume,
+        current_loans_sum=snapshot.active_loan_sum,
+        current_emis_sum=snapshot.active_emi_sum,
+    )
+
+
+def get_credit_features(customer):
+    """
+    Return the CreditFeatures for a customer. Uses the annotations added by
+    with_credit_features() when present, otherwise the customer's
+    CustomerCreditSnapshot (fetch it with select_related('credit_snapshot')
+    to keep this query-free). A missing or stale snapshot is rebuilt first.
+    """
+    if hasattr(customer, 'credit_num_loans_taken'):
+        values = {name: getattr(customer, f'credit_{name}') for name in CreditFeatures._fields}
+        return CreditFeatures(**{name: value or 0 for name, value in values.items()})
+
+    from .models import CustomerCreditSnapshot
+    from .snapshots import refresh_credit_snapshot
+
+    today = date.today()
+    try:
+        snapshot = customer.credit_snapshot
+    except CustomerCreditSnapshot.DoesNotExist:
+        snapshot = None
+    if snapshot is None or not snapshot.is_fresh(today):
+        snapshot = refresh_credit_snapshot(customer.id)
+        customer.credit_snapshot = snapshot
+    return features_from_snapshot(snapshot, today)
+
+
+def score_credit_features(features, approved_limit):
     """
-    Calculate the credit score for a customer based on:
+    Calculate the credit score from precomputed features:
     - Past loans paid on time (+1 per EMI, max 50)
     - Loan activity in current year (+5 per loan, max 15)
     - Loan approved volume (+1 per 100,000, max 20)
@@ -12,28 +92,70 @@ def calculate_credit_score(customer):
     - If sum of current loans > approved limit, score = 0 (hard rule)
     Score is clamped between 0 and 100.
     """
-    loans = Loan.objects.filter(customer=customer)
-    total_emis_paid_on_time = loans.aggregate(Sum('emis_paid_on_time'))['emis_paid_on_time__sum'] or 0
-    num_loans_taken = loans.count()
-    current_year = datetime.now().year
-    loans_in_current_year = loans.filter(start_date__year=current_year).count()
-    loan_approved_volume = loans.aggregate(Sum('loan_amount'))['loan_amount__sum'] or 0
-    
     # Hard rule: if sum of current loans > approved limit, score = 0
-    current_loans = loans.filter(end_date__gte=datetime.now())
-    current_loans_sum = current_loans.aggregate(Sum('loan_amount'))['loan_amount__sum'] or 0
-    if current_loans_sum > customer.approved_limit:
+    if features.current_loans_sum > approved_limit:
         return 0
 
     # Point-based scoring
     score = 0
-    score += min(total_emis_paid_on_time, 50)  # up to 50 points for EMIs paid on time
-    score += min(loans_in_current_year * 5, 15)  # up to 15 points for current year activity
-    score += min(loan_approved_volume // 100000, 20)  # up to 20 points for volume
-    score -= min(num_loans_taken * 2, 15)  # penalty for too many loans
+    score += min(features.total_emis_paid_on_time, 50)  # up to 50 points for EMIs paid on time
+    score += min(features.loans_in_current_year * 5, 15)  # up to 15 points for current year activity
+    score += min(features.loan_approved_volume // 100000, 20)  # up to 20 points for volume
+    score -= min(features.num_loans_taken * 2, 15)  # penalty for too many loans
     score = max(0, min(100, score))  # Clamp between 0 and 100
     return score
 
+
+def evaluate_credit(customer):
+    """Return (features, credit_score) for a customer."""
+    features = get_credit_features(customer)
+    return features, score_credit_features(features, customer.approved_limit)
+
+
+def calculate_credit_score(customer):
+    """Calculate the credit score for a customer (see score_credit_features)."""
+    return evaluate_credit(customer)[1]
+
+
+class CreditProfile(NamedTuple):
+    """Everything the eligibility rules need about a customer; small enough to cache."""
+    customer_id: int
+    monthly_salary: int
+    approved_limit: int
+    features: CreditFeatures
+    credit_score: float
+
+
+def build_credit_profile(customer):
+    features, credit_score = evaluate_credit(customer)
+    return CreditProfile(customer.id, customer.monthly_salary, customer.approved_limit, features, credit_score)
+
+
+class EligibilityDecision(NamedTuple):
+    """Outcome of the approval rules for one loan request."""
+    approval: bool
+    corrected_interest_rate: float
+    monthly_installment: float
+    message: str = ''
+
+
+def assess_eligibility(customer, features, credit_score, loan_amount, interest_rate, tenure):
+    """
+    Apply the approval rules in force (see api.rules and eligibility_rules.json)
+    to a loan request. With the shipped rules:
+    - credit_score > 50: approve
+    - 30 < credit_score <= 50: approve if interest_rate > 12%
+    - 10 < credit_score <= 30: approve if interest_rate > 16%
+    - credit_score <= 10: do not approve
+    - sum of current EMIs > 50% of monthly salary: do not approve
+    An interest rate below the slab's minimum is corrected to the minimum.
+    """
+    from .rules import current_rules, decide
+
+    decision = decide(current_rules(), credit_score, interest_rate, features.current_emis_sum, customer.monthly_salary)
+    monthly_installment = calculate_emi(loan_amount, decision.corrected_interest_rate, tenure)
+    return EligibilityDecision(decision.approval, decision.corrected_interest_rate, monthly_installment, decision.message)
+
 # Compound interest EMI calculation
 # P = principal, r = monthly rate, n = tenure (months)
 def calculate_emi(principal, annual_rate, tenure):
@@ -49,4 +171,4 @@ def calculate_emi(principal, annual_rate, tenure):
     if r == 0:
         return principal / tenure
     emi = principal * r * ((1 + r) ** tenure) / (((1 + r) ** tenure) - 1)
-    return round(emi, 2) 
\ No newline at end of file
+    return round(emi, 2)
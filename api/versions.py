@@ -0,0 +1,62 @@
+"""
+Version counters and conditional GETs for the loan views.
+
+Customer.version advances whenever the customer or any of their loans changes,
+and Loan.version whenever the loan itself does; updated_at moves with them and
+serves as Last-Modified. Model.save() (so the admin too) advances them, as
+does saving or deleting a loan for its customer; bulk writes call
+bump_versions(). A view-loan ETag combines the loan's and its customer's
+versions (loan rows rewritten by ingestion only advance the customer's), and a
+view-loans ETag is the customer's version plus the query string. A matching
+If-None-Match is answered with a 304 after looking up the versions alone,
+before any loan is loaded or serialized.
+"""
+import hashlib
+from urllib.parse import urlencode
+
+from django.db.models import F
+from django.db.models.functions import Now
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+# Loan fields (and the customer's) a view-loan ETag is computed from
+LOAN_VERSION_FIELDS = ('version', 'updated_at', 'customer__version', 'customer__updated_at')
+CUSTOMER_VERSION_FIELDS = ('version', 'updated_at')
+
+
+def bump_versions(queryset):
+    """Advance the version and updated_at of every row in `queryset` with one UPDATE."""
+    return queryset.update(version=F('version') + 1, updated_at=Now())
+
+
+def is_conditional(request):
+    return 'HTTP_IF_NONE_MATCH' in request.META or 'HTTP_IF_MODIFIED_SINCE' in request.META
+
+
+def loan_validators(loan_id, versions):
+    """(ETag, Last-Modified) for view-loan, from a LOAN_VERSION_FIELDS values() row."""
+    etag = quote_etag(f"loan-{loan_id}-{versions['version']}.{versions['customer__version']}")
+    return etag, max(versions['updated_at'], versions['customer__updated_at'])
+
+
+def loans_validators(customer_id, versions, params):
+    """(ETag, Last-Modified) for view-loans, from a CUSTOMER_VERSION_FIELDS values() row and the query parameters."""
+    tag = f"loans-{customer_id}-{versions['version']}"
+    if params:
+        # Pages and formats of the list are different representations
+        tag += '-' + hashlib.sha1(urlencode(sorted(params.lists()), doseq=True).encode()).hexdigest()[:12]
+    return quote_etag(tag), versions['updated_at']
+
+
+def set_validators(response, etag, last_modified):
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def not_modified(request, etag, last_modified):
+    """The 304 (or 412) response the request's preconditions call for, or None to serve it in full."""
+    response = get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
@@ -1,27 +1,66 @@
+import base64
+import binascii
 import logging
+import numpy as np
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import reverse
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status
+from rest_framework import serializers, status
 from .models import Customer
-from .serializers import CustomerSerializer
-from .utils import calculate_credit_score, calculate_emi
+from .serializers import CustomerRegistrationSerializer, CustomerSerializer
+from .cache import credit_cache, get_credit_profile
+from .db_router import pin_customer, pinned_customers, read_with_fallback, reading_from, replica_for_read
+from .ingestion import DEFAULT_BATCH_SIZE, WRITE_METHODS
+from .jobs import UPLOAD_EXTENSIONS, create_job, get_job, remove_upload, save_upload, update_job
+from .metrics import render_metrics
+from .payments import record_payments
+from .renderers import dumps
+from .snapshots import record_new_loan
+from .tasks import ingest_customer_data, ingest_loan_data
+from .utils import assess_eligibility, evaluate_credit, with_credit_features
+from .versions import (
+    CUSTOMER_VERSION_FIELDS,
+    LOAN_VERSION_FIELDS,
+    is_conditional,
+    loan_validators,
+    loans_validators,
+    not_modified,
+    set_validators,
+)
 from .models import Loan
-from django.db.models import Sum
-from datetime import datetime, timedelta
+from datetime import date, timedelta
 
 logger = logging.getLogger(__name__)
 
+# Batch eligibility: maximum items per request, customers loaded per query,
+# and the batch size above which the response is streamed
+MAX_ELIGIBILITY_BATCH = 10000
+ELIGIBILITY_CHUNK_SIZE = 1000
+STREAM_ELIGIBILITY_ABOVE = 1000
+
+# Batch registration: maximum customers per request and rows per INSERT
+MAX_REGISTER_BATCH = 50000
+REGISTER_CHUNK_SIZE = 1000
+
 def round_to_nearest_lakh(amount):
     """Round the given amount to the nearest lakh (100,000)."""
     return int(round(amount / 100000.0) * 100000)
 
+def approved_limits(monthly_incomes):
+    """Vectorised round_to_nearest_lakh(36 * income): an int64 array of approved limits."""
+    # np.round rounds half to even, like round()
+    return (np.round(np.asarray(monthly_incomes, dtype=np.int64) * 36 / 100000.0) * 100000).astype(np.int64)
+
 class RegisterView(APIView):
     """API endpoint to register a new customer."""
     def post(self, request):
         data = request.data
         monthly_income = data.get('monthly_income')
         if not monthly_income:
-            logger.warning("Registration failed: monthly_income is required.")
+            logger.warning("Registration failed: monthly_income is required.", extra={'event': 'registration_failed'})
             return Response({'error': 'monthly_income is required'}, status=status.HTTP_400_BAD_REQUEST)
         approved_limit = round_to_nearest_lakh(36 * int(monthly_income))
         customer_data = {
@@ -35,7 +74,7 @@ class RegisterView(APIView):
         serializer = CustomerSerializer(data=customer_data)
         if serializer.is_valid():
             customer = serializer.save()
-            logger.info(f"Registered new customer: {customer.id} - {customer.first_name} {customer.last_name}")
+            logger.info("Registered new customer: %s - %s %s", customer.id, customer.first_name, customer.last_name, extra={'event': 'customer_registered', 'customer_id': customer.id})
             response_data = {
                 'customer_id': customer.id,
                 'name': f"{customer.first_name} {customer.last_name}",
@@ -45,9 +84,51 @@ class RegisterView(APIView):
                 'phone_number': customer.phone_number
             }
             return Response(response_data, status=status.HTTP_201_CREATED)
-        logger.warning(f"Registration failed: {serializer.errors}")
+        logger.warning("Registration failed: %s", serializer.errors, extra={'event': 'registration_failed'})
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+def register_customers(items):
+    """
+    Validate and insert a batch of registrations. Valid customers are inserted
+    with bulk_create, REGISTER_CHUNK_SIZE rows per INSERT, in one transaction.
+    Returns one result per item, in input order.
+    """
+    # One serializer validates every item, so its fields are only built once
+    serializer = CustomerRegistrationSerializer()
+    results = [None] * len(items)
+    valid = []
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise serializers.ValidationError({'non_field_errors': ['Each item must be an object']})
+            valid.append((index, serializer.run_validation(item)))
+        except serializers.ValidationError as exc:
+            results[index] = {'index': index, 'errors': exc.detail}
+    limits = approved_limits([data['monthly_salary'] for _, data in valid]).tolist()
+    customers = [Customer(**data, approved_limit=limit) for (_, data), limit in zip(valid, limits)]
+    with transaction.atomic():
+        Customer.objects.bulk_create(customers, batch_size=REGISTER_CHUNK_SIZE)
+    for (index, _), customer in zip(valid, customers):
+        results[index] = {'index': index, 'customer_id': customer.id, 'approved_limit': customer.approved_limit}
+    return results
+
+class RegisterBatchView(APIView):
+    """API endpoint to register many customers in one request."""
+    def post(self, request):
+        items = request.data.get('items') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'items must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > MAX_REGISTER_BATCH:
+            return Response({'error': f'At most {MAX_REGISTER_BATCH} items per batch'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = register_customers(items)
+        created = sum('customer_id' in result for result in results)
+        logger.info(
+            "Batch registration: %s of %s customers registered.", created, len(items),
+            extra={'event': 'customers_registered', 'items': len(items), 'registered': created},
+        )
+        return Response(results, status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST)
+
 class CheckEligibilityView(APIView):
     """API endpoint to check loan eligibility for a customer."""
     def post(self, request):
@@ -56,121 +137,210 @@ class CheckEligibilityView(APIView):
         interest_rate = float(request.data.get('interest_rate', 0))
         tenure = int(request.data.get('tenure', 0))
 
-        try:
-            customer = Customer.objects.get(id=customer_id)
-        except Customer.DoesNotExist:
-            logger.error(f"Eligibility check failed: Customer {customer_id} not found.")
+        # A customer registered moments ago may not have reached the replica yet
+        profile, _ = read_with_fallback(lambda: get_credit_profile(customer_id), customer_id)
+        if profile is None:
+            logger.error("Eligibility check failed: Customer %s not found.", customer_id, extra={'event': 'customer_not_found', 'customer_id': customer_id})
             return Response({'error': 'Customer not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        credit_score = calculate_credit_score(customer)
-        approval = False
-        corrected_interest_rate = interest_rate
-
-        # Approval logic based on credit score
-        if credit_score > 50:
-            approval = True
-            min_rate = 0
-        elif 30 < credit_score <= 50:
-            min_rate = 12
-            if interest_rate > 12:
-                approval = True
-            else:
-                corrected_interest_rate = 12
-        elif 10 < credit_score <= 30:
-            min_rate = 16
-            if interest_rate > 16:
-                approval = True
-            else:
-                corrected_interest_rate = 16
-        else:
-            min_rate = 100  # Not eligible
-            approval = False
-            corrected_interest_rate = 16
-
-        # If sum of all current EMIs > 50% of monthly salary, don’t approve any loans
-        current_loans = customer.loan_set.filter(end_date__gte=datetime.now())
-        sum_of_current_emis = current_loans.aggregate(Sum('monthly_repayment'))['monthly_repayment__sum'] or 0
-        if sum_of_current_emis > 0.5 * customer.monthly_salary:
-            approval = False
+        credit_score = profile.credit_score
+        decision = assess_eligibility(profile, profile.features, credit_score, loan_amount, interest_rate, tenure)
+        approval = decision.approval
 
-        # If the interest rate does not match as per credit limit, correct it in the response
-        if interest_rate < min_rate:
-            corrected_interest_rate = min_rate
-
-        monthly_installment = calculate_emi(loan_amount, corrected_interest_rate, tenure)
-
-        logger.info(f"Eligibility checked for customer {customer_id}: approval={approval}, credit_score={credit_score}")
+        logger.info(
+            "Eligibility checked for customer %s: approval=%s, credit_score=%s", customer_id, approval, credit_score,
+            extra={'event': 'eligibility_checked', 'customer_id': customer_id, 'approval': approval, 'credit_score': credit_score, 'sampled': True},
+        )
         response = {
-            'customer_id': customer.id,
+            'customer_id': profile.customer_id,
             'approval': approval,
             'interest_rate': interest_rate,
-            'corrected_interest_rate': corrected_interest_rate,
+            'corrected_interest_rate': decision.corrected_interest_rate,
             'tenure': tenure,
-            'monthly_installment': monthly_installment
+            'monthly_installment': decision.monthly_installment
         }
         return Response(response, status=status.HTTP_200_OK)
 
-class CreateLoanView(APIView):
-    """API endpoint to create a new loan for a customer if eligible."""
+def _parse_eligibility_item(item):
+    """Return (customer_id, loan_amount, interest_rate, tenure) or raise ValueError."""
+    if not isinstance(item, dict):
+        raise ValueError('Each item must be an object')
+    try:
+        customer_id = int(item['customer_id'])
+        loan_amount = float(item.get('loan_amount', 0))
+        interest_rate = float(item.get('interest_rate', 0))
+        tenure = int(item.get('tenure', 0))
+    except KeyError:
+        raise ValueError('customer_id is required')
+    except (TypeError, ValueError):
+        raise ValueError('customer_id, loan_amount, interest_rate and tenure must be numeric')
+    if tenure <= 0:
+        raise ValueError('tenure must be positive')
+    return customer_id, loan_amount, interest_rate, tenure
+
+
+def _score_customers(customer_ids, scored):
+    """Load and score customers with one query, adding them to `scored` by ID."""
+    if not customer_ids:
+        return
+    for customer in with_credit_features(Customer.objects).filter(id__in=customer_ids):
+        scored[customer.id] = (customer, *evaluate_credit(customer))
+
+
+def iter_eligibility_results(items):
+    """
+    Score a batch of eligibility requests in input order. Customers and their
+    credit features are loaded ELIGIBILITY_CHUNK_SIZE items at a time with one
+    query per chunk; each customer is scored once however often it appears.
+    """
+    scored = {}
+    for start in range(0, len(items), ELIGIBILITY_CHUNK_SIZE):
+        chunk = []
+        for item in items[start:start + ELIGIBILITY_CHUNK_SIZE]:
+            try:
+                chunk.append(_parse_eligibility_item(item))
+            except ValueError as exc:
+                chunk.append(exc)
+        wanted = {entry[0] for entry in chunk if not isinstance(entry, ValueError)} - scored.keys()
+        alias = replica_for_read()
+        with reading_from(alias):
+            _score_customers(wanted - pinned_customers(wanted), scored)
+        if alias != DEFAULT_DB_ALIAS:
+            # Customers pinned to the primary, or not on the replica yet, are read from the primary
+            with reading_from(DEFAULT_DB_ALIAS):
+                _score_customers(wanted - scored.keys(), scored)
+        for offset, entry in enumerate(chunk):
+            index = start + offset
+            if isinstance(entry, ValueError):
+                yield {'index': index, 'error': str(entry)}
+                continue
+            customer_id, loan_amount, interest_rate, tenure = entry
+            if customer_id not in scored:
+                yield {'index': index, 'customer_id': customer_id, 'error': 'Customer not found'}
+                continue
+            customer, features, credit_score = scored[customer_id]
+            decision = assess_eligibility(customer, features, credit_score, loan_amount, interest_rate, tenure)
+            yield {
+                'index': index,
+                'customer_id': customer_id,
+                'approval': decision.approval,
+                'interest_rate': interest_rate,
+                'corrected_interest_rate': decision.corrected_interest_rate,
+                'tenure': tenure,
+                'monthly_installment': decision.monthly_installment
+            }
+
+
+def _stream_json_array(results):
+    """Encode an iterable of dicts as a JSON array, one element at a time."""
+    yield b'['
+    for position, result in enumerate(results):
+        yield (b',' if position else b'') + dumps(result)
+    yield b']'
+
+
+class CheckEligibilityBatchView(APIView):
+    """API endpoint to check loan eligibility for many applications in one request."""
     def post(self, request):
-        customer_id = request.data.get('customer_id')
-        loan_amount = float(request.data.get('loan_amount', 0))
-        interest_rate = float(request.data.get('interest_rate', 0))
-        tenure = int(request.data.get('tenure', 0))
+        items = request.data.get('items') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'items must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > MAX_ELIGIBILITY_BATCH:
+            return Response({'error': f'At most {MAX_ELIGIBILITY_BATCH} items per batch'}, status=status.HTTP_400_BAD_REQUEST)
+
+        logger.info("Batch eligibility check for %s items.", len(items), extra={'event': 'eligibility_batch', 'items': len(items)})
+        results = iter_eligibility_results(items)
+        if len(items) > STREAM_ELIGIBILITY_ABOVE:
+            return StreamingHttpResponse(_stream_json_array(results), content_type='application/json')
+        return Response(list(results), status=status.HTTP_200_OK)
 
+class CreditCacheStatsView(APIView):
+    """API endpoint exposing this process's credit cache hit/miss counters."""
+    def get(self, request):
+        return Response(credit_cache.stats(), status=status.HTTP_200_OK)
+
+INGESTION_TASKS = {
+    'customers': ingest_customer_data,
+    'loans': ingest_loan_data,
+}
+
+class IngestionUploadView(APIView):
+    """API endpoint to upload a customer or loan file and ingest it on a Celery worker."""
+    def post(self, request):
+        kind = request.data.get('kind')
+        upload = request.FILES.get('file')
+        method = request.data.get('method') or 'bulk_create'
+        if kind not in INGESTION_TASKS:
+            return Response({'error': f"kind must be one of: {', '.join(INGESTION_TASKS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        if upload is None or not upload.name.lower().endswith(UPLOAD_EXTENSIONS):
+            return Response({'error': f"file must be one of: {', '.join(UPLOAD_EXTENSIONS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        if method not in WRITE_METHODS:
+            return Response({'error': f"method must be one of: {', '.join(WRITE_METHODS)}"}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            customer = Customer.objects.get(id=customer_id)
-        except Customer.DoesNotExist:
-            logger.error(f"Loan creation failed: Customer {customer_id} not found.")
-            return Response({'loan_id': None, 'customer_id': customer_id, 'loan_approved': False, 'message': 'Customer not found', 'monthly_installment': 0}, status=status.HTTP_404_NOT_FOUND)
+            batch_size = int(request.data.get('batch_size') or DEFAULT_BATCH_SIZE)
+        except (TypeError, ValueError):
+            batch_size = 0
+        if batch_size <= 0:
+            return Response({'error': 'batch_size must be a positive integer'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Reuse eligibility logic
-        credit_score = calculate_credit_score(customer)
-        approval = False
-        corrected_interest_rate = interest_rate
-        message = ''
-
-        if credit_score > 50:
-            approval = True
-            min_rate = 0
-        elif 30 < credit_score <= 50:
-            min_rate = 12
-            if interest_rate > 12:
-                approval = True
-            else:
-                corrected_interest_rate = 12
-        elif 10 < credit_score <= 30:
-            min_rate = 16
-            if interest_rate > 16:
-                approval = True
-            else:
-                corrected_interest_rate = 16
-        else:
-            min_rate = 100
-            approval = False
-            corrected_interest_rate = 16
-            message = 'Credit score too low for loan approval.'
+        job = create_job(kind, upload.name)
+        job_id = job['job_id']
+        file_path = save_upload(job_id, upload)
+        try:
+            INGESTION_TASKS[kind].delay(file_path, method=method, batch_size=batch_size, job_id=job_id)
+        except Exception as exc:
+            logger.exception("Could not queue ingestion job %s.", job_id, extra={'event': 'job_queue_failed', 'job_id': job_id})
+            update_job(job_id, status='failed', error=f'Could not queue the job: {exc}')
+            remove_upload(file_path)
+            return Response({'job_id': job_id, 'error': 'Could not queue the ingestion job'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        logger.info("Queued %s ingestion job %s for %s.", kind, job_id, upload.name, extra={'event': 'job_queued', 'job_id': job_id, 'kind': kind})
+        return Response({
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': reverse('ingestion-job', args=[job_id]),
+        }, status=status.HTTP_202_ACCEPTED)
+
+class IngestionJobView(APIView):
+    """API endpoint to poll an upload ingestion job's progress."""
+    def get(self, request, job_id):
+        job = get_job(job_id)
+        if job is None:
+            return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(job, status=status.HTTP_200_OK)
+
+def metrics(request):
+    """Prometheus scrape endpoint for this process's request metrics."""
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
-        # If sum of all current EMIs > 50% of monthly salary, don’t approve any loans
-        current_loans = customer.loan_set.filter(end_date__gte=datetime.now())
-        sum_of_current_emis = current_loans.aggregate(Sum('monthly_repayment'))['monthly_repayment__sum'] or 0
-        if sum_of_current_emis > 0.5 * customer.monthly_salary:
-            approval = False
-            message = 'Sum of current EMIs exceeds 50% of monthly salary.'
+def create_loan_for_customer(customer_id, loan_amount, interest_rate, tenure):
+    """
+    Score a loan request against the database (never the cache) and create the
+    loan if it is approved. Returns (response_data, status_code); shared by the
+    sync and async create-loan endpoints.
 
-        # If the interest rate does not match as per credit limit, correct it in the response
-        if interest_rate < min_rate:
-            corrected_interest_rate = min_rate
-            message = f'Interest rate too low for credit score. Minimum required: {min_rate}%.'
+    The customer row is locked for the whole check-and-create, so concurrent
+    requests for one customer are serialised and cannot all pass the EMI cap
+    on the same loan history. Requests for different customers do not contend.
+    """
+    with transaction.atomic():
+        try:
+            # The snapshot is read after the lock is granted (not joined here), so it
+            # reflects any loan committed by the request we waited for
+            customer = Customer.objects.select_for_update().get(id=customer_id)
+        except Customer.DoesNotExist:
+            logger.error("Loan creation failed: Customer %s not found.", customer_id, extra={'event': 'customer_not_found', 'customer_id': customer_id})
+            return {'loan_id': None, 'customer_id': customer_id, 'loan_approved': False, 'message': 'Customer not found', 'monthly_installment': 0}, status.HTTP_404_NOT_FOUND
 
-        monthly_installment = calculate_emi(loan_amount, corrected_interest_rate, tenure)
+        # Reuse eligibility logic
+        features, credit_score = evaluate_credit(customer)
+        decision = assess_eligibility(customer, features, credit_score, loan_amount, interest_rate, tenure)
+        approval, corrected_interest_rate, monthly_installment, message = decision
 
         if approval:
             # Create the loan
-            from datetime import date
             start_date = date.today()
             end_date = start_date + timedelta(days=30*tenure)
-            loan = Loan.objects.create(
+            loan = Loan(
                 customer=customer,
                 loan_amount=loan_amount,
                 tenure=tenure,
@@ -180,78 +350,226 @@ class CreateLoanView(APIView):
                 start_date=start_date,
                 end_date=end_date
             )
-            # Update current_debt
-            current_loans = customer.loan_set.filter(end_date__gte=datetime.now())
-            total_debt = current_loans.aggregate(Sum('loan_amount'))['loan_amount__sum'] or 0
-            customer.current_debt = total_debt
-            customer.save()
-            logger.info(f"Loan {loan.id} created for customer {customer.id}.")
-            return Response({
+            # The customer's version is advanced below, with current_debt
+            loan.save(bump_customer=False)
+            record_new_loan(loan)
+            # Serve this customer's next reads from the primary until the replicas catch up
+            pin_customer(customer.id)
+            # The new loan is active: add it to current_debt in SQL rather than writing back the whole row
+            customer.current_debt = F('current_debt') + loan_amount
+            customer.save(update_fields=['current_debt'])
+            logger.info(
+                "Loan %s created for customer %s.", loan.id, customer.id,
+                extra={'event': 'loan_created', 'customer_id': customer.id, 'loan_id': loan.id, 'approval': True, 'credit_score': credit_score},
+            )
+            return {
                 'loan_id': loan.id,
                 'customer_id': customer.id,
                 'loan_approved': True,
                 'message': 'Loan approved and created.',
                 'monthly_installment': monthly_installment
-            }, status=status.HTTP_201_CREATED)
-        else:
-            logger.info(f"Loan not approved for customer {customer.id}: {message or 'Loan not approved.'}")
-            return Response({
-                'loan_id': None,
-                'customer_id': customer.id,
-                'loan_approved': False,
-                'message': message or 'Loan not approved.',
-                'monthly_installment': monthly_installment
-            }, status=status.HTTP_200_OK)
+            }, status.HTTP_201_CREATED
+    logger.info(
+        "Loan not approved for customer %s: %s", customer.id, message or 'Loan not approved.',
+        extra={'event': 'loan_rejected', 'customer_id': customer.id, 'approval': False, 'credit_score': credit_score},
+    )
+    return {
+        'loan_id': None,
+        'customer_id': customer.id,
+        'loan_approved': False,
+        'message': message or 'Loan not approved.',
+        'monthly_installment': monthly_installment
+    }, status.HTTP_200_OK
+
+class CreateLoanView(APIView):
+    """API endpoint to create a new loan for a customer if eligible."""
+    def post(self, request):
+        customer_id = request.data.get('customer_id')
+        loan_amount = float(request.data.get('loan_amount', 0))
+        interest_rate = float(request.data.get('interest_rate', 0))
+        tenure = int(request.data.get('tenure', 0))
+
+        response_data, status_code = create_loan_for_customer(customer_id, loan_amount, interest_rate, tenure)
+        return Response(response_data, status=status_code)
+
+class RecordPaymentView(APIView):
+    """API endpoint to record an EMI payment against a loan."""
+    def post(self, request):
+        try:
+            loan_id = int(request.data.get('loan_id'))
+            amount = float(request.data.get('amount'))
+            payment_date = date.fromisoformat(request.data['payment_date']) if request.data.get('payment_date') else date.today()
+        except (TypeError, ValueError):
+            return Response({'error': 'loan_id, a positive amount and an ISO payment_date are required'}, status=status.HTTP_400_BAD_REQUEST)
+        if amount <= 0:
+            return Response({'error': 'loan_id, a positive amount and an ISO payment_date are required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        payments, loans, stats = record_payments([(loan_id, payment_date, amount)])
+        if stats['missing_loans']:
+            logger.error("Payment failed: Loan %s not found.", loan_id, extra={'event': 'loan_not_found', 'loan_id': loan_id})
+            return Response({'error': 'Loan not found'}, status=status.HTTP_404_NOT_FOUND)
+        if stats['repaid_loans']:
+            return Response({'error': 'Loan is already fully repaid'}, status=status.HTTP_400_BAD_REQUEST)
+
+        payment, loan = payments[0], loans[loan_id]
+        logger.info(
+            "Recorded payment %s on loan %s.", payment.id, loan.id,
+            extra={'event': 'payment_recorded', 'loan_id': loan.id, 'customer_id': loan.customer_id, 'on_time': payment.on_time},
+        )
+        return Response({
+            'payment_id': payment.id,
+            'loan_id': loan.id,
+            'on_time': payment.on_time,
+            'emis_paid_on_time': loan.emis_paid_on_time,
+            'emis_paid_late': loan.emis_paid_late,
+            'repayments_left': loan.tenure - loan.emis_paid_on_time - loan.emis_paid_late,
+        }, status=status.HTTP_201_CREATED)
+
+# Columns view-loan is built from, read with values() so no model instances are created
+LOAN_DETAIL_FIELDS = (
+    'id', 'loan_amount', 'interest_rate', 'monthly_repayment', 'tenure', 'customer_id',
+    'customer__first_name', 'customer__last_name', 'customer__phone_number', 'customer__age',
+) + LOAN_VERSION_FIELDS
+
+def loan_detail(row):
+    """Response body for view-loan, from a LOAN_DETAIL_FIELDS values() row."""
+    customer_data = {
+        'id': row['customer_id'],
+        'first_name': row['customer__first_name'],
+        'last_name': row['customer__last_name'],
+        'phone_number': row['customer__phone_number'],
+        'age': row['customer__age']
+    }
+    return {
+        'loan_id': row['id'],
+        'customer': customer_data,
+        'loan_amount': row['loan_amount'],
+        'interest_rate': row['interest_rate'],
+        'monthly_installment': row['monthly_repayment'],
+        'tenure': row['tenure']
+    }
 
 class ViewLoanView(APIView):
     """API endpoint to view details of a specific loan and its customer."""
     def get(self, request, loan_id):
-        try:
-            loan = Loan.objects.get(id=loan_id)
-        except Loan.DoesNotExist:
-            logger.error(f"View loan failed: Loan {loan_id} not found.")
+        alias = None
+        if is_conditional(request):
+            # Compare versions before loading or serializing anything
+            versions, alias = read_with_fallback(lambda: Loan.objects.filter(id=loan_id).values(*LOAN_VERSION_FIELDS).first())
+            if versions is not None:
+                response = not_modified(request, *loan_validators(loan_id, versions))
+                if response is not None:
+                    return response
+        if alias is None:
+            row, _ = read_with_fallback(lambda: Loan.objects.filter(id=loan_id).values(*LOAN_DETAIL_FIELDS).first())
+        else:
+            row = Loan.objects.using(alias).filter(id=loan_id).values(*LOAN_DETAIL_FIELDS).first()
+        if row is None:
+            logger.error("View loan failed: Loan %s not found.", loan_id, extra={'event': 'loan_not_found', 'loan_id': loan_id})
             return Response({'error': 'Loan not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        customer = loan.customer
-        customer_data = {
-            'id': customer.id,
-            'first_name': customer.first_name,
-            'last_name': customer.last_name,
-            'phone_number': customer.phone_number,
-            'age': customer.age
-        }
+        response_data = loan_detail(row)
+        logger.info("Viewed loan %s for customer %s.", row['id'], row['customer_id'], extra={'event': 'loan_viewed', 'loan_id': row['id'], 'customer_id': row['customer_id'], 'sampled': True})
+        return set_validators(Response(response_data, status=status.HTTP_200_OK), *loan_validators(row['id'], row))
+
+def _encode_cursor(loan_id):
+    return base64.urlsafe_b64encode(str(loan_id).encode()).decode()
+
+
+def _decode_cursor(cursor):
+    """Return the last loan ID encoded in a cursor, or raise ValueError."""
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+
+# Keys of a view-loans item, in the order customer_loans() selects their values
+LOAN_LIST_KEYS = ('loan_id', 'loan_amount', 'interest_rate', 'monthly_installment', 'repayments_left')
+
+def loan_list_item(row):
+    """A view-loans item from a customer_loans() row."""
+    return dict(zip(LOAN_LIST_KEYS, row))
+
+
+DEFAULT_LOAN_PAGE_SIZE = 100
+MAX_LOAN_PAGE_SIZE = 1000
+LOAN_STREAM_CHUNK_SIZE = 2000
+
+
+def parse_loan_page_params(params):
+    """Return (after_loan_id, page_size) from view-loans query params, or raise ValueError."""
+    after = _decode_cursor(params['cursor']) if params.get('cursor') else None
+    page_size = min(int(params.get('page_size', DEFAULT_LOAN_PAGE_SIZE)), MAX_LOAN_PAGE_SIZE)
+    if page_size <= 0:
+        raise ValueError('page_size must be positive')
+    return after, page_size
+
+
+def customer_loans(customer_id, after=None):
+    """
+    A customer's loans in keyset order, as tuples of the LOAN_LIST_KEYS values
+    with repayments_left computed in SQL, so no model instances are created.
+    """
+    loans = Loan.objects.filter(customer_id=customer_id)
+    if after is not None:
+        loans = loans.filter(id__gt=after)
+    return loans.order_by('id').values_list(
+        'id', 'loan_amount', 'interest_rate', 'monthly_repayment',
+        F('tenure') - F('emis_paid_on_time') - F('emis_paid_late'),
+    )
+
+
+def paginate_loan_items(items, page_size):
+    """Split page_size + 1 fetched items into (page, next_cursor)."""
+    next_cursor = _encode_cursor(items[page_size - 1]['loan_id']) if len(items) > page_size else None
+    return items[:page_size], next_cursor
 
-        response_data = {
-            'loan_id': loan.id,
-            'customer': customer_data,
-            'loan_amount': loan.loan_amount,
-            'interest_rate': loan.interest_rate,
-            'monthly_installment': loan.monthly_repayment,
-            'tenure': loan.tenure
-        }
-        logger.info(f"Viewed loan {loan.id} for customer {customer.id}.")
-        return Response(response_data, status=status.HTTP_200_OK)
 
 class ViewLoansView(APIView):
-    """API endpoint to view all loans for a customer."""
+    """
+    API endpoint to view all loans for a customer.
+
+    Without query parameters the response is the full list of loans. With
+    `page_size` and/or `cursor` it is one keyset-paginated page:
+    {"results": [...], "next_cursor": ...}. With `stream=ndjson` every loan
+    after `cursor` is streamed as newline-delimited JSON from a server-side cursor.
+    Responses carry an ETag; a matching If-None-Match gets a 304 without
+    reading any loans.
+    """
     def get(self, request, customer_id):
-        try:
-            customer = Customer.objects.get(id=customer_id)
-        except Customer.DoesNotExist:
-            logger.error(f"View loans failed: Customer {customer_id} not found.")
+        versions, alias = read_with_fallback(
+            lambda: Customer.objects.filter(id=customer_id).values(*CUSTOMER_VERSION_FIELDS).first(), customer_id
+        )
+        if versions is None:
+            logger.error("View loans failed: Customer %s not found.", customer_id, extra={'event': 'customer_not_found', 'customer_id': customer_id})
             return Response({'error': 'Customer not found'}, status=status.HTTP_404_NOT_FOUND)
 
-        loans = Loan.objects.filter(customer=customer)
-        response_data = []
-        for loan in loans:
-            repayments_left = loan.tenure - loan.emis_paid_on_time
-            loan_item = {
-                'loan_id': loan.id,
-                'loan_amount': loan.loan_amount,
-                'interest_rate': loan.interest_rate,
-                'monthly_installment': loan.monthly_repayment,
-                'repayments_left': repayments_left
-            }
-            response_data.append(loan_item)
-        logger.info(f"Viewed {len(response_data)} loans for customer {customer.id}.")
-        return Response(response_data, status=status.HTTP_200_OK)
+        params = request.query_params
+        validators = loans_validators(customer_id, versions, params)
+        response = not_modified(request, *validators)
+        if response is not None:
+            return response
+        try:
+            after, page_size = parse_loan_page_params(params)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        # Bound to the database the customer was found on, as the stream is read after this returns
+        loans = customer_loans(customer_id, after).using(alias)
+
+        if params.get('stream') == 'ndjson':
+            logger.info("Streaming loans for customer %s.", customer_id, extra={'event': 'loans_streamed', 'customer_id': customer_id, 'sampled': True})
+            lines = (
+                dumps(loan_list_item(row)) + b'\n'
+                for row in loans.iterator(chunk_size=LOAN_STREAM_CHUNK_SIZE)
+            )
+            return set_validators(StreamingHttpResponse(lines, content_type='application/x-ndjson'), *validators)
+
+        if 'page_size' in params or 'cursor' in params:
+            page, next_cursor = paginate_loan_items([loan_list_item(row) for row in loans[:page_size + 1]], page_size)
+            logger.info("Viewed %s loans for customer %s.", len(page), customer_id, extra={'event': 'loans_viewed', 'customer_id': customer_id, 'sampled': True})
+            return set_validators(Response({'results': page, 'next_cursor': next_cursor}, status=status.HTTP_200_OK), *validators)
+
+        response_data = [loan_list_item(row) for row in loans]
+        logger.info("Viewed %s loans for customer %s.", len(response_data), customer_id, extra={'event': 'loans_viewed', 'customer_id': customer_id, 'sampled': True})
+        return set_validators(Response(response_data, status=status.HTTP_200_OK), *validators)
@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestIDMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -50,10 +51,19 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.RequestMetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'credit_system.urls'
 
+REST_FRAMEWORK = {
+    # JSON is encoded with orjson (api/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -83,8 +93,114 @@ DATABASES = {
         'USER': os.environ.get('POSTGRES_USER'),
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
         'HOST': os.environ.get('POSTGRES_HOST'),
-        'PORT': '5432',
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        # Keep connections open between requests instead of reconnecting each time.
+        # The ASGI service sets DB_CONN_MAX_AGE=0, since each sync_to_async thread would hold
+        # its own connection, and connects through the pgbouncer service in docker-compose.yml,
+        # whose transaction pooling needs DB_DISABLE_SERVER_SIDE_CURSORS=1.
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DB_DISABLE_SERVER_SIDE_CURSORS') == '1',
+    }
+}
+
+# Read replicas: POSTGRES_REPLICA_HOSTS=host[:port],... adds aliases replica_1, replica_2, ...
+# with the primary's credentials. Read-only endpoints and analytics jobs read from them
+# (see api/db_router.py); a customer whose loans just changed is pinned to the primary
+# for REPLICA_PIN_SECONDS.
+for number, replica in enumerate(filter(None, os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(',')), start=1):
+    host, _, port = replica.strip().partition(':')
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+# Test runs only: TEST_REPLICA_DATABASE=test_replica adds a second connection to the
+# primary (a mirror of the test database) that the replica routing tests use as a
+# stand-in replica; it is not a replica itself. Unset, those tests are skipped.
+TEST_REPLICA_DATABASE = os.environ.get('TEST_REPLICA_DATABASE', '')
+if TEST_REPLICA_DATABASE:
+    DATABASES[TEST_REPLICA_DATABASE] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias not in ('default', TEST_REPLICA_DATABASE)]
+DATABASE_ROUTERS = ['api.db_router.ReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', '10'))
+
+
+# Cache
+# Redis when REDIS_HOST is set (docker-compose), otherwise a per-process memory cache
+
+if os.environ.get('REDIS_HOST'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': f"redis://{os.environ['REDIS_HOST']}:{os.environ.get('REDIS_PORT', '6379')}/1",
+        }
     }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Credit profile cache: in-process LRU tier (size, seconds) in front of CACHES['default']
+CREDIT_CACHE = {
+    'ALIAS': 'default',
+    'LOCAL_MAXSIZE': 10000,
+    'LOCAL_TTL': 5,
+    'TTL': 300,
+}
+
+# Per-endpoint latency and query metrics served at /metrics; Server-Timing
+# headers expose the same timings to clients, so they are off unless asked for
+CREDIT_METRICS = {
+    'ENABLED': True,
+    'SERVER_TIMING': os.environ.get('SERVER_TIMING', '').lower() in ('1', 'true', 'yes'),
+}
+
+# Uploaded ingestion files; must be shared by the web and Celery containers
+INGESTION_UPLOAD_DIR = os.environ.get('INGESTION_UPLOAD_DIR') or os.path.join(BASE_DIR, 'uploads')
+
+# Loan approval slabs and EMI cap; the file is re-read when it changes
+ELIGIBILITY_RULES_FILE = os.environ.get('ELIGIBILITY_RULES_FILE') or os.path.join(BASE_DIR, 'api', 'eligibility_rules.json')
+ELIGIBILITY_RULES_RELOAD_INTERVAL = 5
+
+# api logs are JSON lines written to stdout from a background thread. Info
+# events marked as sampled (per-request views and eligibility checks) are kept
+# at LOG_SAMPLE_RATE; warnings and errors are always kept.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'sampled': {
+            '()': 'api.log.SampledFilter',
+            'rate': float(os.environ.get('LOG_SAMPLE_RATE', 1.0)),
+        },
+        'request_id': {
+            '()': 'api.log.RequestIDFilter',
+        },
+    },
+    'formatters': {
+        'json': {
+            '()': 'api.log.JSONFormatter',
+        },
+    },
+    'handlers': {
+        'api': {
+            'class': 'api.log.QueueStreamHandler',
+            'stream': 'ext://sys.stdout',
+            'formatter': 'json',
+            'filters': ['sampled', 'request_id'],
+        },
+    },
+    'loggers': {
+        'api': {
+            'handlers': ['api'],
+            'level': os.environ.get('LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
 }
 
 
@@ -131,6 +247,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Celery Configuration
 CELERY_BROKER_URL = 'redis://redis:6379/0'
+CELERY_RESULT_BACKEND = 'redis://redis:6379/0'
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'